@@ -1,12 +1,21 @@
 from flask import Flask, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 import os
 from routes import dashboard_bp, devices_bp, auth_bp, assignments_bp, rfid_bp, nurses_bp
 from routes.hospitals import hospitals_bp
 from routes.readers import readers_bp
+from routes.analytics import analytics_bp
 from services.db_service import DBService
+from services.records import Record
+from services.live_events import live_events_available
 from models.user import User
 from datetime import datetime
 
+try:
+    from pycube_mdm.config.app_config import DB_SCHEMA_STARTUP
+except ImportError:
+    from config.app_config import DB_SCHEMA_STARTUP
+
 def create_default_admin(db_service):
     """Create a default admin user if no admin exists"""
     # Check if admin user already exists
@@ -35,9 +44,19 @@ def create_default_admin(db_service):
     except Exception as e:
         print(f"Error creating admin user: {e}")
 
+class JSONProvider(DefaultJSONProvider):
+    """JSON provider that also serializes database Records like dicts"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 def create_app():
     """Create and configure the Flask application"""
     app = Flask(__name__)
+    app.json = JSONProvider(app)
     
     # Configure the app
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-for-flask-session')
@@ -51,19 +70,33 @@ def create_app():
     app.register_blueprint(nurses_bp)
     app.register_blueprint(hospitals_bp)
     app.register_blueprint(readers_bp)
+    app.register_blueprint(analytics_bp)
     
-    # Initialize the database
+    # Initialize the database. In the default "check" mode the tables are only
+    # created or upgraded when schema_version is behind, and no connection pool
+    # is opened, so every worker (or a --preload master) starts quickly
     with app.app_context():
         db_service = DBService()
-        db_service.initialize_db()
+        if DB_SCHEMA_STARTUP == 'full':
+            initialized = db_service.initialize_db()
+        elif DB_SCHEMA_STARTUP == 'check':
+            initialized = db_service.ensure_schema()
+        else:
+            initialized = False
         
-        # Create default admin user if none exists
-        create_default_admin(db_service)
+        # Create default admin user if none exists (only needed on a new or upgraded schema)
+        if initialized or DB_SCHEMA_STARTUP == 'full':
+            create_default_admin(db_service)
     
     # Add template context processor for current datetime
     @app.context_processor
     def inject_now():
         return {'now': datetime.now()}
+    
+    # Pages only open an event stream when this worker can serve one
+    @app.context_processor
+    def inject_live_events():
+        return {'live_events_enabled': live_events_available()}
         
     return app
 
@@ -15,6 +15,9 @@ MISSING_THRESHOLD = timedelta(minutes=2)  # Time after which a temporarily out d
 # MQTT configuration
 MQTT_ENDPOINT = os.environ.get("MQTT_ENDPOINT", "a2zl2pb12jbe1o-ats.iot.us-east-1.amazonaws.com")
 MQTT_TOPIC = os.environ.get("MQTT_TOPIC", "6B6035_tagdata")
+MQTT_HEARTBEAT_TOPIC = os.environ.get("MQTT_HEARTBEAT_TOPIC", "6B6035_mevents")  # Reader management events (heartbeats)
+MQTT_COMMAND_TOPIC = os.environ.get("MQTT_COMMAND_TOPIC", "6CD45A_commands")  # Commands sent to readers
+MQTT_RESPONSE_TOPIC = os.environ.get("MQTT_RESPONSE_TOPIC", "6CD45A_responses")  # Reader replies to commands
 MQTT_PORT = int(os.environ.get("MQTT_PORT", 8883))
 MQTT_KEEP_ALIVE = int(os.environ.get("MQTT_KEEP_ALIVE", 60))
 
@@ -28,6 +31,66 @@ ROOT_CA = os.environ.get("ROOT_CA", os.path.join(CERTS_DIR, "AmazonRootCA1.pem")
 SCHEDULER_CHECK_MISSING_INTERVAL = 2  # minutes
 SCHEDULER_LOG_STATUS_INTERVAL = 30  # seconds
 
+# Database startup configuration
+# check: create/upgrade tables only if schema_version is behind (default)
+# full: run every CREATE TABLE IF NOT EXISTS on each start; skip: no database work at startup
+DB_SCHEMA_STARTUP = os.environ.get("DB_SCHEMA_STARTUP", "check").lower()
+
+# Connection pool configuration (per process)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))  # connections per sync worker or ingest process
+DB_POOL_SIZE_COOPERATIVE = int(os.environ.get("DB_POOL_SIZE_COOPERATIVE", 20))  # connections per gevent worker
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))  # seconds a gevent request waits for a free connection
+
+# Query cache configuration
+QUERY_CACHE_ENABLED = os.environ.get("QUERY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 512))
+QUERY_CACHE_VERSION_TTL = float(os.environ.get("QUERY_CACHE_VERSION_TTL", 2))  # seconds between table version checks
+TABLE_VERSION_BUMP_INTERVAL = float(os.environ.get("TABLE_VERSION_BUMP_INTERVAL", 5))  # seconds between table version bumps for ingest writes
+
+# Export configuration
+EXPORT_FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", 1000))  # rows read per round trip when streaming exports
+EXPORT_NET_WRITE_TIMEOUT = int(os.environ.get("EXPORT_NET_WRITE_TIMEOUT", 600))  # seconds MySQL waits on a slow export client
+
+# Live event (Server-Sent Events) configuration
+LIVE_EVENTS_POLL_INTERVAL = float(os.environ.get("LIVE_EVENTS_POLL_INTERVAL", 1))  # seconds between polls for new alerts
+LIVE_EVENTS_KEEPALIVE = 15  # seconds between keepalive comments on idle streams
+LIVE_EVENTS_QUEUE_SIZE = 1000  # events buffered per browser before it is disconnected
+LIVE_EVENTS_REPLAY_LIMIT = 500  # alerts replayed to a reconnecting browser before asking it to reload
+
+# Reader heartbeat configuration
+HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get("HEARTBEAT_FLUSH_INTERVAL", 5))  # seconds between heartbeat writes
+READER_OFFLINE_THRESHOLD = timedelta(minutes=5)  # Time without a heartbeat after which a reader is considered offline
+READER_UPTIME_RETENTION = timedelta(days=int(os.environ.get("READER_UPTIME_RETENTION_DAYS", 35)))  # How long reader up/down history is kept
+
+# Edge gateway configuration (ingest client keeps device state in local SQLite)
+EDGE_MODE = os.environ.get("EDGE_MODE", "false").lower() == "true"
+EDGE_DB_PATH = os.environ.get("EDGE_DB_PATH", os.path.expanduser("~/pycube_edge.db"))
+EDGE_FORWARD_BATCH_SIZE = int(os.environ.get("EDGE_FORWARD_BATCH_SIZE", 500))  # events sent to MySQL per transaction
+EDGE_FORWARD_INTERVAL = float(os.environ.get("EDGE_FORWARD_INTERVAL", 1))  # seconds between forwarding passes when idle
+EDGE_REGISTRY_REFRESH_INTERVAL = int(os.environ.get("EDGE_REGISTRY_REFRESH_INTERVAL", 300))  # seconds between reader/device reloads
+EDGE_RETRY_MAX_DELAY = 60  # longest wait in seconds between retries while MySQL is unreachable
+
+# Ingest spool configuration (tag reads are written to local disk before the MQTT ack)
+INGEST_SPOOL_ENABLED = os.environ.get("INGEST_SPOOL_ENABLED", "false").lower() == "true"
+INGEST_SPOOL_DIR = os.environ.get("INGEST_SPOOL_DIR", os.path.expanduser("~/pycube_spool"))
+INGEST_SPOOL_SEGMENT_SIZE = 64 * 1024 * 1024  # bytes per spool file before starting a new one
+INGEST_SPOOL_FSYNC_INTERVAL = float(os.environ.get("INGEST_SPOOL_FSYNC_INTERVAL", 0.05))  # seconds between fsyncs; acks wait for the fsync
+INGEST_SPOOL_BATCH_SIZE = int(os.environ.get("INGEST_SPOOL_BATCH_SIZE", 500))  # spooled reads written to MySQL per transaction
+
+# Ingest device state configuration (device status decided in memory, written behind)
+DEVICE_STATE_ENABLED = os.environ.get("DEVICE_STATE_ENABLED", "false").lower() == "true"
+DEVICE_STATE_FLUSH_INTERVAL = float(os.environ.get("DEVICE_STATE_FLUSH_INTERVAL", 1))  # longest seconds a change waits before being written
+DEVICE_STATE_FLUSH_BATCH = int(os.environ.get("DEVICE_STATE_FLUSH_BATCH", 500))  # events written to MySQL per transaction
+DEVICE_STATE_REFRESH_INTERVAL = int(os.environ.get("DEVICE_STATE_REFRESH_INTERVAL", 60))  # seconds between reader/device reloads
+INGEST_SHARD_COUNT = int(os.environ.get("INGEST_SHARD_COUNT", 1))  # ingest processes splitting the device tags
+INGEST_SHARD_INDEX = int(os.environ.get("INGEST_SHARD_INDEX", 0))  # this process's share, 0 to INGEST_SHARD_COUNT - 1
+ALERT_RULES_ENABLED = os.environ.get("ALERT_RULES_ENABLED", "false").lower() == "true"  # evaluate alert_rules on ingested events
+
+# Reader command dispatch configuration
+COMMAND_MAX_IN_FLIGHT = int(os.environ.get("COMMAND_MAX_IN_FLIGHT", 50))  # commands awaiting a reply at once
+COMMAND_TIMEOUT = float(os.environ.get("COMMAND_TIMEOUT", 30))  # seconds to wait for a reader's reply before retrying
+COMMAND_MAX_RETRIES = int(os.environ.get("COMMAND_MAX_RETRIES", 2))  # resends after a timeout before giving up
+
 # Helper Functions
 def get_current_est_time():
     """Get current time in Eastern Time"""
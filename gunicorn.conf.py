@@ -0,0 +1,25 @@
+"""
+Gunicorn settings for the web app: gunicorn app:app
+
+WEB_WORKER_CLASS=sync (default) runs one request at a time per worker.
+WEB_WORKER_CLASS=gevent runs up to WEB_WORKER_CONNECTIONS requests per
+worker, switching between them while they wait on MySQL; DBService then
+uses the pure-Python driver and a pool of DB_POOL_SIZE_COOPERATIVE
+connections per worker.
+
+The MQTT ingest client (test_mqtt_ec2.py) and its scheduler are not
+started by the web app and are never monkey-patched; run them as their
+own process.
+"""
+import os
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('WEB_WORKERS', 4))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 200))
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+
+# gevent patches the standard library when each worker starts. Preloading
+# would import the app (and create its locks and background threads) in
+# the master before that, so only sync workers are preloaded.
+preload_app = worker_class == 'sync'
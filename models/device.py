@@ -4,13 +4,26 @@ import uuid
 class Device:
     """
     Model for mobile devices tracked with RFID
+
+    Devices are loaded for every tag read, so the class uses __slots__ and
+    only generates its id and created_at/updated_at when they are first
+    read. from_row skips the constructor for rows from the database.
     """
+    # Column order for from_row
+    FIELDS = ('id', 'serial_number', 'model', 'manufacturer', 'rfid_tag', 'barcode', 'status',
+              'hospital_id', 'location_id', 'assigned_to', 'purchase_date', 'last_maintenance_date',
+              'eol_date', 'eol_status', 'eol_notes', 'created_at', 'updated_at')
+    
+    __slots__ = ('_id', 'serial_number', 'model', 'manufacturer', 'rfid_tag', 'barcode', 'status',
+                 'hospital_id', 'location_id', 'assigned_to', 'purchase_date', 'last_maintenance_date',
+                 'eol_date', 'eol_status', 'eol_notes', '_created_at', '_updated_at')
+    
     def __init__(self, id=None, serial_number=None, model=None, manufacturer=None, 
                  rfid_tag=None, barcode=None, status="Available", hospital_id=None,
                  location_id=None, assigned_to=None, purchase_date=None, 
                  last_maintenance_date=None, eol_date=None, eol_status="Active", 
                  eol_notes=None, created_at=None, updated_at=None):
-        self.id = id or str(uuid.uuid4())
+        self._id = id or None
         self.serial_number = serial_number
         self.model = model
         self.manufacturer = manufacturer
@@ -25,8 +38,38 @@ class Device:
         self.eol_date = eol_date
         self.eol_status = eol_status  # Active, Warning, Critical, Expired
         self.eol_notes = eol_notes
-        self.created_at = created_at or datetime.now()
-        self.updated_at = updated_at or datetime.now()
+        self._created_at = created_at or None
+        self._updated_at = updated_at or None
+    
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = str(uuid.uuid4())
+        return self._id
+    
+    @id.setter
+    def id(self, value):
+        self._id = value
+    
+    @property
+    def created_at(self):
+        if self._created_at is None:
+            self._created_at = datetime.now()
+        return self._created_at
+    
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = value
+    
+    @property
+    def updated_at(self):
+        if self._updated_at is None:
+            self._updated_at = datetime.now()
+        return self._updated_at
+    
+    @updated_at.setter
+    def updated_at(self, value):
+        self._updated_at = value
     
     @property
     def epc_code(self):
@@ -38,6 +81,16 @@ class Device:
         """Set the EPC Code (sets rfid_tag)"""
         self.rfid_tag = value
     
+    @classmethod
+    def from_row(cls, row):
+        """Create a device from a tuple in FIELDS order, e.g. a database row"""
+        device = cls.__new__(cls)
+        (device._id, device.serial_number, device.model, device.manufacturer, device.rfid_tag,
+         device.barcode, device.status, device.hospital_id, device.location_id, device.assigned_to,
+         device.purchase_date, device.last_maintenance_date, device.eol_date, device.eol_status,
+         device.eol_notes, device._created_at, device._updated_at) = row
+        return device
+    
     @classmethod
     def from_dict(cls, data):
         """Create a device instance from a dictionary"""
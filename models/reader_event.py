@@ -2,30 +2,60 @@ import uuid
 from datetime import datetime
 
 class ReaderEvent:
-    """Model for RFID reader events"""
-    
+    """
+    Model for RFID reader events
+
+    One is built per tag read, so the class uses __slots__ and only
+    generates its id when it is first read. from_row skips the constructor
+    for rows from the database.
+    """
+    # Column order for from_row
+    FIELDS = ('id', 'device_id', 'rfid_tag', 'reader_id', 'location_id', 'timestamp', 'created_at')
+
+    __slots__ = ('_id', 'device_id', 'rfid_tag', 'reader_id', 'location_id', 'timestamp', 'created_at')
+
     def __init__(self, device_id=None, rfid_tag=None, reader_id=None, location_id=None, timestamp=None):
-        self.id = str(uuid.uuid4())
+        # The read happened when the event was built, not when it is saved
+        now = datetime.now()
+        self._id = None
         self.device_id = device_id
         self.rfid_tag = rfid_tag
         self.reader_id = reader_id
         self.location_id = location_id
-        self.timestamp = timestamp or datetime.now()
-        self.created_at = datetime.now()
-    
+        self.timestamp = timestamp or now
+        self.created_at = now
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = str(uuid.uuid4())
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    @classmethod
+    def from_row(cls, row):
+        """Create a ReaderEvent from a tuple in FIELDS order, e.g. a database row"""
+        event = cls.__new__(cls)
+        (event._id, event.device_id, event.rfid_tag, event.reader_id, event.location_id,
+         event.timestamp, event.created_at) = row
+        return event
+
     @classmethod
     def from_dict(cls, data):
         """Create a ReaderEvent instance from a dictionary"""
         instance = cls()
-        instance.id = data.get('id', str(uuid.uuid4()))
+        instance._id = data.get('id')
         instance.device_id = data.get('device_id')
         instance.rfid_tag = data.get('rfid_tag')
         instance.reader_id = data.get('reader_id')
         instance.location_id = data.get('location_id')
         instance.timestamp = data.get('timestamp')
-        instance.created_at = data.get('created_at', datetime.now())
+        instance.created_at = data.get('created_at', instance.created_at)
         return instance
-    
+
     def to_dict(self):
         """Convert ReaderEvent instance to dictionary"""
         return {
@@ -37,7 +67,7 @@ class ReaderEvent:
             'timestamp': self.timestamp,
             'created_at': self.created_at
         }
-    
+
     def __str__(self):
         """String representation of ReaderEvent"""
-        return f"ReaderEvent(id={self.id}, device_id={self.device_id}, reader_id={self.reader_id}, location_id={self.location_id}, timestamp={self.timestamp})" 
\ No newline at end of file
+        return f"ReaderEvent(id={self.id}, device_id={self.device_id}, reader_id={self.reader_id}, location_id={self.location_id}, timestamp={self.timestamp})"
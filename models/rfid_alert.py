@@ -8,35 +8,98 @@ TIMEZONE = pytz.timezone('America/New_York')
 class RFIDAlert:
     """
     Model for tracking RFID alerts when devices are detected at unauthorized locations
+
+    Alerts are created for every status change on the ingest path, so the
+    class uses __slots__ and only generates its id and created_at/updated_at
+    when they are first read.
     """
+    # Column order for from_row
+    FIELDS = ('id', 'device_id', 'reader_id', 'hospital_id', 'location_id', 'timestamp',
+              'created_at', 'updated_at', 'reader_code', 'antenna_number', 'rfid_tag',
+              'status', 'previous_status')
+
+    __slots__ = ('_id', 'device_id', 'reader_id', 'hospital_id', 'location_id', 'timestamp',
+                 '_created_at', '_updated_at', 'reader_code', 'antenna_number', 'rfid_tag',
+                 'status', 'previous_status')
+
     def __init__(self, id=None, device_id=None, reader_id=None, hospital_id=None,
                  location_id=None, timestamp=None, created_at=None, updated_at=None,
                  reader_code=None, antenna_number=None, rfid_tag=None, status=None,
                  previous_status=None):
-        self.id = id or str(uuid.uuid4())
+        self._id = id
         self.device_id = device_id
         self.reader_id = reader_id
         self.hospital_id = hospital_id
         self.location_id = location_id  # Reference to locations table
-        
-        # Use timezone-aware timestamps with EST
-        now = datetime.now(TIMEZONE)
-        
-        # Set timestamp with timezone info
+
+        # Set timestamp with timezone info (EST)
         if timestamp:
             self.timestamp = timestamp if timestamp.tzinfo else TIMEZONE.localize(timestamp)
         else:
-            self.timestamp = now
-            
-        self.created_at = created_at if created_at and created_at.tzinfo else now
-        self.updated_at = updated_at if updated_at and updated_at.tzinfo else now
-        
+            self.timestamp = datetime.now(TIMEZONE)
+
+        # Naive values are replaced with the current time, as before
+        self._created_at = created_at if created_at and created_at.tzinfo else None
+        self._updated_at = updated_at if updated_at and updated_at.tzinfo else None
+
         self.reader_code = reader_code
         self.antenna_number = antenna_number
         self.rfid_tag = rfid_tag
         self.status = status
         self.previous_status = previous_status
-    
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = str(uuid.uuid4())
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    @property
+    def created_at(self):
+        if self._created_at is None:
+            self._stamp()
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = value
+
+    @property
+    def updated_at(self):
+        if self._updated_at is None:
+            self._stamp()
+        return self._updated_at
+
+    @updated_at.setter
+    def updated_at(self, value):
+        self._updated_at = value
+
+    def _stamp(self):
+        """Fill in the missing creation/update times with one timezone-aware now"""
+        now = datetime.now(TIMEZONE)
+        if self._created_at is None:
+            self._created_at = now
+        if self._updated_at is None:
+            self._updated_at = now
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Create an RFID alert from a tuple in FIELDS order, e.g. a database row.
+
+        Values are taken as they are (no timezone handling), so this is
+        much cheaper than the constructor.
+        """
+        alert = cls.__new__(cls)
+        (alert._id, alert.device_id, alert.reader_id, alert.hospital_id, alert.location_id,
+         alert.timestamp, alert._created_at, alert._updated_at, alert.reader_code,
+         alert.antenna_number, alert.rfid_tag, alert.status, alert.previous_status) = row
+        return alert
+
     @classmethod
     def from_dict(cls, data):
         """Create an RFID alert instance from a dictionary"""
@@ -55,7 +118,7 @@ class RFIDAlert:
             status=data.get('status'),
             previous_status=data.get('previous_status')
         )
-    
+
     def to_dict(self):
         """Convert RFID alert instance to dictionary"""
         return {
@@ -73,6 +136,6 @@ class RFIDAlert:
             'status': self.status,
             'previous_status': self.previous_status
         }
-    
+
     def __str__(self):
-        return f"RFIDAlert(id={self.id}, device_id={self.device_id}, location_id={self.location_id})" 
\ No newline at end of file
+        return f"RFIDAlert(id={self.id}, device_id={self.device_id}, location_id={self.location_id})"
@@ -0,0 +1,114 @@
+from flask import Blueprint, request, jsonify, render_template, flash
+from datetime import timedelta
+from services.db_service import DBService
+from services.dwell_analytics import dwell_reports, parse_range
+from services.utilization import utilization_report
+from routes.auth import login_required
+from routes.conditional import conditional_get
+
+analytics_bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+# Devices listed on the report page (the JSON API returns all by default)
+PAGE_DEVICE_LIMIT = 100
+
+@analytics_bp.route('/dwell')
+@login_required
+@conditional_get('reader_events', 'rfid_alerts', 'devices', 'locations', time_bucket=300)
+def dwell():
+    """Dwell time per location and time out of the facility per device"""
+    db_service = DBService()
+    hospitals = db_service.get_all_hospitals(sort_by='name')
+    hospital_id = request.args.get('hospital_id') or (hospitals[0]['id'] if hospitals else None)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    report = None
+    building = False
+    try:
+        start, end = parse_range(start_date, end_date)
+        if hospital_id:
+            report = dwell_reports.get(hospital_id, start, end, device_limit=PAGE_DEVICE_LIMIT)
+            building = report is None
+    except ValueError as e:
+        flash(f'Invalid date range: {e}', 'error')
+        start, end = parse_range()
+    
+    # 202 while the report is built, so the page isn't given an ETag
+    return render_template(
+        'analytics/dwell.html',
+        report=report,
+        building=building,
+        hospitals=hospitals,
+        hospital_id=hospital_id,
+        start_date=start.strftime('%Y-%m-%d'),
+        end_date=(end - timedelta(days=1)).strftime('%Y-%m-%d'),
+        device_limit=PAGE_DEVICE_LIMIT
+    ), 202 if building else 200
+
+@analytics_bp.route('/api/dwell')
+@login_required
+@conditional_get('reader_events', 'rfid_alerts', 'devices', 'locations', time_bucket=300)
+def api_dwell():
+    """API endpoint for the dwell report of a hospital over a date range; 202 while it is built"""
+    hospital_id = request.args.get('hospital_id')
+    if not hospital_id:
+        return jsonify({'error': 'hospital_id is required'}), 400
+    
+    try:
+        start, end = parse_range(request.args.get('start_date'), request.args.get('end_date'))
+        limit = request.args.get('limit', type=int)
+        report = dwell_reports.get(hospital_id, start, end, device_limit=limit)
+        if report is None:
+            return jsonify({'status': 'building', 'message': 'The report is being built, try again shortly'}), 202
+        return jsonify(report)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/utilization')
+@login_required
+@conditional_get('device_assignments', 'devices', 'nurses', time_bucket=300)
+def utilization():
+    """Assigned and idle time per device, model and department"""
+    db_service = DBService()
+    hospitals = db_service.get_all_hospitals(sort_by='name')
+    hospital_id = request.args.get('hospital_id') or (hospitals[0]['id'] if hospitals else None)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    report = None
+    try:
+        start, end = parse_range(start_date, end_date)
+        if hospital_id:
+            report = utilization_report(hospital_id, start, end, db_service)
+    except ValueError as e:
+        flash(f'Invalid date range: {e}', 'error')
+        start, end = parse_range()
+    
+    return render_template(
+        'analytics/utilization.html',
+        report=report,
+        hospitals=hospitals,
+        hospital_id=hospital_id,
+        start_date=start.strftime('%Y-%m-%d'),
+        end_date=(end - timedelta(days=1)).strftime('%Y-%m-%d')
+    )
+
+@analytics_bp.route('/api/utilization')
+@login_required
+@conditional_get('device_assignments', 'devices', 'nurses', time_bucket=300)
+def api_utilization():
+    """API endpoint for the utilization report of a hospital over a date range"""
+    hospital_id = request.args.get('hospital_id')
+    if not hospital_id:
+        return jsonify({'error': 'hospital_id is required'}), 400
+    
+    try:
+        start, end = parse_range(request.args.get('start_date'), request.args.get('end_date'))
+        refresh = request.args.get('refresh') == '1'
+        return jsonify(utilization_report(hospital_id, start, end, refresh=refresh))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -8,6 +8,9 @@ from datetime import datetime
 
 assignments_bp = Blueprint('assignments', __name__, url_prefix='/assignments')
 
+# Largest batch accepted by the bulk assignment API
+BULK_MAX_ITEMS = 500
+
 @assignments_bp.route('/assign', methods=['GET'])
 @login_required
 def assign():
@@ -449,4 +452,43 @@ def api_transfer_device():
         })
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500 
+
+@assignments_bp.route('/api/bulk', methods=['POST'])
+@login_required
+def api_bulk_assign():
+    """API endpoint to assign/transfer or return a batch of devices in one transaction"""
+    try:
+        data = request.get_json(silent=True) or {}
+        action = data.get('action', 'assign')
+        items = data.get('items')
+        
+        if action not in ('assign', 'return'):
+            return jsonify({'error': "action must be 'assign' or 'return'"}), 400
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list of {device_barcode, nurse_badge_id}'}), 400
+        
+        if len(items) > BULK_MAX_ITEMS:
+            return jsonify({'error': f'A batch can contain at most {BULK_MAX_ITEMS} items'}), 400
+        
+        if not all(isinstance(item, dict) for item in items):
+            return jsonify({'error': 'Each item must be an object'}), 400
+        
+        db_service = DBService()
+        results = db_service.bulk_assign_devices(
+            items,
+            action=action,
+            all_or_nothing=bool(data.get('all_or_nothing', False))
+        )
+        
+        applied = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': applied == len(results),
+            'applied': applied,
+            'failed': len(results) - applied,
+            'results': results
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -370,6 +370,7 @@ def delete_user(user_id):
         cursor = connection.cursor()
         try:
             cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            db_service.bump_table_versions(cursor, 'users')
             connection.commit()
             flash('User deleted successfully', 'success')
         finally:
@@ -0,0 +1,83 @@
+from flask import request, make_response, current_app
+from functools import wraps
+from datetime import datetime, timezone
+import hashlib
+import time
+from services.db_service import DBService
+
+def conditional_get(*tables, time_bucket=None):
+    """
+    Decorator to answer polling clients with 304 Not Modified when the data
+    behind an endpoint hasn't changed.
+
+    The ETag is derived from the change versions of the given tables (bumped
+    by DBService on every write), so an unchanged poll costs one lookup in
+    table_versions instead of running the endpoint's queries. Endpoints that
+    report rolling time windows (e.g. "alerts in the last 24 hours") should
+    pass time_bucket, in seconds, so their ETag also rolls over with time.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+
+            try:
+                versions = DBService().get_table_change_info(tables)
+            except Exception as e:
+                # Fall back to an unconditional response
+                print(f"Error reading table versions for conditional GET: {e}")
+                return f(*args, **kwargs)
+
+            etag, last_modified = _build_validators(versions, time_bucket)
+
+            # If-None-Match takes precedence over If-Modified-Since (RFC 7232)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (
+                    last_modified is not None and
+                    request.if_modified_since is not None and
+                    last_modified <= request.if_modified_since
+                )
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Clients may keep the response but must revalidate before reuse
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+def _build_validators(versions, time_bucket):
+    """Build the ETag and Last-Modified values for a set of table versions"""
+    parts = [request.path, request.query_string.decode('utf-8', 'replace')]
+    modified_times = []
+
+    for table in sorted(versions):
+        version, modified_at = versions[table]
+        parts.append(f"{table}:{version}")
+        if modified_at is not None:
+            modified_times.append(modified_at)
+
+    if time_bucket:
+        bucket_start = int(time.time() // time_bucket) * time_bucket
+        parts.append(f"t:{bucket_start}")
+        modified_times.append(bucket_start)
+
+    etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    # HTTP dates have one-second resolution
+    last_modified = None
+    if modified_times:
+        last_modified = datetime.fromtimestamp(int(max(modified_times)), tz=timezone.utc)
+
+    return etag, last_modified
@@ -1,6 +1,10 @@
-from flask import Blueprint, render_template, jsonify
+import os
+import json
+from flask import Blueprint, render_template, jsonify, request, Response, stream_with_context
 from services.db_service import DBService
-from routes.auth import login_required
+from services.live_events import broadcaster, live_events_available
+from routes.auth import login_required, role_required
+from routes.conditional import conditional_get
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/')
 
@@ -16,9 +20,84 @@ def index():
 
 @dashboard_bp.route('/api/stats')
 @login_required
+@conditional_get('devices', 'reader_events', 'rfid_alerts', 'device_assignments', time_bucket=60)
 def get_stats():
     """API endpoint to get dashboard statistics"""
     db_service = DBService()
     stats = db_service.get_statistics()
     
-    return jsonify(stats) 
\ No newline at end of file
+    return jsonify(stats)
+
+@dashboard_bp.route('/api/events')
+@login_required
+def live_events():
+    """Server-Sent Events stream of new alerts, device status changes and stats deltas"""
+    if not live_events_available():
+        # 204 tells EventSource not to reconnect; the pages fall back to reloading
+        return '', 204
+    
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or -1)
+    except ValueError:
+        last_seq = -1
+    
+    subscription = broadcaster.subscribe()
+    try:
+        if last_seq < 0:
+            last_seq = DBService().get_latest_alert_seq()
+        missed_events, complete = broadcaster.replay(last_seq)
+    except Exception as e:
+        broadcaster.unsubscribe(subscription)
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        try:
+            yield f"retry: 3000\nid: {last_seq}\nevent: ready\ndata: {{}}\n\n"
+            
+            if not complete:
+                # Too much was missed to replay; the page should reload instead
+                yield "event: resync\ndata: {}\n\n"
+                return
+            
+            replayed_seq = last_seq
+            for seq, event_type, data, event_id in missed_events:
+                yield _format_event(event_id, event_type, data)
+                replayed_seq = max(replayed_seq, seq)
+            
+            while not subscription.closed:
+                event = subscription.get(timeout=broadcaster.keepalive)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                
+                seq, event_type, data, event_id = event
+                if seq <= replayed_seq:
+                    continue  # Already sent while replaying
+                yield _format_event(event_id, event_type, data)
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def _format_event(event_id, event_type, data):
+    """Format a single Server-Sent Event; without an id the browser keeps its last one"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+@dashboard_bp.route('/api/cache-stats')
+@login_required
+@role_required(['admin'])
+def get_cache_stats():
+    """API endpoint to get query cache hit/miss statistics for this worker"""
+    db_service = DBService()
+    stats = db_service.get_cache_stats()
+    stats['pid'] = os.getpid()
+    
+    return jsonify(stats)
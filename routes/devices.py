@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, request, jsonify, redirect, url_fo
 from services.db_service import DBService
 from models.device import Device
 from routes.auth import login_required, role_required, api_auth_required
+from routes.conditional import conditional_get
+from routes.exports import get_export_format, export_response
 from datetime import datetime
 import uuid
 import re
@@ -323,6 +325,7 @@ def lookup_by_barcode(barcode):
         }), 500
 
 @devices_bp.route('/api/list')
+@conditional_get('devices')
 def api_list_devices():
     """API endpoint to get all devices"""
     try:
@@ -350,6 +353,24 @@ def api_list_devices():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@devices_bp.route('/api/export')
+@login_required
+def api_export_devices():
+    """API endpoint to stream every device as NDJSON or CSV"""
+    export_format = get_export_format()
+    if not export_format:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    try:
+        db_service = DBService()
+        devices = db_service.iter_devices(
+            status=request.args.get('status'),
+            search_query=request.args.get('search')
+        )
+        return export_response(devices, export_format, 'devices')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @devices_bp.route('/api/<device_id>/assign', methods=['POST'])
 def api_assign_device(device_id):
     """API endpoint to assign a device"""
@@ -762,13 +783,11 @@ def api_search_devices():
             
         db_service = DBService()
         
-        # Get devices with search parameters
-        devices = db_service.get_all_devices(
-            limit=limit, 
-            offset=0,
-            status=status,
-            search_query=search_term
-        )
+        # Get devices with search parameters, best matches first
+        if search_term:
+            devices = db_service.search_devices(search_term, status=status, limit=limit)
+        else:
+            devices = db_service.get_all_devices(limit=limit, offset=0, status=status)
         
         # Format device data for API response
         device_list = []
@@ -0,0 +1,107 @@
+from flask import Response, request, stream_with_context
+from datetime import datetime, date
+from decimal import Decimal
+import csv
+import io
+import json
+from services.records import Record
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# Rows serialized per chunk written to the client
+EXPORT_CHUNK_ROWS = 500
+
+def get_export_format():
+    """Get the requested export format, or None if it isn't supported"""
+    export_format = request.args.get('format', 'ndjson').lower()
+    return export_format if export_format in EXPORT_FORMATS else None
+
+def export_response(rows, export_format, name):
+    """
+    Stream an iterator of dict rows (or Records) to the client as NDJSON or CSV.
+
+    The first row is read before the response starts so that connection and
+    query errors can still be reported as a normal error response.
+    """
+    rows = iter(rows)
+    first_row = next(rows, None)
+
+    if export_format == 'csv':
+        body = _iter_csv(first_row, rows)
+    else:
+        body = _iter_ndjson(first_row, rows)
+
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(body),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            # Stop reverse proxies from buffering the whole export
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def _iter_ndjson(first_row, rows):
+    """Yield rows as newline-delimited JSON, a chunk at a time"""
+    if first_row is None:
+        return
+
+    chunk = [json.dumps(first_row, default=_json_default)]
+    for row in rows:
+        chunk.append(json.dumps(row, default=_json_default))
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+def _iter_csv(first_row, rows):
+    """Yield rows as CSV with a header taken from the first row"""
+    if first_row is None:
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = list(first_row.keys())
+    writer.writerow(columns)
+    writer.writerow([_csv_value(first_row[column]) for column in columns])
+
+    count = 1
+    for row in rows:
+        writer.writerow([_csv_value(row[column]) for column in columns])
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _json_default(value):
+    """Serialize values the json module doesn't handle natively"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _csv_value(value):
+    """Format a column value for CSV output"""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    return value
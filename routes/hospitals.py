@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, render_template, flash, redirect,
 from services.db_service import DBService
 from models.hospital import Hospital
 from routes.auth import login_required, role_required
+from routes.conditional import conditional_get
 from datetime import datetime
 
 hospitals_bp = Blueprint('hospitals', __name__, url_prefix='/hospitals')
@@ -146,6 +147,7 @@ def api_readers(hospital_id):
 
 @hospitals_bp.route('/api/<hospital_id>/stats')
 @login_required
+@conditional_get('devices', 'nurses', 'readers', 'rfid_alerts', time_bucket=60)
 def api_stats(hospital_id):
     """API endpoint to get hospital statistics"""
     try:
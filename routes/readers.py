@@ -1,11 +1,22 @@
-from flask import Blueprint, request, jsonify, render_template, flash, redirect, url_for
+from flask import Blueprint, request, jsonify, render_template, flash, redirect, url_for, session
 from services.db_service import DBService
+from services.heartbeat_buffer import heartbeats
+from services.command_correlator import correlator
 from models.reader import Reader
 from routes.auth import login_required, role_required
+from routes.conditional import conditional_get
 from datetime import datetime
+import json
 
 readers_bp = Blueprint('readers', __name__, url_prefix='/readers')
 
+# Longest a command may wait for the reader's reply (seconds)
+MAX_COMMAND_WAIT = 120
+
+# Seconds a request waits for the reply before returning 202 for the page to
+# poll; well below the gunicorn worker timeout, so no worker is held for long
+COMMAND_REPLY_WAIT = 5
+
 @readers_bp.route('/')
 @login_required
 @role_required(['admin'])
@@ -32,6 +43,8 @@ def index():
         sort_by=sort_by,
         sort_dir=sort_dir
     )
+    _apply_heartbeat_state(readers)
+    _apply_uptime(readers, db_service.get_reader_uptime([reader['id'] for reader in readers]))
     
     return render_template(
         'readers/index.html', 
@@ -42,6 +55,27 @@ def index():
         sort_dir=sort_dir
     )
 
+@readers_bp.route('/uptime')
+@login_required
+@role_required(['admin'])
+def uptime():
+    """Fleet uptime, with the flakiest readers first"""
+    db_service = DBService()
+    readers = db_service.get_all_readers()
+    _apply_heartbeat_state(readers)
+    _apply_uptime(readers, db_service.get_reader_uptime())
+    
+    flaky_readers = _rank_flaky_readers(readers)
+    fleet_uptime = _average_uptime(readers)
+    
+    return render_template(
+        'readers/uptime.html',
+        readers=flaky_readers,
+        fleet_uptime=fleet_uptime,
+        total_readers=len(readers),
+        online_readers=sum(1 for reader in readers if reader['online'])
+    )
+
 @readers_bp.route('/create', methods=['GET', 'POST'])
 @role_required(['admin'])
 def create():
@@ -198,12 +232,50 @@ def events(reader_id):
 # API Endpoints
 @readers_bp.route('/api/list')
 @login_required
+@conditional_get('readers', 'reader_heartbeats', 'hospitals', 'locations', time_bucket=60)
 def api_list():
     """API endpoint to get all readers"""
     try:
         db_service = DBService()
         readers = db_service.get_all_readers()
-        return jsonify([reader.to_dict() for reader in readers])
+        _apply_heartbeat_state(readers)
+        _apply_uptime(readers, db_service.get_reader_uptime())
+        return jsonify(readers)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@readers_bp.route('/api/uptime')
+@login_required
+@conditional_get('readers', 'reader_heartbeats', time_bucket=60)
+def api_uptime():
+    """API endpoint to get fleet uptime and the flakiest readers"""
+    try:
+        limit = int(request.args.get('limit', 10))
+        db_service = DBService()
+        readers = db_service.get_all_readers()
+        _apply_heartbeat_state(readers)
+        _apply_uptime(readers, db_service.get_reader_uptime())
+        
+        return jsonify({
+            'fleet_uptime': _average_uptime(readers),
+            'total_readers': len(readers),
+            'online_readers': sum(1 for reader in readers if reader['online']),
+            'flaky_readers': [
+                {
+                    'id': reader['id'],
+                    'reader_code': reader['reader_code'],
+                    'antenna_number': reader['antenna_number'],
+                    'name': reader['name'],
+                    'location_name': reader['location_name'],
+                    'online': reader['online'],
+                    'outages_7d': reader['outages_7d'],
+                    'uptime_24h': reader['uptime_24h'],
+                    'uptime_7d': reader['uptime_7d'],
+                    'uptime_30d': reader['uptime_30d']
+                }
+                for reader in _rank_flaky_readers(readers)[:limit]
+            ]
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -251,15 +323,129 @@ def api_events(reader_id):
 
 @readers_bp.route('/api/<reader_id>/heartbeat', methods=['POST'])
 def api_heartbeat(reader_id):
-    """API endpoint for reader heartbeat"""
+    """API endpoint for reader heartbeat (buffered, written in batches)"""
     try:
-        db_service = DBService()
-        reader = db_service.get_reader(reader_id)
-        if not reader:
+        if not heartbeats.record(reader_id):
             return jsonify({'error': 'Reader not found'}), 404
-            
-        reader.last_heartbeat = datetime.utcnow()
-        db_service.update_reader(reader)
         return jsonify({'status': 'success'})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@readers_bp.route('/api/heartbeats/stats')
+@login_required
+@role_required(['admin'])
+def api_heartbeat_stats():
+    """API endpoint to get heartbeat buffer statistics for this worker"""
+    return jsonify(heartbeats.get_stats())
+
+@readers_bp.route('/api/<reader_id>/command', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def api_command(reader_id):
+    """
+    API endpoint to send a command to a reader.
+
+    Returns the reply if it arrives within COMMAND_REPLY_WAIT seconds,
+    otherwise 202 with the command and a status_url to poll.
+    """
+    try:
+        reader = DBService().get_reader(reader_id)
+        if not reader:
+            return jsonify({'error': 'Reader not found'}), 404
+        
+        data = request.get_json(silent=True) or {}
+        command_type = data.get('type')
+        if not command_type:
+            return jsonify({'error': 'Command type is required'}), 400
+        
+        pending = correlator.send(
+            reader['reader_code'],
+            command_type,
+            parameters=data.get('parameters'),
+            created_by=session.get('user_id'),
+            timeout=min(float(data['timeout']), MAX_COMMAND_WAIT) if data.get('timeout') else None
+        )
+        if pending.wait(COMMAND_REPLY_WAIT):
+            return jsonify(pending.to_dict()), 200 if pending.status != 'Timed Out' else 504
+        
+        # Save the command now, so a poll handled by another worker finds it
+        if not correlator.flush():
+            return jsonify({'error': 'The command was sent but could not be saved; check the reader later'}), 503
+        return jsonify(dict(
+            pending.to_dict(),
+            status_url=url_for('readers.api_command_status', command_id=pending.id)
+        )), 202
+    except ConnectionError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@readers_bp.route('/api/commands/<command_id>')
+@login_required
+@role_required(['admin'])
+def api_command_status(command_id):
+    """API endpoint to poll a command sent with api_command; 202 while it awaits its reply"""
+    try:
+        pending = correlator.get(command_id)
+        if pending:
+            command = pending.to_dict()
+        else:
+            # Sent by another worker, or already answered and saved
+            rows = DBService().get_reader_commands(command_id)
+            if not rows:
+                return jsonify({'error': 'Command not found'}), 404
+            row = rows[0]
+            command = {
+                'id': row['id'],
+                'reader_code': row['reader_code'],
+                'command_type': row['command_type'],
+                'status': row['status'],
+                'latency_ms': row['latency_ms'],
+                'response': json.loads(row['response']) if row['response'] else None,
+                'error': row['error']
+            }
+        
+        if command['status'] in ('Pending', 'Sent'):
+            return jsonify(command), 202
+        return jsonify(command), 200 if command['status'] != 'Timed Out' else 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@readers_bp.route('/api/commands/stats')
+@login_required
+@role_required(['admin'])
+def api_command_stats():
+    """API endpoint to get command reply latency for this worker"""
+    return jsonify(correlator.get_stats())
+
+def _apply_heartbeat_state(readers):
+    """Overlay the in-memory heartbeat state on reader rows"""
+    heartbeats.apply_state(readers)
+
+def _apply_uptime(readers, uptime):
+    """Add 24h/7d/30d uptime and outage counts to reader rows"""
+    for reader in readers:
+        values = uptime.get(reader['id'], {})
+        reader['outages_7d'] = values.get('outages_7d', 0)
+        for window in ('24h', '7d', '30d'):
+            reader[f'uptime_{window}'] = values.get(f'uptime_{window}')
+
+def _rank_flaky_readers(readers):
+    """Readers with outages in the last 7 days, most outages and lowest uptime first"""
+    flaky = [reader for reader in readers if reader['outages_7d'] > 0]
+    flaky.sort(key=lambda reader: (
+        -reader['outages_7d'],
+        reader['uptime_7d'] if reader['uptime_7d'] is not None else 100
+    ))
+    return flaky
+
+def _average_uptime(readers):
+    """Average 24h/7d/30d uptime of the active readers"""
+    averages = {}
+    for window in ('24h', '7d', '30d'):
+        values = [
+            reader[f'uptime_{window}'] for reader in readers
+            if reader['status'] == 'Active' and reader[f'uptime_{window}'] is not None
+        ]
+        averages[window] = round(sum(values) / len(values), 1) if values else None
+    return averages
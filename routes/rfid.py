@@ -1,9 +1,11 @@
-from flask import Blueprint, request, jsonify, render_template, flash, redirect, url_for
+from flask import Blueprint, request, jsonify, render_template, flash, redirect, url_for, session
 from services.db_service import DBService
 from models.rfid_alert import RFIDAlert
 from models.device import Device
 from datetime import datetime
-from routes.auth import login_required
+from routes.auth import login_required, role_required
+from routes.exports import get_export_format, export_response
+from services.alert_rules import normalize_rule, rule_to_dict
 import math
 
 rfid_bp = Blueprint('rfid', __name__, url_prefix='/rfid')
@@ -85,12 +87,54 @@ def get_alerts():
         
         return jsonify({
             'success': True,
-            'alerts': [alert.to_dict() for alert in alerts]
+            'alerts': alerts
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@rfid_bp.route('/api/alerts/export', methods=['GET'])
+@login_required
+def export_alerts():
+    """Stream RFID alerts as NDJSON or CSV, using the same filters as the alerts page"""
+    export_format = get_export_format()
+    if not export_format:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    try:
+        db_service = DBService()
+        alerts = db_service.iter_rfid_alerts(
+            sort_by=request.args.get('sort_by'),
+            sort_dir=request.args.get('sort_dir', 'asc'),
+            device_id=request.args.get('device_id'),
+            status=request.args.get('status'),
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date')
+        )
+        return export_response(alerts, export_format, 'rfid_alerts')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rfid_bp.route('/api/movements/export', methods=['GET'])
+@login_required
+def export_movements():
+    """Stream raw reader events (device movements) as NDJSON or CSV"""
+    export_format = get_export_format()
+    if not export_format:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    try:
+        db_service = DBService()
+        events = db_service.iter_reader_events(
+            device_id=request.args.get('device_id'),
+            reader_code=request.args.get('reader_code'),
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date')
+        )
+        return export_response(events, export_format, 'reader_events')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @rfid_bp.route('/alert', methods=['POST'])
 def handle_rfid_alert():
     """Handle RFID reader alerts"""
@@ -161,4 +205,76 @@ def show_alert(alert_id):
         flash('Alert not found', 'error')
         return redirect(url_for('rfid.alerts'))
     
-    return render_template('rfid/show_alert.html', alert=alert) 
\ No newline at end of file
+    return render_template('rfid/show_alert.html', alert=alert) 
+
+@rfid_bp.route('/api/rules', methods=['GET'])
+@login_required
+def get_rules():
+    """Get the alert rules evaluated by the ingest client"""
+    try:
+        rules = DBService().get_alert_rules(hospital_id=request.args.get('hospital_id'))
+        return jsonify({'success': True, 'rules': [rule_to_dict(rule) for rule in rules]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rfid_bp.route('/api/rules', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def create_rule():
+    """Create an alert rule; the ingest client picks it up on its next reload"""
+    try:
+        rule = normalize_rule(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        db_service = DBService()
+        rule_id = db_service.create_alert_rule(rule, created_by=session.get('user_id'))
+        return jsonify({'success': True, 'rule': rule_to_dict(db_service.get_alert_rule(rule_id))}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rfid_bp.route('/api/rules/<rule_id>', methods=['PUT'])
+@login_required
+@role_required(['admin'])
+def update_rule(rule_id):
+    """Replace an alert rule's conditions"""
+    try:
+        rule = normalize_rule(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        db_service = DBService()
+        if not db_service.update_alert_rule(rule_id, rule):
+            return jsonify({'error': 'Rule not found'}), 404
+        return jsonify({'success': True, 'rule': rule_to_dict(db_service.get_alert_rule(rule_id))})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rfid_bp.route('/api/rules/<rule_id>', methods=['DELETE'])
+@login_required
+@role_required(['admin'])
+def delete_rule(rule_id):
+    """Delete an alert rule and its triggered alerts"""
+    try:
+        if not DBService().delete_alert_rule(rule_id):
+            return jsonify({'error': 'Rule not found'}), 404
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rfid_bp.route('/api/rules/alerts', methods=['GET'])
+@login_required
+def get_rule_alerts():
+    """Get the most recent alerts triggered by alert rules"""
+    try:
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        alerts = DBService().get_rule_alerts(
+            rule_id=request.args.get('rule_id'),
+            hospital_id=request.args.get('hospital_id'),
+            limit=limit
+        )
+        return jsonify({'success': True, 'alerts': alerts})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
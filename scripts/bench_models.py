@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the model classes on the ingest path.
+
+Measures the time to build one RFIDAlert, ReaderEvent and Device (through
+the constructor and through from_row) and the memory each instance holds,
+next to a __dict__-based copy of how the models were built before they
+used __slots__ (eager uuid4 and datetime.now() on every construction).
+
+Examples:
+    python scripts/bench_models.py
+    python scripts/bench_models.py --count 200000
+"""
+import os
+import sys
+import gc
+import time
+import uuid
+import argparse
+import tracemalloc
+from datetime import datetime
+
+# Add pycube_mdm directory to path for relative imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.device import Device
+from models.reader_event import ReaderEvent
+from models.rfid_alert import RFIDAlert, TIMEZONE
+
+
+class DictModel:
+    """The previous model layout: per-instance __dict__, id and timestamps made up front"""
+
+    def __init__(self, fields, **values):
+        now = datetime.now(TIMEZONE)
+        self.__dict__.update(dict.fromkeys(fields), **values)
+        self.id = values.get('id') or str(uuid.uuid4())
+        self.created_at = values.get('created_at') or now
+        self.updated_at = values.get('updated_at') or now
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure model construction cost and memory")
+    parser.add_argument('--count', type=int, default=100000, help="objects built per measurement (default: 100000)")
+    parser.add_argument('--repeat', type=int, default=5, help="timing runs, the best is reported (default: 5)")
+    return parser.parse_args()
+
+
+def time_per_object(build, count, repeat):
+    """Best time over repeat runs to build count objects, in microseconds per object"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(count):
+            build()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / count * 1e6
+
+
+def bytes_per_object(build, count):
+    """Memory held per live object, measured with tracemalloc"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [build() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    # The list holding the objects is not part of their cost
+    size -= sys.getsizeof(objects)
+    del objects
+    return size / count
+
+
+def cases():
+    """(name, build) pairs; rows are shared so only object construction is measured"""
+    now = datetime.now(TIMEZONE)
+    alert_values = {
+        'device_id': str(uuid.uuid4()), 'reader_id': str(uuid.uuid4()), 'location_id': str(uuid.uuid4()),
+        'timestamp': now, 'reader_code': 'BAYCARE-R01', 'antenna_number': 2,
+        'rfid_tag': '200000001192024000015107', 'status': 'Temporarily Out', 'previous_status': 'In-Facility'
+    }
+    alert_row = tuple([str(uuid.uuid4())] + [alert_values.get(field, now) for field in RFIDAlert.FIELDS[1:]])
+
+    event_values = {
+        'device_id': str(uuid.uuid4()), 'rfid_tag': '200000001192024000015107',
+        'reader_id': str(uuid.uuid4()), 'location_id': str(uuid.uuid4()), 'timestamp': now
+    }
+    event_row = (str(uuid.uuid4()),) + tuple(event_values[field] for field in ReaderEvent.FIELDS[1:6]) + (now,)
+
+    device_values = {
+        'serial_number': 'SN-000001', 'model': 'Zebra TC52', 'manufacturer': 'Zebra',
+        'rfid_tag': '200000001192024000015107', 'status': 'In-Facility', 'hospital_id': str(uuid.uuid4()),
+        'location_id': str(uuid.uuid4())
+    }
+    device_row = tuple([str(uuid.uuid4())] + [device_values.get(field) for field in Device.FIELDS[1:15]] + [now, now])
+
+    return [
+        ('RFIDAlert (before)', lambda: DictModel(RFIDAlert.FIELDS, **alert_values)),
+        ('RFIDAlert()', lambda: RFIDAlert(**alert_values)),
+        ('RFIDAlert.from_row', lambda: RFIDAlert.from_row(alert_row)),
+        ('ReaderEvent (before)', lambda: DictModel(ReaderEvent.FIELDS, **event_values)),
+        ('ReaderEvent()', lambda: ReaderEvent(**event_values)),
+        ('ReaderEvent.from_row', lambda: ReaderEvent.from_row(event_row)),
+        ('Device (before)', lambda: DictModel(Device.FIELDS, **device_values)),
+        ('Device()', lambda: Device(**device_values)),
+        ('Device.from_row', lambda: Device.from_row(device_row)),
+    ]
+
+
+def main():
+    args = parse_args()
+    print(f"Building {args.count} objects per measurement (best of {args.repeat})\n")
+    print(f"{'Model':<24}{'us/object':>12}{'bytes/object':>15}")
+    for name, build in cases():
+        micros = time_per_object(build, args.count, args.repeat)
+        size = bytes_per_object(build, args.count)
+        print(f"{name:<24}{micros:>12.2f}{size:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
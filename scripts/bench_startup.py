@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Measure web app startup time for each DB_SCHEMA_STARTUP mode.
+
+Each run imports app.py (which calls create_app()) in a fresh Python
+process, as a gunicorn worker does, and reports how long that took. The
+database from .env / RDS_* is used; run the app once first so the schema
+exists and "check" mode finds it current.
+
+Examples:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 20 --modes check,full
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child process; prints the seconds spent importing the app
+CHILD = """
+import time
+started = time.perf_counter()
+import app
+print(time.perf_counter() - started)
+"""
+
+MODES = ('check', 'full', 'skip')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure app startup time per DB_SCHEMA_STARTUP mode")
+    parser.add_argument('--runs', type=int, default=10, help="app starts per mode (default: 10)")
+    parser.add_argument('--modes', default=','.join(MODES), help=f"comma-separated modes (default: {','.join(MODES)})")
+    args = parser.parse_args()
+
+    args.modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+    return args
+
+
+def start_once(mode):
+    """Start the app in a new process and return the import time in seconds"""
+    env = dict(os.environ, DB_SCHEMA_STARTUP=mode)
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"App failed to start in {mode} mode:\n{result.stderr}")
+    # The app prints while starting; the timing is the last line
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    print(f"Starting the app {args.runs} times per mode\n")
+    print(f"{'Mode':<8}{'median':>10}{'min':>10}{'max':>10}")
+
+    for mode in args.modes:
+        start_once(mode)  # warm up the OS file cache and bring the schema up to date
+        timings = [start_once(mode) for _ in range(args.runs)]
+        print(f"{mode:<8}{statistics.median(timings) * 1000:>8.0f}ms"
+              f"{min(timings) * 1000:>8.0f}ms{max(timings) * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite for ingest and the main read queries.
+
+Runs against a local MySQL database that is seeded with synthetic data at
+one or more scales (number of movement events):
+
+- ingest: MQTTClient.on_message for known tags, up to the MySQL commit.
+  The spool is turned off for it (with the spool on, on_message returns
+  once the read is appended to a local file); with DEVICE_STATE_ENABLED the
+  queued event is written before the next message. The result's mode says
+  which path was measured ('direct' or 'device_state')
+- missing_sweep: MQTTClient.check_for_missing_devices over a batch of
+  temporarily-out devices
+- alerts_page: the RFID alerts page queries (page of alerts + count)
+- device_show: the device page queries (device, movements, assignments)
+- dashboard_stats: DBService.get_statistics
+
+Throughput and p50/p95/p99 latency are written to a JSON file. With
+--baseline the results are compared to an earlier run and the script exits
+with status 1 if anything regressed past --tolerance.
+
+Everything runs locally; no MQTT broker or cloud endpoint is used. The
+benchmark database is separate from the application database and is wiped
+whenever it is reseeded.
+
+Examples:
+    python scripts/benchmark.py --scales 10k --save-baseline benchmark_baseline.json
+    python scripts/benchmark.py --scales 10k --baseline benchmark_baseline.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timedelta
+
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000
+}
+
+# Rows per multi-row INSERT while seeding
+SEED_BATCH_SIZE = 5000
+
+# Devices marked temporarily out before each missing sweep
+SWEEP_DEVICES = 100
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ingest and the main read queries")
+    parser.add_argument('--database', default='pycube_mdm_bench',
+                        help="benchmark database; it is wiped when seeded, so it must contain 'bench'")
+    parser.add_argument('--scales', default='10k,100k,1m',
+                        help=f"comma separated event counts to seed ({', '.join(SCALES)})")
+    parser.add_argument('--reseed', action='store_true', help="reseed even if the database is already at the scale")
+    parser.add_argument('--iterations', type=int, default=200, help="iterations per read benchmark")
+    parser.add_argument('--ingest-messages', type=int, default=1000, help="messages for the ingest benchmark")
+    parser.add_argument('--sweeps', type=int, default=5, help="missing sweeps to run")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results")
+    parser.add_argument('--baseline', help="compare against an earlier results file")
+    parser.add_argument('--save-baseline', help="also write the results to this baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative slowdown before a result counts as a regression")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="ignore p95 slowdowns smaller than this many milliseconds")
+    parser.add_argument('--seed', type=int, default=42, help="random seed for the data and workload")
+    return parser.parse_args()
+
+
+args = parse_args()
+if 'bench' not in args.database:
+    sys.exit(f"Refusing to use database '{args.database}': the benchmark database name must contain 'bench'")
+
+# DBService reads the database name when its pool is created
+os.environ['RDS_DB'] = args.database
+
+# Add pycube_mdm directory to path for relative imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paho.mqtt.client as mqtt
+from services.db_service import DBService
+from scripts.setup_db import create_database
+
+try:
+    from pycube_mdm.config.app_config import MQTT_TOPIC, get_current_est_time
+except ImportError:
+    from config.app_config import MQTT_TOPIC, get_current_est_time
+
+
+class Seeder:
+    """Fills the benchmark database with a hospital's worth of synthetic data"""
+
+    def __init__(self, db_service):
+        self.db_service = db_service
+
+    def seeded_scale(self):
+        """Get the scale the database was last seeded at, or None"""
+        connection = self.db_service.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS benchmark_meta (
+                    name VARCHAR(50) PRIMARY KEY,
+                    value VARCHAR(100)
+                )
+            """)
+            cursor.execute("SELECT value FROM benchmark_meta WHERE name = 'scale'")
+            row = cursor.fetchone()
+            connection.commit()
+            return int(row[0]) if row else None
+        finally:
+            cursor.close()
+            connection.close()
+
+    def seed(self, events):
+        """Wipe the benchmark tables and seed them for the given number of events"""
+        device_count = max(1000, events // 100)
+        reader_codes = [f"BENCH-R{i:03d}" for i in range(1, 26)]
+        now = datetime.now()
+
+        connection = self.db_service.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in ('rfid_alerts', 'reader_events', 'reader_uptime_intervals', 'device_assignments',
+                          'device_state', 'devices', 'readers', 'nurses', 'locations', 'hospitals', 'table_versions'):
+                cursor.execute(f"TRUNCATE TABLE {table}")
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+            hospital_id = str(uuid.uuid4())
+            cursor.execute("""
+                INSERT INTO hospitals (id, name, code, status)
+                VALUES (%s, 'Benchmark Hospital', 'BENCH', 'Active')
+            """, (hospital_id,))
+
+            location_ids = [str(uuid.uuid4()) for _ in range(20)]
+            cursor.executemany("""
+                INSERT INTO locations (id, name, type, hospital_id)
+                VALUES (%s, %s, 'Department', %s)
+            """, [(location_id, f"Department {i + 1}", hospital_id) for i, location_id in enumerate(location_ids)])
+
+            readers = []
+            for i, reader_code in enumerate(reader_codes):
+                for antenna in range(1, 5):
+                    readers.append((str(uuid.uuid4()), reader_code, antenna, f"{reader_code} - Antenna {antenna}",
+                                    hospital_id, location_ids[i % len(location_ids)]))
+            cursor.executemany("""
+                INSERT INTO readers (id, reader_code, antenna_number, name, hospital_id, location_id, status)
+                VALUES (%s, %s, %s, %s, %s, %s, 'Active')
+            """, readers)
+
+            devices = []
+            for i in range(device_count):
+                devices.append((str(uuid.uuid4()), f"SN-BENCH-{i:08d}", 'Infusion Pump', 'Benchmark Medical',
+                                f"BENCH{i:019d}", f"BC-BENCH-{i:08d}", hospital_id,
+                                random.choice(location_ids)))
+            self._insert_batches(cursor, connection, """
+                INSERT INTO devices (id, serial_number, model, manufacturer, rfid_tag, barcode, hospital_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, [device[:7] for device in devices])
+            self._insert_batches(cursor, connection, """
+                INSERT INTO device_state (device_id, status, location_id, updated_at)
+                VALUES (%s, 'In-Facility', %s, %s)
+            """, [(device[0], device[7], now) for device in devices])
+
+            statuses = ['Temporarily Out', 'In-Facility']
+            reader_events = []
+            alerts = []
+            for i in range(events):
+                device = devices[random.randrange(device_count)]
+                reader = random.choice(readers)
+                timestamp = now - timedelta(seconds=random.randrange(30 * 24 * 3600))
+                status = statuses[i % 2]
+                reader_events.append((str(uuid.uuid4()), device[0], device[4], reader[1], reader[2],
+                                      hospital_id, reader[5], timestamp))
+                alerts.append((str(uuid.uuid4()), device[0], reader[0], hospital_id, reader[5],
+                               status, statuses[(i + 1) % 2], timestamp))
+
+                if len(alerts) >= SEED_BATCH_SIZE:
+                    self._flush_events(cursor, connection, reader_events, alerts)
+                    reader_events, alerts = [], []
+            if alerts:
+                self._flush_events(cursor, connection, reader_events, alerts)
+
+            cursor.execute("""
+                INSERT INTO benchmark_meta (name, value) VALUES ('scale', %s)
+                ON DUPLICATE KEY UPDATE value = VALUES(value)
+            """, (str(events),))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _flush_events(self, cursor, connection, reader_events, alerts):
+        """Insert a batch of movement events and their alerts"""
+        cursor.executemany("""
+            INSERT INTO reader_events (id, device_id, rfid_tag, reader_code, antenna_number,
+                                       hospital_id, location_id, timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, reader_events)
+        cursor.executemany("""
+            INSERT INTO rfid_alerts (id, device_id, reader_id, hospital_id, location_id,
+                                     status, previous_status, timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, alerts)
+        connection.commit()
+
+    def _insert_batches(self, cursor, connection, query, rows):
+        """Insert rows with multi-row INSERTs of SEED_BATCH_SIZE rows"""
+        for start in range(0, len(rows), SEED_BATCH_SIZE):
+            cursor.executemany(query, rows[start:start + SEED_BATCH_SIZE])
+            connection.commit()
+
+
+class BenchmarkRunner:
+    """Runs each benchmark against the seeded database"""
+
+    def __init__(self, db_service, options):
+        self.db_service = db_service
+        self.options = options
+        self.device_ids, self.tags = self._load_devices()
+        self.reader_antennas = self._load_readers()
+        self._ingest_client = None
+
+    def run_all(self):
+        """Run every benchmark and return {name: summary}"""
+        results = {}
+        for name, benchmark in [
+            ('ingest', self.bench_ingest),
+            ('missing_sweep', self.bench_missing_sweep),
+            ('alerts_page', self.bench_alerts_page),
+            ('device_show', self.bench_device_show),
+            ('dashboard_stats', self.bench_dashboard_stats)
+        ]:
+            print(f"  {name}...", end=' ', flush=True)
+            results[name] = benchmark()
+            mode = f" ({results[name]['mode']})" if 'mode' in results[name] else ''
+            print(f"{results[name]['throughput']:.1f} ops/s, p95 {results[name]['p95_ms']:.2f}ms{mode}")
+        return results
+
+    def bench_ingest(self):
+        client = self._get_ingest_client()
+        messages = []
+        for i in range(self.options.ingest_messages):
+            reader_code, antenna = random.choice(self.reader_antennas)
+            message = mqtt.MQTTMessage(topic=MQTT_TOPIC.encode())
+            message.payload = json.dumps({
+                'data': {'idHex': random.choice(self.tags), 'antenna': antenna, 'hostName': reader_code}
+            }).encode()
+            messages.append(message)
+
+        def ingest(message):
+            client.on_message(client, None, message)
+            if client.device_states:
+                # Include writing the event, which is otherwise left to a background thread
+                client.device_states.flush()
+
+        result = measure(ingest, messages)
+        result['mode'] = 'device_state' if client.device_states else 'direct'
+        return result
+
+    def bench_missing_sweep(self):
+        client = self._get_ingest_client()
+
+        def prepare():
+            # Temporarily out for longer than MISSING_THRESHOLD
+            stale = get_current_est_time().replace(tzinfo=None) - timedelta(hours=1)
+            device_ids = random.sample(self.device_ids, min(SWEEP_DEVICES, len(self.device_ids)))
+            connection = self.db_service.get_connection()
+            cursor = connection.cursor()
+            try:
+                placeholders = ', '.join(['%s'] * len(device_ids))
+                cursor.execute(f"""
+                    UPDATE device_state SET status = 'Temporarily Out', updated_at = %s
+                    WHERE device_id IN ({placeholders})
+                """, (stale, *device_ids))
+                connection.commit()
+            finally:
+                cursor.close()
+                connection.close()
+            if client.device_states:
+                # The sweep runs on the ingest client's in-memory state
+                client.device_states.refresh(force=True)
+
+        return measure(lambda _: client.check_for_missing_devices(), range(self.options.sweeps),
+                       warmup=0, before_each=prepare)
+
+    def bench_alerts_page(self):
+        def alerts_page(page):
+            self.db_service.get_rfid_alerts(limit=10, offset=page * 10, sort_by='timestamp', sort_dir='desc')
+            self.db_service.get_rfid_alerts_count()
+
+        return measure(alerts_page, [random.randrange(100) for _ in range(self.options.iterations)])
+
+    def bench_device_show(self):
+        def device_show(device_id):
+            self.db_service.get_device(device_id)
+            self.db_service.get_device_movement_history(device_id)
+            self.db_service.get_device_assignments(device_id)
+
+        return measure(device_show, [random.choice(self.device_ids) for _ in range(self.options.iterations)])
+
+    def bench_dashboard_stats(self):
+        return measure(lambda _: self.db_service.get_statistics(), range(self.options.iterations))
+
+    def _get_ingest_client(self):
+        """Create the ingest client without its scheduler or per-message logging"""
+        if self._ingest_client is None:
+            import test_mqtt_ec2
+            from test_mqtt_ec2 import MQTTClient
+
+            # Measure ingest into MySQL, not appends to the local spool
+            test_mqtt_ec2.INGEST_SPOOL_ENABLED = False
+            self._ingest_client = MQTTClient(
+                protocol=mqtt.MQTTv5,
+                callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                client_id=f"benchmark-{os.getpid()}"
+            )
+            self._ingest_client.shutdown_scheduler()
+            if self._ingest_client.device_states:
+                # bench_ingest writes the events itself
+                self._ingest_client.device_states.stop()
+            logging.getLogger('test_mqtt_ec2').setLevel(logging.WARNING)
+        return self._ingest_client
+
+    def _load_devices(self):
+        connection = self.db_service.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT id, rfid_tag FROM devices")
+            rows = cursor.fetchall()
+            return [row[0] for row in rows], [row[1] for row in rows]
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _load_readers(self):
+        connection = self.db_service.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT reader_code, antenna_number FROM readers")
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+
+
+def measure(operation, inputs, warmup=5, before_each=None):
+    """Time operation(input) for every input and summarize the latencies"""
+    inputs = list(inputs)
+    for value in inputs[:warmup]:
+        if before_each:
+            before_each()
+        operation(value)
+
+    latencies = []
+    for value in inputs:
+        if before_each:
+            before_each()
+        started = time.perf_counter()
+        operation(value)
+        latencies.append(time.perf_counter() - started)
+
+    total = sum(latencies)
+    return {
+        'operations': len(latencies),
+        'throughput': len(latencies) / total if total else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000
+    }
+
+
+def percentile(values, fraction):
+    """Get a percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """List the benchmarks that regressed compared to the baseline"""
+    regressions = []
+    for scale, benchmarks in results['results'].items():
+        for name, current in benchmarks.items():
+            previous = baseline.get('results', {}).get(scale, {}).get(name)
+            if not previous:
+                continue
+            if current.get('mode') != previous.get('mode'):
+                # e.g. ingest measured with and without device state
+                print(f"Not comparing {scale} {name}: measured as {current.get('mode')}, "
+                      f"baseline as {previous.get('mode')}")
+                continue
+
+            slower = current['p95_ms'] - previous['p95_ms']
+            if slower > min_delta_ms and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{scale} {name}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+            if current['throughput'] < previous['throughput'] * (1 - tolerance):
+                regressions.append(f"{scale} {name}: throughput {previous['throughput']:.1f} -> "
+                                   f"{current['throughput']:.1f} ops/s")
+    return regressions
+
+
+def environment_info(db_service):
+    """Describe where the results came from"""
+    connection = db_service.get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT VERSION()")
+        mysql_version = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        connection.close()
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'mysql': mysql_version,
+        'host': platform.node()
+    }
+
+
+def main():
+    random.seed(args.seed)
+
+    scales = [scale.strip().lower() for scale in args.scales.split(',') if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        sys.exit(f"Unknown scale(s): {', '.join(unknown)}")
+
+    if not create_database():
+        sys.exit(1)
+    db_service = DBService()
+    db_service.initialize_db()
+    # Measure the queries themselves, not the result cache
+    DBService.query_cache.enabled = False
+
+    results = {'environment': environment_info(db_service), 'results': {}}
+    seeder = Seeder(db_service)
+
+    for scale in sorted(scales, key=SCALES.get):
+        events = SCALES[scale]
+        if args.reseed or seeder.seeded_scale() != events:
+            print(f"Seeding {events} events...")
+            started = time.monotonic()
+            seeder.seed(events)
+            print(f"  seeded in {time.monotonic() - started:.1f}s")
+
+        print(f"Running benchmarks at {scale}")
+        results['results'][scale] = BenchmarkRunner(db_service, args).run_all()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"Regressions past {args.tolerance:.0%} tolerance:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
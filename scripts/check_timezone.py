@@ -55,7 +55,12 @@ def check_database_timezone():
                 print(f"\nTime difference between Python UTC and Database UTC: {time_diff_seconds:.2f} seconds")
                 
                 # Check a device updated_at timestamp
-                cursor.execute("SELECT id, serial_number, status, updated_at FROM devices LIMIT 1")
+                cursor.execute("""
+                    SELECT d.id, d.serial_number, ds.status, ds.updated_at
+                    FROM devices d
+                    JOIN device_state ds ON ds.device_id = d.id
+                    LIMIT 1
+                """)
                 device = cursor.fetchone()
                 if device:
                     device_id, serial, status, updated_at = device
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Send a command to a fleet of readers.
+
+Readers are selected from the readers table by hospital, location, reader
+code or a reader code pattern. The command is published to every matching
+reader with a bounded number awaiting a reply at once; readers that do not
+reply in time are retried. Each command is tracked in reader_commands.
+Progress and the final completion rate and reply latency are printed.
+
+Examples:
+    python scripts/dispatch_commands.py --type GET_DIAGNOSTICS --hospital <hospital id> --dry-run
+    python scripts/dispatch_commands.py --type UPDATE_CONFIG --match 'BAYCARE-R*' \\
+        --params '{"scan_interval": 30, "power_level": 25}' --max-in-flight 100
+    python scripts/dispatch_commands.py --batch <batch id>
+"""
+import os
+import sys
+import ssl
+import json
+import time
+import uuid
+import argparse
+import threading
+
+# Add pycube_mdm directory to path for relative imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paho.mqtt.client as mqtt
+from services.db_service import DBService
+from services.command_dispatch import CommandDispatcher, summarize
+
+try:
+    from pycube_mdm.config.app_config import (
+        MQTT_ENDPOINT, MQTT_PORT, MQTT_KEEP_ALIVE, MQTT_COMMAND_TOPIC, MQTT_RESPONSE_TOPIC,
+        PRIVATE_KEY, CERTIFICATE, ROOT_CA,
+        COMMAND_MAX_IN_FLIGHT, COMMAND_TIMEOUT, COMMAND_MAX_RETRIES
+    )
+except ImportError:
+    from config.app_config import (
+        MQTT_ENDPOINT, MQTT_PORT, MQTT_KEEP_ALIVE, MQTT_COMMAND_TOPIC, MQTT_RESPONSE_TOPIC,
+        PRIVATE_KEY, CERTIFICATE, ROOT_CA,
+        COMMAND_MAX_IN_FLIGHT, COMMAND_TIMEOUT, COMMAND_MAX_RETRIES
+    )
+
+# Seconds to wait for the broker connection and response subscription
+CONNECT_TIMEOUT = 30
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Send a command to a fleet of readers")
+    parser.add_argument('--type', help="command type, e.g. GET_DIAGNOSTICS or UPDATE_CONFIG")
+    parser.add_argument('--params', help="command parameters as a JSON object")
+    parser.add_argument('--hospital', help="only readers in this hospital (id)")
+    parser.add_argument('--location', help="only readers at this location (id)")
+    parser.add_argument('--reader', action='append', help="reader code (can be repeated)")
+    parser.add_argument('--match', help="reader code pattern, * matches anything")
+    parser.add_argument('--include-inactive', action='store_true', help="also send to readers that are not Active")
+    parser.add_argument('--max-in-flight', type=int, default=COMMAND_MAX_IN_FLIGHT,
+                        help=f"commands awaiting a reply at once (default: {COMMAND_MAX_IN_FLIGHT})")
+    parser.add_argument('--timeout', type=float, default=COMMAND_TIMEOUT,
+                        help=f"seconds to wait for each reply (default: {COMMAND_TIMEOUT})")
+    parser.add_argument('--retries', type=int, default=COMMAND_MAX_RETRIES,
+                        help=f"resends after a timeout (default: {COMMAND_MAX_RETRIES})")
+    parser.add_argument('--dry-run', action='store_true', help="list the target readers without sending")
+    parser.add_argument('--batch', help="print the results of an earlier dispatch and exit")
+    args = parser.parse_args()
+
+    if not args.batch and not args.type:
+        parser.error("--type is required")
+    if args.params:
+        try:
+            args.params = json.loads(args.params)
+        except ValueError as e:
+            parser.error(f"--params is not valid JSON: {e}")
+    if not args.batch and not any([args.hospital, args.location, args.reader, args.match]):
+        parser.error("select readers with --hospital, --location, --reader or --match")
+    return args
+
+
+def connect():
+    """Connect to the broker and subscribe to command responses"""
+    client = mqtt.Client(
+        protocol=mqtt.MQTTv5,
+        callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+        client_id="command-dispatch-" + str(uuid.uuid4())[-8:]
+    )
+    client.tls_set(
+        ca_certs=ROOT_CA,
+        certfile=CERTIFICATE,
+        keyfile=PRIVATE_KEY,
+        cert_reqs=ssl.CERT_REQUIRED,
+        tls_version=ssl.PROTOCOL_TLSv1_2
+    )
+
+    subscribed = threading.Event()
+
+    def on_connect(client, userdata, flags, reason_code, properties):
+        if reason_code == 0:
+            client.subscribe(MQTT_RESPONSE_TOPIC, qos=1)
+        else:
+            print(f"Connection refused: {reason_code}")
+
+    client.on_connect = on_connect
+    client.on_subscribe = lambda *args: subscribed.set()
+    client.connect(MQTT_ENDPOINT, MQTT_PORT, MQTT_KEEP_ALIVE)
+    client.loop_start()
+    if not subscribed.wait(CONNECT_TIMEOUT):
+        client.loop_stop()
+        raise RuntimeError(f"Could not subscribe to {MQTT_RESPONSE_TOPIC} on {MQTT_ENDPOINT}")
+    return client
+
+
+def print_summary(summary):
+    def ms(value):
+        return f"{value}ms" if value is not None else "-"
+
+    print(f"  Readers:     {summary['total']}")
+    print(f"  Succeeded:   {summary['succeeded']}")
+    print(f"  Failed:      {summary['failed']}")
+    print(f"  Timed out:   {summary['timed_out']}")
+    print(f"  Completion:  {summary['completion_rate']}% ({summary['success_rate']}% succeeded)")
+    print(f"  Latency:     p50 {ms(summary['p50_ms'])}, p95 {ms(summary['p95_ms'])}, "
+          f"p99 {ms(summary['p99_ms'])}, max {ms(summary['max_ms'])}")
+
+
+def print_problems(commands):
+    problems = [command for command in commands if command['status'] in ('Failed', 'Timed Out')]
+    if problems:
+        print("\nReaders that did not succeed:")
+        for command in problems:
+            print(f"  {command['reader_code']}: {command['status']} - {command.get('error') or 'no details'}")
+
+
+def main():
+    args = parse_args()
+    db_service = DBService()
+
+    if args.batch:
+        commands = db_service.get_reader_commands(args.batch)
+        if not commands:
+            print(f"No commands found for batch {args.batch}")
+            sys.exit(1)
+        print(f"Batch {args.batch}: {commands[0]['command_type']}")
+        print_summary(summarize(commands))
+        print_problems(commands)
+        return
+
+    targets = db_service.get_command_targets(
+        hospital_id=args.hospital,
+        location_id=args.location,
+        reader_codes=args.reader,
+        match=args.match,
+        include_inactive=args.include_inactive
+    )
+    if not targets:
+        print("No readers match the selection")
+        sys.exit(1)
+
+    print(f"{len(targets)} readers selected")
+    if args.dry_run:
+        for target in targets:
+            print(f"  {target['reader_code']} ({target['hospital_name']}, {target['antennas']} antennas)")
+        return
+
+    client = connect()
+    dispatcher = CommandDispatcher(
+        client, db_service,
+        topic=MQTT_COMMAND_TOPIC,
+        max_in_flight=args.max_in_flight,
+        timeout=args.timeout,
+        max_retries=args.retries
+    )
+    client.on_message = lambda client, userdata, msg: dispatcher.handle_response(msg.payload)
+
+    last_report = [0.0]
+
+    def progress(summary):
+        if time.monotonic() - last_report[0] >= 5:
+            last_report[0] = time.monotonic()
+            done = summary['total'] - summary['outstanding']
+            print(f"  {done}/{summary['total']} done, {summary['succeeded']} succeeded, "
+                  f"{summary['failed']} failed, {summary['timed_out']} timed out")
+
+    try:
+        started = time.monotonic()
+        batch_id, commands = dispatcher.dispatch(
+            args.type, [target['reader_code'] for target in targets], args.params, progress=progress
+        )
+    finally:
+        client.disconnect()
+        client.loop_stop()
+
+    print(f"\nBatch {batch_id} finished in {time.monotonic() - started:.1f}s")
+    print_summary(summarize(commands))
+    print_problems(commands)
+    if any(command['status'] != 'Succeeded' for command in commands):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
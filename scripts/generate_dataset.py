@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Bulk synthetic dataset generator for scale and performance testing.
+
+Generates hospitals, locations, readers, devices, nurses, device assignments
+and months of reader_events / rfid_alerts, one worker process per hospital.
+Rows are written to tab-separated temp files and loaded with
+LOAD DATA LOCAL INFILE (or, with --method insert, multi-row INSERTs), with
+unique and foreign key checks switched off for the loading session. Nothing
+goes through DBService row by row, so tens of millions of events load in
+minutes rather than hours.
+
+The data is shaped like a real deployment:
+- a few devices move a lot and most move rarely (Pareto distributed)
+- movements cluster in day and evening shifts
+- each device alternates Temporarily Out / In-Facility, and some trips end
+  in a Missing alert, so a device's status always matches its last alert
+- a share of devices have an active assignment to a nurse
+
+Example:
+    python scripts/generate_dataset.py --hospitals 10 --events 50000000 --months 6 --truncate
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+
+import mysql.connector
+from dotenv import load_dotenv
+
+# Add pycube_mdm directory to path for relative imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from pycube_mdm.config.app_config import MISSING_THRESHOLD, get_current_est_time
+except ImportError:
+    from config.app_config import MISSING_THRESHOLD, get_current_est_time
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Rows per multi-row INSERT (--method insert)
+INSERT_BATCH_SIZE = 5000
+
+# Event rows written to a temp file before it is loaded, to bound disk use
+EVENT_CHUNK_ROWS = 1_000_000
+
+# Relative likelihood of a movement in each hour of the day
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 10, 10, 9, 8, 8, 9, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+
+# Share of trips out that end with the device going missing
+MISSING_RATE = 0.02
+
+# Share of devices with an active nurse assignment
+ASSIGNED_RATE = 0.15
+
+LOCATION_TYPES = ['Entrance', 'Exit', 'Room', 'Ward', 'Department']
+DEVICE_MODELS = [
+    ('Infusion Pump', 'Baxter'), ('Patient Monitor', 'Philips'), ('Ventilator', 'Medtronic'),
+    ('Pulse Oximeter', 'Masimo'), ('Wheelchair', 'Invacare'), ('Bladder Scanner', 'Verathon')
+]
+FIRST_NAMES = ['Alex', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Skyler']
+LAST_NAMES = ['Smith', 'Johnson', 'Lee', 'Garcia', 'Brown', 'Davis', 'Martinez', 'Clark', 'Lewis', 'Walker']
+SHIFTS = ['Day', 'Evening', 'Night']
+
+TABLE_COLUMNS = {
+    'hospitals': ['id', 'name', 'code', 'address', 'city', 'state', 'zip_code', 'status'],
+    'locations': ['id', 'name', 'type', 'hospital_id', 'building', 'floor', 'room'],
+    'readers': ['id', 'reader_code', 'antenna_number', 'name', 'hospital_id', 'location_id', 'status'],
+    'nurses': ['id', 'badge_id', 'first_name', 'last_name', 'hospital_id', 'department', 'shift'],
+    'devices': ['id', 'serial_number', 'model', 'manufacturer', 'rfid_tag', 'barcode', 'hospital_id',
+                'assigned_to', 'purchase_date', 'updated_at'],
+    'device_state': ['device_id', 'status', 'location_id', 'updated_at'],
+    'device_assignments': ['id', 'device_id', 'nurse_id', 'hospital_id', 'assigned_at', 'returned_at', 'status'],
+    'reader_events': ['id', 'device_id', 'rfid_tag', 'reader_code', 'antenna_number', 'hospital_id',
+                      'location_id', 'timestamp'],
+    'rfid_alerts': ['id', 'device_id', 'reader_id', 'hospital_id', 'location_id', 'status',
+                    'previous_status', 'timestamp']
+}
+
+# Tables emptied by --truncate (hospitals are deleted separately to keep users' hospitals)
+TRUNCATE_ORDER = ['rfid_alerts', 'reader_events', 'reader_uptime_intervals', 'device_assignments',
+                  'device_state', 'devices', 'readers', 'nurses', 'locations']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a large synthetic dataset")
+    parser.add_argument('--hospitals', type=int, default=4)
+    parser.add_argument('--locations', type=int, default=40, help="locations per hospital")
+    parser.add_argument('--readers', type=int, default=25, help="readers per hospital (4 antennas each)")
+    parser.add_argument('--devices', type=int, default=5000, help="devices per hospital")
+    parser.add_argument('--nurses', type=int, default=300, help="nurses per hospital")
+    parser.add_argument('--events', type=int, default=1_000_000, help="movement events across all hospitals")
+    parser.add_argument('--months', type=int, default=6, help="months of history to spread events over")
+    parser.add_argument('--method', choices=['load-data', 'insert'], default='load-data',
+                        help="LOAD DATA LOCAL INFILE from temp files, or multi-row INSERTs")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--truncate', action='store_true',
+                        help="delete existing hospitals, devices, readers, nurses and events first")
+    parser.add_argument('--seed', type=int, help="random seed for a repeatable dataset")
+    return parser.parse_args()
+
+
+def db_config():
+    """Database settings, read from the same environment variables as DBService"""
+    return {
+        'host': os.environ.get('RDS_HOST', 'localhost'),
+        'port': int(os.environ.get('RDS_PORT', 3306)),
+        'user': os.environ.get('RDS_USER', 'root'),
+        'password': os.environ.get('RDS_PASSWORD', 'password'),
+        'database': os.environ.get('RDS_DB', 'pycube_mdm'),
+    }
+
+
+def new_id(rng):
+    """A random UUID from the worker's generator (much faster than uuid4)"""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+class TableWriter:
+    """Buffers rows for one table and loads them in bulk"""
+
+    def __init__(self, connection, table, method, chunk_rows):
+        self.connection = connection
+        self.table = table
+        self.columns = TABLE_COLUMNS[table]
+        self.method = method
+        self.chunk_rows = chunk_rows
+        self.rows_written = 0
+        self._rows = []
+        self._file = None
+        self._file_rows = 0
+
+    def add(self, row):
+        if self.method == 'insert':
+            self._rows.append(row)
+            if len(self._rows) >= INSERT_BATCH_SIZE:
+                self.flush()
+            return
+
+        if self._file is None:
+            self._file = tempfile.NamedTemporaryFile('w', suffix=f'.{self.table}.tsv', delete=False)
+        self._file.write('\t'.join(_tsv_value(value) for value in row))
+        self._file.write('\n')
+        self._file_rows += 1
+        if self._file_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        cursor = self.connection.cursor()
+        try:
+            if self.method == 'insert':
+                if self._rows:
+                    placeholders = ', '.join(['%s'] * len(self.columns))
+                    cursor.executemany(
+                        f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({placeholders})",
+                        self._rows
+                    )
+                    self.rows_written += len(self._rows)
+                    self._rows = []
+            elif self._file is not None:
+                self._file.close()
+                cursor.execute(f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE {self.table}
+                    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                    ({', '.join(self.columns)})
+                """, (self._file.name,))
+                os.unlink(self._file.name)
+                self.rows_written += self._file_rows
+                self._file = None
+                self._file_rows = 0
+            self.connection.commit()
+        finally:
+            cursor.close()
+
+
+def _tsv_value(value):
+    """Format a value for LOAD DATA; \\N is NULL"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+
+def generate_hospital(task):
+    """Generate and load one hospital's data; runs in a worker process"""
+    index, options, events, start, end, seed = task
+    rng = random.Random(seed)
+    connection = mysql.connector.connect(allow_local_infile=True, **db_config())
+    cursor = connection.cursor()
+    cursor.execute("SET SESSION unique_checks = 0")
+    cursor.execute("SET SESSION foreign_key_checks = 0")
+    cursor.close()
+
+    def writer(table, chunk_rows=EVENT_CHUNK_ROWS):
+        return TableWriter(connection, table, options.method, chunk_rows)
+
+    try:
+        code = f"H{index + 1:03d}"
+        hospital_id = new_id(rng)
+        hospitals = writer('hospitals')
+        hospitals.add((hospital_id, f"Synthetic Hospital {index + 1}", f"SYN-{code}", f"{index + 1} Main St",
+                       'Tampa', 'FL', f"33{index % 1000:03d}", 'Active'))
+        hospitals.flush()
+
+        locations = writer('locations')
+        location_ids = []
+        for i in range(options.locations):
+            location_id = new_id(rng)
+            location_ids.append(location_id)
+            locations.add((location_id, f"{LOCATION_TYPES[i % len(LOCATION_TYPES)]} {i + 1}",
+                           LOCATION_TYPES[i % len(LOCATION_TYPES)], hospital_id,
+                           f"Building {i % 3 + 1}", str(i % 8 + 1), f"{i % 8 + 1}{i:02d}"))
+        locations.flush()
+
+        readers_writer = writer('readers')
+        readers = []
+        for i in range(options.readers):
+            reader_code = f"SYN-{code}-R{i + 1:03d}"
+            location_id = location_ids[i % len(location_ids)]
+            for antenna in range(1, 5):
+                reader = (new_id(rng), reader_code, antenna, f"{reader_code} - Antenna {antenna}",
+                          hospital_id, location_id, 'Active')
+                readers.append(reader)
+                readers_writer.add(reader)
+        readers_writer.flush()
+
+        nurses_writer = writer('nurses')
+        nurses = []
+        for i in range(options.nurses):
+            nurse = (new_id(rng), f"SYN-{code}-N{i + 1:05d}", rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                     hospital_id, f"Department {rng.randint(1, 10)}", rng.choice(SHIFTS))
+            nurses.append(nurse)
+            nurses_writer.add(nurse)
+        nurses_writer.flush()
+
+        # Pareto weights: a few devices account for most of the movements
+        weights = [rng.paretovariate(1.2) for _ in range(options.devices)]
+        total_weight = sum(weights)
+
+        devices = writer('devices')
+        device_states = writer('device_state')
+        assignments = writer('device_assignments')
+        reader_events = writer('reader_events')
+        alerts = writer('rfid_alerts')
+        span = (end - start).total_seconds()
+
+        for i in range(options.devices):
+            device_id = new_id(rng)
+            rfid_tag = f"{index + 1:04d}{i:020d}"
+            model, manufacturer = rng.choice(DEVICE_MODELS)
+
+            # Movement timestamps, weighted towards busy hours
+            count = int(round(events * weights[i] / total_weight))
+            timestamps = sorted(
+                _shift_hour(start + timedelta(seconds=rng.random() * span), rng, end)
+                for _ in range(count)
+            )
+
+            status = 'In-Facility'
+            location_id = rng.choice(location_ids)
+            for n, timestamp in enumerate(timestamps):
+                reader = rng.choice(readers)
+                location_id = reader[5]
+                previous_status = status
+                status = 'Temporarily Out' if previous_status == 'In-Facility' else 'In-Facility'
+
+                reader_events.add((new_id(rng), device_id, rfid_tag, reader[1], reader[2], hospital_id,
+                                   location_id, timestamp))
+                alerts.add((new_id(rng), device_id, reader[0], hospital_id, location_id, status,
+                            previous_status, timestamp))
+
+                # Some trips out end with the missing sweep flagging the device,
+                # which can only happen before the device is read again
+                if status == 'Temporarily Out' and rng.random() < MISSING_RATE:
+                    missing_at = timestamp + MISSING_THRESHOLD
+                    next_read = timestamps[n + 1] if n + 1 < len(timestamps) else end
+                    if missing_at < next_read:
+                        alerts.add((new_id(rng), device_id, None, hospital_id, location_id, 'Missing',
+                                    status, missing_at))
+                        status = 'Missing'
+
+            assigned_to = None
+            if nurses and rng.random() < ASSIGNED_RATE:
+                nurse = rng.choice(nurses)
+                assigned_to = f"{nurse[2]} {nurse[3]}"
+                assignments.add((new_id(rng), device_id, nurse[0], hospital_id,
+                                 end - timedelta(hours=rng.randint(1, 12)), None, 'Active'))
+            # A couple of completed assignments in the past
+            for _ in range(rng.randint(0, 2)):
+                if not nurses:
+                    break
+                assigned_at = start + timedelta(seconds=rng.random() * span)
+                assignments.add((new_id(rng), device_id, rng.choice(nurses)[0], hospital_id, assigned_at,
+                                 assigned_at + timedelta(hours=rng.randint(1, 12)), 'Returned'))
+
+            updated_at = timestamps[-1] if timestamps else start
+            devices.add((device_id, f"SN-{code}-{i:07d}", model, manufacturer, rfid_tag, f"BC-{code}-{i:07d}",
+                         hospital_id, assigned_to, (start - timedelta(days=rng.randint(30, 1500))).date(),
+                         updated_at))
+            device_states.add((device_id, status, location_id, updated_at))
+
+        for table_writer in (devices, device_states, assignments, reader_events, alerts):
+            table_writer.flush()
+
+        return {table_writer.table: table_writer.rows_written for table_writer in (
+            hospitals, locations, readers_writer, nurses_writer, devices, device_states, assignments,
+            reader_events, alerts
+        )}
+    finally:
+        connection.close()
+
+
+def _shift_hour(timestamp, rng, end):
+    """
+    Move a timestamp to an hour drawn from HOUR_WEIGHTS on the same day.
+
+    On the last day that hour may not have come yet; the timestamp is then
+    left where it was, so nothing is generated after end.
+    """
+    hour = rng.choices(range(24), weights=HOUR_WEIGHTS)[0]
+    shifted = timestamp.replace(hour=hour)
+    return shifted if shifted <= end else timestamp
+
+
+def truncate():
+    """Delete the data the generator writes (users are kept)"""
+    connection = mysql.connector.connect(**db_config())
+    cursor = connection.cursor()
+    try:
+        # TRUNCATE is far quicker than DELETE for tables with millions of rows
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        for table in TRUNCATE_ORDER:
+            cursor.execute(f"TRUNCATE TABLE {table}")
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+        cursor.execute("DELETE FROM hospitals WHERE id NOT IN (SELECT hospital_id FROM users WHERE hospital_id IS NOT NULL)")
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def bump_versions():
+    """Invalidate cached queries and conditional GETs in running app processes"""
+    from services.db_service import DBService
+
+    db_service = DBService()
+    connection = db_service.get_connection()
+    cursor = connection.cursor()
+    try:
+        db_service.bump_table_versions(cursor, *TABLE_COLUMNS)
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def main():
+    options = parse_args()
+    base_seed = options.seed if options.seed is not None else random.randrange(2 ** 32)
+
+    end = get_current_est_time().replace(tzinfo=None, microsecond=0)
+    start = end - timedelta(days=30 * options.months)
+
+    if options.truncate:
+        print("Deleting existing data...")
+        truncate()
+
+    per_hospital = options.events // options.hospitals
+    tasks = [
+        (index, options, per_hospital + (1 if index < options.events % options.hospitals else 0),
+         start, end, base_seed + index)
+        for index in range(options.hospitals)
+    ]
+
+    print(f"Generating {options.hospitals} hospitals with ~{options.events} events over {options.months} months "
+          f"({options.method}, {min(options.workers, options.hospitals)} workers, seed {base_seed})")
+    started = time.monotonic()
+    totals = {}
+    with multiprocessing.Pool(min(options.workers, options.hospitals)) as pool:
+        for counts in pool.imap_unordered(generate_hospital, tasks):
+            for table, count in counts.items():
+                totals[table] = totals.get(table, 0) + count
+            print(f"  hospital done: {counts.get('reader_events', 0)} events")
+
+    bump_versions()
+    elapsed = time.monotonic() - started
+
+    print(f"Finished in {elapsed:.1f}s")
+    for table, count in totals.items():
+        print(f"  {table:<20} {count}")
+    events = totals.get('reader_events', 0)
+    print(f"  {events / elapsed:.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Synthetic RFID load generator for sizing the MQTT ingest tier.
+
+Simulates N readers x M antennas x K tags and publishes Zebra-format tag
+reads (data.idHex / data.antenna / data.hostName) at a target rate, mixing
+three traffic patterns:
+
+- dwell: a tag sitting near its home antenna is read now and then
+- walk-out: a tag passes a portal and is read on consecutive antennas
+- burst: a cart of tags passes one antenna and every tag is read repeatedly
+
+Messages are either published to a broker (normally a local mosquitto that
+test_mqtt_ec2.py is subscribed to) or fed straight into
+MQTTClient.on_message in this process, which measures the ingest code
+without the network. In-process, the spool is turned off and, with
+DEVICE_STATE_ENABLED, each read's event is written before the next one,
+so the latency covers the MySQL write; the report says which path was
+measured. Reader heartbeats are sent too.
+
+Readers and tags are taken from the database so that the ingest client
+actually writes rows; when the database has fewer than requested, synthetic
+ones are added, which exercises the "unknown reader/tag" paths instead.
+
+Reported: achieved publish rate, schedule lag (how far the generator fell
+behind the target rate), ingest lag (per-message latency in-process, or the
+time the database took to catch up after the last publish) and the rows
+written to reader_events and rfid_alerts.
+
+Examples:
+    python scripts/load_generator.py --readers 20 --antennas 4 --tags 2000 --rate 500 --duration 60
+    python scripts/load_generator.py --mode inprocess --rate 0 --duration 30
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+# Add pycube_mdm directory to path for relative imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paho.mqtt.client as mqtt
+from services.db_service import DBService
+
+try:
+    from pycube_mdm.config.app_config import MQTT_TOPIC, MQTT_HEARTBEAT_TOPIC
+except ImportError:
+    from config.app_config import MQTT_TOPIC, MQTT_HEARTBEAT_TOPIC
+
+# Seconds the row counts must stay unchanged before ingest is considered caught up
+SETTLE_TIME = 5.0
+
+# Seconds between progress lines
+REPORT_INTERVAL = 5.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic RFID tag read load")
+    parser.add_argument('--mode', choices=['mqtt', 'inprocess'], default='mqtt',
+                        help="publish to a broker, or call MQTTClient.on_message directly")
+    parser.add_argument('--host', default='localhost', help="broker host (mqtt mode)")
+    parser.add_argument('--port', type=int, default=1883, help="broker port (mqtt mode)")
+    parser.add_argument('--topic', default=MQTT_TOPIC, help="tag data topic")
+    parser.add_argument('--heartbeat-topic', default=MQTT_HEARTBEAT_TOPIC, help="heartbeat topic")
+    parser.add_argument('--qos', type=int, choices=[0, 1], default=1)
+    parser.add_argument('--readers', type=int, default=10, help="number of readers (N)")
+    parser.add_argument('--antennas', type=int, default=4, help="antennas per reader (M)")
+    parser.add_argument('--tags', type=int, default=1000, help="number of tags (K)")
+    parser.add_argument('--rate', type=float, default=100.0,
+                        help="target tag reads per second, 0 for as fast as possible")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds to generate load for")
+    parser.add_argument('--walkout-ratio', type=float, default=0.2,
+                        help="share of events that are walk-outs")
+    parser.add_argument('--burst-ratio', type=float, default=0.05,
+                        help="share of events that are cart bursts")
+    parser.add_argument('--burst-size', type=int, default=20, help="tags in a cart burst")
+    parser.add_argument('--burst-repeats', type=int, default=3, help="reads of each tag in a burst")
+    parser.add_argument('--heartbeat-interval', type=float, default=10.0,
+                        help="seconds between heartbeats per reader, 0 to disable")
+    parser.add_argument('--synthetic-only', action='store_true',
+                        help="don't use readers and tags from the database")
+    parser.add_argument('--seed', type=int, help="random seed for a repeatable run")
+    return parser.parse_args()
+
+
+class Fleet:
+    """The simulated readers, antennas and tags"""
+
+    def __init__(self, reader_count, antenna_count, tag_count, synthetic_only=False):
+        known_readers = {}
+        known_tags = []
+        if not synthetic_only:
+            known_readers, known_tags = self._load_from_db(tag_count)
+
+        self.readers = {}
+        for reader_code in list(known_readers)[:reader_count]:
+            self.readers[reader_code] = sorted(known_readers[reader_code])[:antenna_count]
+        for i in range(reader_count - len(self.readers)):
+            self.readers[f"LOADGEN-R{i + 1:04d}"] = list(range(1, antenna_count + 1))
+
+        self.tags = known_tags[:tag_count]
+        self.tags += [f"LOADGEN{i:017X}" for i in range(tag_count - len(self.tags))]
+
+        self.known_reader_count = min(len(known_readers), reader_count)
+        self.known_tag_count = min(len(known_tags), tag_count)
+
+        # Every tag lives near one antenna
+        self.antennas = [(code, antenna) for code, antennas in self.readers.items() for antenna in antennas]
+        self.home = {tag: random.choice(self.antennas) for tag in self.tags}
+
+    def _load_from_db(self, tag_count):
+        """Get the configured reader antennas and device tags"""
+        connection = DBService().get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT reader_code, antenna_number FROM readers WHERE status = 'Active'")
+            readers = {}
+            for reader_code, antenna_number in cursor.fetchall():
+                readers.setdefault(reader_code, []).append(antenna_number)
+
+            cursor.execute("SELECT rfid_tag FROM devices WHERE rfid_tag IS NOT NULL LIMIT %s", (tag_count,))
+            tags = [row[0] for row in cursor.fetchall()]
+            return readers, tags
+        finally:
+            cursor.close()
+            connection.close()
+
+
+class TrafficModel:
+    """Turns the fleet into a stream of (reader code, antenna, tag) reads"""
+
+    def __init__(self, fleet, walkout_ratio, burst_ratio, burst_size, burst_repeats):
+        self.fleet = fleet
+        self.walkout_ratio = walkout_ratio
+        self.burst_ratio = burst_ratio
+        self.burst_size = burst_size
+        self.burst_repeats = burst_repeats
+        self.pattern_counts = {'dwell': 0, 'walkout': 0, 'burst': 0}
+
+    def reads(self):
+        """Yield tag reads forever"""
+        while True:
+            roll = random.random()
+            if roll < self.burst_ratio:
+                self.pattern_counts['burst'] += 1
+                yield from self._burst()
+            elif roll < self.burst_ratio + self.walkout_ratio:
+                self.pattern_counts['walkout'] += 1
+                yield from self._walkout()
+            else:
+                self.pattern_counts['dwell'] += 1
+                yield from self._dwell()
+
+    def _dwell(self):
+        """A tag at rest is read by its home antenna"""
+        tag = random.choice(self.fleet.tags)
+        reader_code, antenna = self.fleet.home[tag]
+        yield reader_code, antenna, tag
+
+    def _walkout(self):
+        """A tag walks through a portal, crossing two or three antennas of one reader"""
+        tag = random.choice(self.fleet.tags)
+        reader_code = random.choice(list(self.fleet.readers))
+        antennas = self.fleet.readers[reader_code]
+        start = random.randrange(len(antennas))
+        for antenna in antennas[start:start + random.randint(2, 3)]:
+            yield reader_code, antenna, tag
+
+    def _burst(self):
+        """A cart of tags passes one antenna and each tag is read several times"""
+        reader_code, antenna = random.choice(self.fleet.antennas)
+        cart = random.sample(self.fleet.tags, min(self.burst_size, len(self.fleet.tags)))
+        for _ in range(self.burst_repeats):
+            for tag in cart:
+                yield reader_code, antenna, tag
+
+
+def build_tag_read(reader_code, antenna, tag, event_num):
+    """Build a Zebra FX-series tag data payload"""
+    return json.dumps({
+        'type': 'SIMPLE',
+        'timestamp': datetime.now().isoformat(),
+        'data': {
+            'idHex': tag,
+            'antenna': antenna,
+            'hostName': reader_code,
+            'peakRssi': random.randint(-75, -40),
+            'reads': 1,
+            'channel': 915.25,
+            'eventNum': event_num,
+            'format': 'epc'
+        }
+    })
+
+
+def build_heartbeat(reader_code):
+    """Build a reader heartbeat payload"""
+    return json.dumps({
+        'type': 'heartbeat',
+        'timestamp': datetime.now().isoformat(),
+        'data': {'hostName': reader_code}
+    })
+
+
+class MQTTSink:
+    """Publishes messages to a broker"""
+
+    def __init__(self, host, port, qos):
+        self.qos = qos
+        self.client = mqtt.Client(
+            protocol=mqtt.MQTTv5,
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=f"loadgen-{os.getpid()}"
+        )
+        # Allow plenty of QoS 1 messages in flight so the broker, not the
+        # acknowledgement round trip, is the limit
+        self.client.max_inflight_messages_set(1000)
+        self.client.max_queued_messages_set(0)
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def send(self, topic, payload):
+        self.client.publish(topic, payload, qos=self.qos)
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class InProcessSink:
+    """Feeds messages straight into the ingest client's on_message"""
+
+    def __init__(self):
+        import logging
+        import test_mqtt_ec2
+        from test_mqtt_ec2 import MQTTClient
+
+        # Measure ingest into MySQL, not appends to the local spool
+        test_mqtt_ec2.INGEST_SPOOL_ENABLED = False
+        self.ingest = MQTTClient(
+            protocol=mqtt.MQTTv5,
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=f"loadgen-ingest-{os.getpid()}"
+        )
+        # Only measure message handling, not the missing-device sweep
+        self.ingest.shutdown_scheduler()
+        # The ingest client logs every message at INFO, which would dominate the timings
+        logging.getLogger('test_mqtt_ec2').setLevel(logging.WARNING)
+        if self.ingest.device_states:
+            # send() writes each event itself
+            self.ingest.device_states.stop()
+        self.mode = 'device_state' if self.ingest.device_states else 'direct'
+
+        self.latencies = []
+
+    def send(self, topic, payload):
+        message = mqtt.MQTTMessage(topic=topic.encode())
+        message.payload = payload.encode()
+
+        started = time.perf_counter()
+        self.ingest.on_message(self.ingest, None, message)
+        if self.ingest.device_states:
+            self.ingest.device_states.flush()
+        self.latencies.append(time.perf_counter() - started)
+
+    def close(self):
+        pass
+
+
+def count_rows():
+    """Get the row counts of the tables written by ingest"""
+    connection = DBService().get_connection()
+    cursor = connection.cursor()
+    try:
+        counts = {}
+        for table in ('reader_events', 'rfid_alerts'):
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cursor.fetchone()[0]
+        return counts
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def wait_for_ingest():
+    """Wait until the row counts stop changing; returns (seconds waited, counts)"""
+    started = time.monotonic()
+    counts = count_rows()
+    stable_since = time.monotonic()
+    while time.monotonic() - stable_since < SETTLE_TIME:
+        time.sleep(1)
+        latest = count_rows()
+        if latest != counts:
+            counts = latest
+            stable_since = time.monotonic()
+    # The last SETTLE_TIME seconds were spent confirming nothing else arrived
+    return max(stable_since - started, 0.0), counts
+
+
+def percentile(values, fraction):
+    """Get a percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run(args):
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    fleet = Fleet(args.readers, args.antennas, args.tags, args.synthetic_only)
+    traffic = TrafficModel(fleet, args.walkout_ratio, args.burst_ratio, args.burst_size, args.burst_repeats)
+    print(f"Simulating {len(fleet.readers)} readers ({fleet.known_reader_count} from the database), "
+          f"{len(fleet.antennas)} antennas, {len(fleet.tags)} tags ({fleet.known_tag_count} from the database)")
+
+    baseline = count_rows()
+    sink = InProcessSink() if args.mode == 'inprocess' else MQTTSink(args.host, args.port, args.qos)
+    print(f"Generating load for {args.duration:.0f}s at "
+          f"{'maximum rate' if not args.rate else f'{args.rate:.0f} reads/s'} ({args.mode} mode)")
+
+    sent = 0
+    heartbeats_sent = 0
+    max_schedule_lag = 0.0
+    next_heartbeat = {}
+    started = time.monotonic()
+    last_report = started
+
+    try:
+        for reader_code, antenna, tag in traffic.reads():
+            now = time.monotonic()
+            elapsed = now - started
+            if elapsed >= args.duration:
+                break
+
+            # Pace sends against the schedule rather than sleeping a fixed
+            # interval, so slow sends are caught up instead of accumulating
+            if args.rate:
+                due = started + sent / args.rate
+                if due > now:
+                    time.sleep(due - now)
+                else:
+                    max_schedule_lag = max(max_schedule_lag, now - due)
+
+            sink.send(args.topic, build_tag_read(reader_code, antenna, tag, sent))
+            sent += 1
+
+            if args.heartbeat_interval and next_heartbeat.get(reader_code, 0) <= now:
+                sink.send(args.heartbeat_topic, build_heartbeat(reader_code))
+                heartbeats_sent += 1
+                # Spread readers out instead of sending every heartbeat at once
+                next_heartbeat[reader_code] = now + args.heartbeat_interval * random.uniform(0.9, 1.1)
+
+            if now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                print(f"  {elapsed:6.1f}s  sent {sent}  ({sent / elapsed:.0f} reads/s)")
+    except KeyboardInterrupt:
+        print("Interrupted, reporting what was sent so far")
+
+    publish_time = time.monotonic() - started
+    sink.close()
+
+    print("Waiting for ingest to catch up...")
+    drain_time, counts = wait_for_ingest()
+
+    print()
+    print("Results")
+    print(f"  Tag reads sent:        {sent} in {publish_time:.1f}s ({sent / publish_time:.1f} reads/s)")
+    print(f"  Heartbeats sent:       {heartbeats_sent}")
+    print(f"  Patterns:              {traffic.pattern_counts['dwell']} dwell, "
+          f"{traffic.pattern_counts['walkout']} walk-out, {traffic.pattern_counts['burst']} burst")
+    if args.rate:
+        print(f"  Max schedule lag:      {max_schedule_lag * 1000:.0f}ms")
+    if isinstance(sink, InProcessSink):
+        latencies = sink.latencies
+        print(f"  Ingest path measured:  {sink.mode}")
+        print(f"  on_message latency:    p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.1f}ms, max {max(latencies, default=0) * 1000:.1f}ms")
+    else:
+        print(f"  Ingest lag:            {drain_time:.1f}s after the last publish")
+    for table, count in counts.items():
+        written = count - baseline[table]
+        print(f"  {table + ' written:':<22} {written} ({written / publish_time:.1f} rows/s)")
+
+
+if __name__ == "__main__":
+    run(parse_args())
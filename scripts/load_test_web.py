@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the web app's concurrent-request throughput.
+
+Logs in once, then for each concurrency level keeps that many clients
+requesting the given pages back to back over keep-alive connections for
+--duration seconds, and reports requests per second, p50/p95/p99 latency
+and errors. Start the app with gunicorn (see gunicorn.conf.py), run the
+test, then restart it with the other worker class and compare.
+
+Examples:
+    WEB_WORKER_CLASS=sync gunicorn app:app
+    python scripts/load_test_web.py --label sync --save load_sync.json
+
+    WEB_WORKER_CLASS=gevent gunicorn app:app
+    python scripts/load_test_web.py --label gevent --compare load_sync.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure web app throughput at several concurrency levels")
+    parser.add_argument('--url', default='http://localhost:5000', help="app base URL (default: http://localhost:5000)")
+    parser.add_argument('--username', default=os.environ.get('LOAD_TEST_USERNAME', 'admin'), help="login user (default: admin)")
+    parser.add_argument('--password', default=os.environ.get('LOAD_TEST_PASSWORD'), help="login password (default: $LOAD_TEST_PASSWORD)")
+    parser.add_argument('--paths', default='/dashboard,/devices/,/rfid/alerts,/devices/api/count',
+                        help="comma-separated pages requested in turn by each client")
+    parser.add_argument('--concurrency', default='1,10,50,200', help="comma-separated client counts (default: 1,10,50,200)")
+    parser.add_argument('--duration', type=float, default=30, help="seconds per concurrency level (default: 30)")
+    parser.add_argument('--label', default='run', help="name for this run in saved results, e.g. sync or gevent")
+    parser.add_argument('--save', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    if not args.password:
+        parser.error("--password or LOAD_TEST_PASSWORD is required")
+    args.paths = [path.strip() for path in args.paths.split(',') if path.strip()]
+    args.concurrency = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    return args
+
+
+def percentile(values, fraction):
+    """Get a percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def open_connection(url):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port, timeout=60)
+
+
+def login(url, username, password):
+    """Log in and return the session cookie"""
+    connection = open_connection(url)
+    try:
+        connection.request('POST', '/auth/login', body=urlencode({'username': username, 'password': password}),
+                           headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        response = connection.getresponse()
+        response.read()
+        # A successful login redirects away from the login page
+        if response.status != 302 or '/auth/login' in (response.getheader('Location') or ''):
+            raise SystemExit(f"Login as {username} failed (HTTP {response.status})")
+        return response.getheader('Set-Cookie').split(';', 1)[0]
+    finally:
+        connection.close()
+
+
+def client_loop(url, cookie, paths, deadline, latencies, errors, lock):
+    """Request paths in turn until the deadline, recording latencies in ms"""
+    connection = open_connection(url)
+    headers = {'Cookie': cookie}
+    local_latencies = []
+    local_errors = 0
+    request_number = 0
+
+    while time.perf_counter() < deadline:
+        path = paths[request_number % len(paths)]
+        request_number += 1
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                local_errors += 1
+                continue
+            local_latencies.append((time.perf_counter() - started) * 1000)
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            connection.close()
+            connection = open_connection(url)
+
+    connection.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def run_level(args, cookie, clients):
+    """Run one concurrency level and summarize it"""
+    latencies, errors, lock = [], [0], threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=client_loop, args=(args.url, cookie, args.paths, deadline, latencies, errors, lock))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'clients': clients,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99)
+    }
+
+
+def print_comparison(results, baseline):
+    """Throughput and p95 latency of this run next to an earlier one, per concurrency level"""
+    earlier = {level['clients']: level for level in baseline['levels']}
+    print(f"\n{results['label']} compared to {baseline['label']}")
+    print(f"{'Clients':>8}{'req/s':>12}{'before':>12}{'change':>10}{'p95 ms':>10}{'before':>10}")
+    for level in results['levels']:
+        before = earlier.get(level['clients'])
+        if not before:
+            continue
+        change = (level['requests_per_sec'] / before['requests_per_sec'] - 1) * 100 if before['requests_per_sec'] else 0.0
+        print(f"{level['clients']:>8}{level['requests_per_sec']:>12.1f}{before['requests_per_sec']:>12.1f}"
+              f"{change:>+9.0f}%{level['p95_ms']:>10.0f}{before['p95_ms']:>10.0f}")
+
+
+def main():
+    args = parse_args()
+    cookie = login(args.url, args.username, args.password)
+    print(f"Load testing {args.url} ({args.label}): {', '.join(args.paths)}\n")
+    print(f"{'Clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+    results = {'label': args.label, 'url': args.url, 'paths': args.paths, 'duration': args.duration, 'levels': []}
+    for clients in args.concurrency:
+        level = run_level(args, cookie, clients)
+        results['levels'].append(level)
+        print(f"{clients:>8}{level['requests_per_sec']:>10.1f}{level['p50_ms']:>10.0f}{level['p95_ms']:>10.0f}"
+              f"{level['p99_ms']:>10.0f}{level['errors']:>8}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Add the rfid_alerts.seq column that live updates (/api/events) tail.
+
+Databases created with the current schema already have it. For older ones
+MySQL has to copy the whole rfid_alerts table to add an AUTO_INCREMENT
+column, and alerts cannot be written while it does, so this is not done at
+app startup. Run it in a quiet period, with ingest stopped, then restart the
+web app:
+
+    python scripts/migrate_alert_seq.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.db_service import DBService
+
+
+def main():
+    db_service = DBService()
+    if db_service.has_alert_seq():
+        print("rfid_alerts.seq already exists, nothing to do")
+        return
+
+    started = time.perf_counter()
+    print("Adding rfid_alerts.seq (copies the rfid_alerts table)...")
+    db_service.add_alert_seq()
+    print(f"Done in {time.perf_counter() - started:.1f}s; restart the web app to turn live updates on")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,9 @@ from services.db_service import DBService
 # Load environment variables from .env file
 load_dotenv()
 
+# Devices updated per transaction
+COMMIT_EVERY = 1000
+
 def update_epc_codes():
     """
     Update the RFID Tag column to be renamed as EPC Code with the specified format
@@ -21,23 +24,28 @@ def update_epc_codes():
         connection = db_service.get_connection()
         cursor = connection.cursor(dictionary=True)
         
-        # First, get all devices ordered by ID
-        cursor.execute("SELECT id FROM devices ORDER BY id")
-        devices = cursor.fetchall()
-        
-        print(f"Found {len(devices)} devices to update")
-        
-        # Update each device with a new EPC Code format
+        # Stream devices ordered by ID so memory stays flat however large the fleet
         base_epc_code = 200000001192024000015107
+        updated = 0
         
-        for i, device in enumerate(devices):
+        for i, device in enumerate(db_service.iter_devices()):
             device_id = device['id']
             epc_code = str(base_epc_code + i)
             
             # Update the device record with new EPC Code
             update_query = "UPDATE devices SET rfid_tag = %s WHERE id = %s"
             cursor.execute(update_query, (epc_code, device_id))
-            print(f"Updated device {i+1}/50 with EPC Code: {epc_code}")
+            updated += 1
+            
+            # Commit in chunks to keep transactions short
+            if updated % COMMIT_EVERY == 0:
+                connection.commit()
+                print(f"Updated {updated} devices (last EPC Code: {epc_code})")
+        
+        print(f"Updated {updated} devices")
+        
+        # Let cached device lists and polling clients see the new codes
+        db_service.bump_table_versions(cursor, 'devices')
         
         # Commit changes
         connection.commit()
@@ -0,0 +1,365 @@
+"""
+Alert rules evaluated on every device movement in the ingest pipeline.
+
+Rules are rows of alert_rules. Each one matches movement (and missing)
+events by optional reader, location and hospital, new device status and
+time of day, for example "any device read at the exit antenna between
+22:00 and 06:00". A rule without a window triggers on every matching event.
+A rule with window_seconds counts matching events in a sliding window,
+per rule or per hospital, location or device (group_by), and triggers once
+threshold of them fall in the window. Events are counted as reads or as
+distinct devices or hospitals (count_distinct):
+
+- more than 5 devices leave a ward in 10 minutes: location_id, status
+  'Temporarily Out', window 600, threshold 6, count distinct devices
+- a device seen at two hospitals in one hour: window 3600, threshold 2,
+  group by device, count distinct hospitals
+
+When a windowed rule triggers its window is cleared, so it triggers again
+only after threshold new events.
+
+Rules are compiled into predicate functions and indexed by their most
+specific filter (reader, else location, else hospital, else none). An event
+is only checked against the rules indexed under its reader, location and
+hospital and the rules with no filter. Windows are kept in memory by the
+ingest process; with INGEST_SHARD_COUNT > 1 each process counts only the
+events of its own tags.
+
+Triggered rules are queued and written to rule_alerts in batches by the
+device state thread (flush).
+"""
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+
+from .db_service import DBService
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('In-Facility', 'Temporarily Out', 'Missing')
+GROUP_BY = ('rule', 'hospital', 'location', 'device')
+COUNT_DISTINCT = ('read', 'device', 'hospital')
+
+# Rule alerts written to MySQL per transaction
+FLUSH_BATCH = 500
+
+# Seconds between sweeps for windows that have emptied
+PRUNE_INTERVAL = 60
+
+# Event field holding each group_by / count_distinct key
+EVENT_KEYS = {
+    'rule': None,
+    'hospital': 'hospital_id',
+    'location': 'location_id',
+    'device': 'device_id',
+    'read': 'alert_id'
+}
+
+
+def _seconds_of_day(value):
+    """Seconds since midnight of a TIME column (a timedelta) or an HH:MM[:SS] string"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) % 86400
+    parts = str(value).split(':')
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    hours, minutes, seconds = (int(part) for part in parts + ['0'] * (3 - len(parts)))
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def normalize_rule(data):
+    """
+    Validate a rule submitted through the API and return its alert_rules columns.
+
+    Raises ValueError with a message for the user if the rule is invalid.
+    """
+    name = (data.get('name') or '').strip()
+    if not name:
+        raise ValueError("Rule name is required")
+
+    status = data.get('status') or None
+    if status and status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+
+    times = {}
+    for column in ('start_time', 'end_time'):
+        seconds = _seconds_of_day(data.get(column))
+        times[column] = None if seconds is None else f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+    try:
+        window_seconds = int(data.get('window_seconds') or 0)
+        threshold = int(data['threshold']) if data.get('threshold') not in (None, '') else 1
+    except (TypeError, ValueError):
+        raise ValueError("window_seconds and threshold must be whole numbers")
+    if window_seconds < 0 or threshold < 1:
+        raise ValueError("window_seconds must be 0 or more and threshold at least 1")
+
+    group_by = data.get('group_by') or 'rule'
+    count_distinct = data.get('count_distinct') or 'device'
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+    if count_distinct not in COUNT_DISTINCT:
+        raise ValueError(f"count_distinct must be one of {', '.join(COUNT_DISTINCT)}")
+
+    return {
+        'name': name[:100],
+        'hospital_id': data.get('hospital_id') or None,
+        'location_id': data.get('location_id') or None,
+        'reader_id': data.get('reader_id') or None,
+        'status': status,
+        'start_time': times['start_time'],
+        'end_time': times['end_time'],
+        'window_seconds': window_seconds,
+        'threshold': threshold,
+        'group_by': group_by,
+        'count_distinct': count_distinct,
+        'enabled': bool(data.get('enabled', True))
+    }
+
+
+def rule_to_dict(rule):
+    """An alert_rules row with its times as HH:MM strings, for JSON responses"""
+    result = dict(rule)
+    for column in ('start_time', 'end_time'):
+        seconds = _seconds_of_day(result.get(column))
+        result[column] = None if seconds is None else f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}"
+    result['enabled'] = bool(result.get('enabled'))
+    return result
+
+
+def compile_predicate(rule):
+    """Build a function (event, timestamp) -> bool for a rule's conditions"""
+    checks = []
+    for column in ('reader_id', 'location_id', 'hospital_id', 'status'):
+        if rule.get(column):
+            checks.append((column, rule[column]))
+
+    start = _seconds_of_day(rule.get('start_time'))
+    end = _seconds_of_day(rule.get('end_time'))
+
+    def in_hours(timestamp):
+        if start is None and end is None:
+            return True
+        seconds = timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+        if start is None:
+            return seconds < end
+        if end is None:
+            return seconds >= start
+        if start <= end:
+            return start <= seconds < end
+        return seconds >= start or seconds < end  # e.g. 22:00 to 06:00
+
+    def predicate(event, timestamp):
+        for column, value in checks:
+            if event.get(column) != value:
+                return False
+        return in_hours(timestamp)
+
+    return predicate
+
+
+class SlidingWindow:
+    """Events of the last span, counted per key"""
+
+    __slots__ = ('span', '_entries', '_counts')
+
+    def __init__(self, span):
+        self.span = span
+        self._entries = deque()  # (timestamp, key), oldest first
+        self._counts = {}
+
+    def add(self, timestamp, key):
+        """Add an event and return the number of distinct keys in the window"""
+        self._entries.append((timestamp, key))
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.expire(timestamp)
+        return len(self._counts)
+
+    def expire(self, now):
+        cutoff = now - self.span
+        entries, counts = self._entries, self._counts
+        while entries and entries[0][0] <= cutoff:
+            _, key = entries.popleft()
+            remaining = counts[key] - 1
+            if remaining:
+                counts[key] = remaining
+            else:
+                del counts[key]
+
+    @property
+    def newest(self):
+        return self._entries[-1][0] if self._entries else None
+
+    def clear(self):
+        self._entries.clear()
+        self._counts.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CompiledRule:
+    """An alert rule ready to be evaluated"""
+
+    __slots__ = ('id', 'name', 'version', 'matches', 'span', 'threshold', 'group_key', 'count_key')
+
+    def __init__(self, rule):
+        self.id = rule['id']
+        self.name = rule['name']
+        self.version = rule.get('updated_at')
+        self.matches = compile_predicate(rule)
+        self.span = timedelta(seconds=rule['window_seconds']) if rule.get('window_seconds') else None
+        self.threshold = rule.get('threshold') or 1
+        self.group_key = EVENT_KEYS[rule.get('group_by') or 'rule']
+        self.count_key = EVENT_KEYS[rule.get('count_distinct') or 'device']
+
+
+class AlertRuleEngine:
+    """Evaluates the enabled alert rules against device events"""
+
+    def __init__(self, batch_size=FLUSH_BATCH):
+        self.db_service = DBService()
+        self.batch_size = batch_size
+
+        self._by_reader = {}
+        self._by_location = {}
+        self._by_hospital = {}
+        self._unfiltered = []
+        self._versions = {}  # rule id -> updated_at of the loaded rules
+        self._windows = {}  # (rule id, group) -> SlidingWindow
+        self._pending = []  # rule alerts not yet written
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+
+        self.evaluated = 0
+        self.triggered = 0
+        self.written = 0
+
+    def refresh(self):
+        """Reload and compile the enabled rules, keeping the windows of unchanged rules"""
+        by_reader, by_location, by_hospital, unfiltered = {}, {}, {}, []
+        rules = {}
+        for row in self.db_service.get_alert_rules(enabled_only=True):
+            rule = rules[row['id']] = CompiledRule(row)
+            if row['reader_id']:
+                by_reader.setdefault(row['reader_id'], []).append(rule)
+            elif row['location_id']:
+                by_location.setdefault(row['location_id'], []).append(rule)
+            elif row['hospital_id']:
+                by_hospital.setdefault(row['hospital_id'], []).append(rule)
+            else:
+                unfiltered.append(rule)
+
+        with self._lock:
+            # A rule that was edited starts counting again
+            self._windows = {key: window for key, window in self._windows.items()
+                             if key[0] in rules and rules[key[0]].version == self._versions.get(key[0])}
+            self._versions = {rule_id: rule.version for rule_id, rule in rules.items()}
+            self._by_reader, self._by_location, self._by_hospital = by_reader, by_location, by_hospital
+            self._unfiltered = unfiltered
+        logger.info(f"Alert rules loaded: {len(rules)} enabled")
+
+    def evaluate(self, event, timestamp):
+        """
+        Check a device event against the rules indexed under its reader,
+        location and hospital and the unfiltered rules.
+
+        Events are the dicts of DeviceStateTable (movement or missing);
+        timestamp is the event time as a datetime. Returns the rule alerts
+        triggered, which are also queued for writing.
+        """
+        triggered = []
+        with self._lock:
+            self.evaluated += 1
+            for index, key in ((self._by_reader, 'reader_id'), (self._by_location, 'location_id'),
+                               (self._by_hospital, 'hospital_id')):
+                rules = index.get(event.get(key))
+                if rules:
+                    self._check(rules, event, timestamp, triggered)
+            if self._unfiltered:
+                self._check(self._unfiltered, event, timestamp, triggered)
+
+            if triggered:
+                self.triggered += len(triggered)
+                self._pending.extend(triggered)
+        for rule_alert in triggered:
+            logger.info(f"Alert rule '{rule_alert['rule_name']}' triggered by device {rule_alert['device_id']} "
+                        f"({rule_alert['match_count']} matching)")
+        return triggered
+
+    def flush(self):
+        """Write one batch of queued rule alerts; returns how many were written"""
+        with self._lock:
+            batch = self._pending[:self.batch_size]
+            if time.monotonic() >= self._next_prune:
+                self._prune()
+                self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        if not batch:
+            return 0
+
+        self.db_service.create_rule_alerts(batch)
+
+        with self._lock:
+            del self._pending[:len(batch)]
+        self.written += len(batch)
+        return len(batch)
+
+    def get_stats(self):
+        """Get evaluation statistics"""
+        with self._lock:
+            return {
+                'rules': len(self._versions),
+                'windows': len(self._windows),
+                'evaluated': self.evaluated,
+                'triggered': self.triggered,
+                'pending': len(self._pending),
+                'written': self.written
+            }
+
+    def _check(self, rules, event, timestamp, triggered):
+        for rule in rules:
+            if not rule.matches(event, timestamp):
+                continue
+
+            count = 1
+            if rule.span:
+                group = event.get(rule.group_key) if rule.group_key else None
+                window = self._windows.get((rule.id, group))
+                if window is None:
+                    window = self._windows[(rule.id, group)] = SlidingWindow(rule.span)
+                count = window.add(timestamp, event.get(rule.count_key))
+                if count < rule.threshold:
+                    continue
+                window.clear()
+
+            triggered.append({
+                'id': str(uuid.uuid4()),
+                'rule_id': rule.id,
+                'rule_name': rule.name,
+                'device_id': event.get('device_id'),
+                'reader_id': event.get('reader_id'),
+                'hospital_id': event.get('hospital_id'),
+                'location_id': event.get('location_id'),
+                'match_count': count,
+                'triggered_at': timestamp
+            })
+
+    def _prune(self):
+        """Drop windows whose events have all expired, measured against the newest event seen"""
+        if not self._windows:
+            return
+        newest = max((window.newest for window in self._windows.values() if window), default=None)
+        if newest is None:
+            self._windows.clear()
+            return
+        for key, window in list(self._windows.items()):
+            window.expire(newest)
+            if not window:
+                del self._windows[key]
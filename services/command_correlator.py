@@ -0,0 +1,340 @@
+"""
+Command/response correlation for reader commands.
+
+Each process that sends commands keeps one MQTT connection subscribed to the
+response topic. Outstanding commands are indexed by command id, with a heap
+of deadlines so expired commands are found without scanning the index.
+A reply resolves its command and wakes whoever is waiting on it, so the web
+UI can send a command (e.g. GET_DIAGNOSTICS) and return the reader's answer
+in the same request when it comes quickly; otherwise the page polls for it.
+Outcomes are written to reader_commands in batches by a background thread.
+
+Reply latency is kept for the most recent replies per command type and per
+reader, and reported as percentiles.
+
+Every web worker receives every reply, so replies to commands sent by other
+processes are counted as unmatched and otherwise ignored.
+"""
+import ssl
+import json
+import time
+import uuid
+import heapq
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+
+from .db_service import DBService
+from .command_dispatch import build_command, parse_response, percentile
+
+try:
+    from pycube_mdm.config.app_config import (
+        MQTT_ENDPOINT, MQTT_PORT, MQTT_KEEP_ALIVE, MQTT_COMMAND_TOPIC, MQTT_RESPONSE_TOPIC,
+        PRIVATE_KEY, CERTIFICATE, ROOT_CA, COMMAND_TIMEOUT, get_current_est_time
+    )
+except ImportError:
+    try:
+        from ..config.app_config import (
+            MQTT_ENDPOINT, MQTT_PORT, MQTT_KEEP_ALIVE, MQTT_COMMAND_TOPIC, MQTT_RESPONSE_TOPIC,
+            PRIVATE_KEY, CERTIFICATE, ROOT_CA, COMMAND_TIMEOUT, get_current_est_time
+        )
+    except ImportError:
+        from config.app_config import (
+            MQTT_ENDPOINT, MQTT_PORT, MQTT_KEEP_ALIVE, MQTT_COMMAND_TOPIC, MQTT_RESPONSE_TOPIC,
+            PRIVATE_KEY, CERTIFICATE, ROOT_CA, COMMAND_TIMEOUT, get_current_est_time
+        )
+
+logger = logging.getLogger(__name__)
+
+# Replies kept per command type and per reader for latency percentiles
+LATENCY_WINDOW = 500
+
+# Seconds between expiry sweeps and writes of outcomes
+FLUSH_INTERVAL = 1.0
+
+# Seconds to wait for the broker connection before giving up on a send
+CONNECT_TIMEOUT = 10
+
+
+def _now():
+    return get_current_est_time().replace(tzinfo=None)
+
+
+class PendingCommand:
+    """A sent command awaiting its reply"""
+
+    def __init__(self, command_id, reader_code, command_type, parameters, timeout, created_by=None):
+        self.id = command_id
+        self.reader_code = reader_code
+        self.command_type = command_type
+        self.parameters = parameters
+        self.created_by = created_by
+        self.created_at = _now()
+        self.sent_at = self.created_at
+        self.sent = time.monotonic()
+        self.deadline = self.sent + timeout
+        self.status = 'Sent'
+        self.latency_ms = None
+        self.response = None
+        self.error = None
+        self.completed_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the reply arrives or the command expires; returns True if it finished"""
+        return self._done.wait(timeout)
+
+    def __await__(self):
+        # Lets asyncio callers `await pending` without blocking their loop
+        return asyncio.get_running_loop().run_in_executor(None, self.wait).__await__()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'reader_code': self.reader_code,
+            'command_type': self.command_type,
+            'status': self.status,
+            'latency_ms': self.latency_ms,
+            'response': self.response,
+            'error': self.error
+        }
+
+    def _finish(self, status, latency_ms=None, response=None, error=None):
+        self.status = status
+        self.latency_ms = latency_ms
+        self.response = response
+        self.error = error
+        self.completed_at = _now()
+        self._done.set()
+
+    def _row(self):
+        """The reader_commands row for this command"""
+        return {
+            'id': self.id,
+            'batch_id': self.id,  # interactive commands are their own batch
+            'reader_code': self.reader_code,
+            'command_type': self.command_type,
+            'parameters': self.parameters,
+            'created_by': self.created_by,
+            'created_at': self.created_at,
+            'status': self.status,
+            'attempts': 1,
+            'sent_at': self.sent_at,
+            'completed_at': self.completed_at,
+            'latency_ms': self.latency_ms,
+            'response': self.response,
+            'error': self.error
+        }
+
+
+class CommandCorrelator:
+    """Matches replies to outstanding commands and tracks reply latency"""
+
+    def __init__(self, timeout=COMMAND_TIMEOUT, window=LATENCY_WINDOW, flush_interval=FLUSH_INTERVAL):
+        self.timeout = timeout
+        self.window = window
+        self.flush_interval = flush_interval
+
+        self._outstanding = {}  # command id -> PendingCommand
+        self._deadlines = []  # heap of (deadline, command id)
+        self._lock = threading.Lock()
+        # Flushes run one at a time, so a command's row is always inserted
+        # before its outcome is written
+        self._flush_lock = threading.Lock()
+        self._created = []  # rows to insert
+        self._finished = []  # rows to update
+
+        self._latency_by_type = defaultdict(lambda: deque(maxlen=self.window))
+        self._latency_by_reader = defaultdict(lambda: deque(maxlen=self.window))
+        self.matched = 0
+        self.unmatched = 0
+        self.expired = 0
+
+        self._client = None
+        self._connected = threading.Event()
+        self._thread = None
+
+    def send(self, reader_code, command_type, parameters=None, created_by=None, timeout=None):
+        """Publish a command to a reader and start tracking it; returns a PendingCommand"""
+        client = self._ensure_client()
+        pending = self.track(str(uuid.uuid4()), reader_code, command_type, parameters, timeout, created_by)
+        message = build_command(pending.id, command_type, reader_code, parameters)
+        client.publish(MQTT_COMMAND_TOPIC, json.dumps(message), qos=1)
+        return pending
+
+    def track(self, command_id, reader_code, command_type, parameters=None, timeout=None, created_by=None):
+        """Start tracking a command published elsewhere in this process"""
+        pending = PendingCommand(command_id, reader_code, command_type, parameters,
+                                 timeout or self.timeout, created_by)
+        with self._lock:
+            self._outstanding[command_id] = pending
+            heapq.heappush(self._deadlines, (pending.deadline, command_id))
+            self._created.append(pending._row())
+        self._ensure_thread()
+        return pending
+
+    def get(self, command_id):
+        """Get a command sent by this process that is still awaiting its reply, or None"""
+        with self._lock:
+            return self._outstanding.get(command_id)
+
+    def handle_message(self, payload):
+        """Resolve the command a raw reply belongs to (called on the MQTT thread)"""
+        try:
+            parsed = parse_response(json.loads(payload))
+        except (ValueError, UnicodeDecodeError):
+            logger.warning("Ignoring malformed command response")
+            return None
+        if not parsed:
+            return None
+        return self.resolve(*parsed)
+
+    def resolve(self, command_id, succeeded, body=None):
+        """Record the reply to a command; returns the PendingCommand, or None if it is not outstanding"""
+        received = time.monotonic()
+        with self._lock:
+            pending = self._outstanding.pop(command_id, None)
+            if pending is None:
+                self.unmatched += 1
+                return None
+
+            latency_ms = int((received - pending.sent) * 1000)
+            error = None
+            if not succeeded and isinstance(body, dict):
+                error = body.get('message') or body.get('error')
+            pending._finish('Succeeded' if succeeded else 'Failed', latency_ms, body, str(error) if error else None)
+
+            self.matched += 1
+            self._latency_by_type[pending.command_type].append(latency_ms)
+            self._latency_by_reader[pending.reader_code].append(latency_ms)
+            self._finished.append(pending._row())
+        return pending
+
+    def expire(self):
+        """Time out commands past their deadline; returns how many expired"""
+        now = time.monotonic()
+        count = 0
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, command_id = heapq.heappop(self._deadlines)
+                pending = self._outstanding.pop(command_id, None)
+                if pending is None:
+                    continue  # already answered
+                pending._finish('Timed Out', error="No reply before the deadline")
+                self._finished.append(pending._row())
+                count += 1
+            self.expired += count
+        return count
+
+    def flush(self):
+        """
+        Write new and finished commands to reader_commands.
+
+        Returns False if writing failed; the rows are kept and written by a
+        later flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                created, self._created = self._created, []
+                finished, self._finished = self._finished, []
+            if not created and not finished:
+                return True
+
+            db_service = DBService()
+            try:
+                db_service.create_reader_commands(created)
+                created = []
+                db_service.update_reader_commands(finished)
+                return True
+            except Exception as e:
+                logger.error(f"Error saving command outcomes: {e}")
+                with self._lock:
+                    self._created[:0] = created
+                    self._finished[:0] = finished
+                return False
+
+    def get_stats(self):
+        """Reply latency percentiles per command type and per reader, plus counters"""
+        with self._lock:
+            by_type = {key: list(values) for key, values in self._latency_by_type.items()}
+            by_reader = {key: list(values) for key, values in self._latency_by_reader.items()}
+            outstanding = len(self._outstanding)
+
+        return {
+            'outstanding': outstanding,
+            'matched': self.matched,
+            'unmatched': self.unmatched,
+            'expired': self.expired,
+            'command_types': {key: _latency_summary(values) for key, values in by_type.items()},
+            'readers': {key: _latency_summary(values) for key, values in by_reader.items()}
+        }
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='command-correlator', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.expire()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in command correlator: {e}", exc_info=True)
+
+    def _ensure_client(self):
+        """Connect to the broker on first use"""
+        with self._lock:
+            if self._client is None:
+                import paho.mqtt.client as mqtt
+
+                client = mqtt.Client(
+                    protocol=mqtt.MQTTv5,
+                    callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                    client_id="mdm-commands-" + str(uuid.uuid4())[-12:]
+                )
+                client.tls_set(
+                    ca_certs=ROOT_CA,
+                    certfile=CERTIFICATE,
+                    keyfile=PRIVATE_KEY,
+                    cert_reqs=ssl.CERT_REQUIRED,
+                    tls_version=ssl.PROTOCOL_TLSv1_2
+                )
+                client.on_connect = self._on_connect
+                client.on_subscribe = lambda *args: self._connected.set()
+                client.on_disconnect = lambda *args: self._connected.clear()
+                client.on_message = lambda client, userdata, msg: self.handle_message(msg.payload)
+                client.connect_async(MQTT_ENDPOINT, MQTT_PORT, MQTT_KEEP_ALIVE)
+                client.loop_start()
+                self._client = client
+
+        # Replies sent before the subscription is active would be missed
+        if not self._connected.wait(CONNECT_TIMEOUT):
+            raise ConnectionError(f"Not connected to {MQTT_ENDPOINT}")
+        return self._client
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code == 0:
+            client.subscribe(MQTT_RESPONSE_TOPIC, qos=1)
+        else:
+            logger.error(f"Command client connection refused: {reason_code}")
+
+
+def _latency_summary(values):
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+        'max_ms': max(values, default=None)
+    }
+
+
+# Shared by every request handled by this process
+correlator = CommandCorrelator()
@@ -0,0 +1,244 @@
+"""
+Bulk command dispatch to reader fleets.
+
+A dispatch sends one command to many readers over MQTT. At most
+max_in_flight commands await a reply at any time; a command that gets no
+reply within timeout seconds is resent (with the same command id, so a
+late reply still counts) up to max_retries times before it is marked
+timed out. Every command is a row in reader_commands, and state changes
+are written in batches while the dispatch runs.
+
+Replies arrive on the MQTT network thread through handle_response and are
+handed to the dispatching thread through a queue, so command state is
+only ever touched by one thread.
+"""
+import json
+import time
+import uuid
+import queue
+import logging
+from collections import deque
+
+try:
+    from pycube_mdm.config.app_config import (
+        MQTT_COMMAND_TOPIC, COMMAND_MAX_IN_FLIGHT, COMMAND_TIMEOUT, COMMAND_MAX_RETRIES, get_current_est_time
+    )
+except ImportError:
+    try:
+        from ..config.app_config import (
+            MQTT_COMMAND_TOPIC, COMMAND_MAX_IN_FLIGHT, COMMAND_TIMEOUT, COMMAND_MAX_RETRIES, get_current_est_time
+        )
+    except ImportError:
+        from config.app_config import (
+            MQTT_COMMAND_TOPIC, COMMAND_MAX_IN_FLIGHT, COMMAND_TIMEOUT, COMMAND_MAX_RETRIES, get_current_est_time
+        )
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of command state to the database
+FLUSH_INTERVAL = 1.0
+
+# Reply statuses that count as success
+SUCCESS_STATUSES = {'SUCCESS', 'OK', 'COMPLETED'}
+
+
+def build_command(command_id, command_type, target, parameters=None):
+    """Build a command message in the format readers expect"""
+    message = {
+        "command": {
+            "id": command_id,
+            "type": command_type,
+            "timestamp": get_current_est_time().isoformat(),
+            "target": target
+        }
+    }
+    if parameters:
+        message["command"]["parameters"] = parameters
+    return message
+
+
+def parse_response(data):
+    """
+    Get (command_id, succeeded, body) from a reply, or None if it is not one.
+
+    Readers reply either with {"response": "success", "command_id": ...,
+    "payload": {...}} or with {"response": {"command_id": ..., "status": ...}}.
+    """
+    response = data.get('response') if isinstance(data, dict) else None
+    if isinstance(response, str):
+        command_id = data.get('command_id')
+        return (command_id, response.upper() in SUCCESS_STATUSES, data.get('payload')) if command_id else None
+    if isinstance(response, dict) and response.get('command_id'):
+        return response['command_id'], str(response.get('status', '')).upper() in SUCCESS_STATUSES, response
+    return None
+
+
+def percentile(values, fraction):
+    """Get a percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(commands):
+    """Completion rate and reply latency for a list of commands (dicts or reader_commands rows)"""
+    counts = {'Pending': 0, 'Sent': 0, 'Succeeded': 0, 'Failed': 0, 'Timed Out': 0}
+    latencies = []
+    for command in commands:
+        counts[command['status']] += 1
+        if command['status'] in ('Succeeded', 'Failed') and command.get('latency_ms') is not None:
+            latencies.append(command['latency_ms'])
+
+    total = len(commands)
+    answered = counts['Succeeded'] + counts['Failed']
+    return {
+        'total': total,
+        'succeeded': counts['Succeeded'],
+        'failed': counts['Failed'],
+        'timed_out': counts['Timed Out'],
+        'outstanding': counts['Pending'] + counts['Sent'],
+        'completion_rate': round(answered / total * 100, 1) if total else 0.0,
+        'success_rate': round(counts['Succeeded'] / total * 100, 1) if total else 0.0,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': max(latencies, default=None)
+    }
+
+
+class CommandDispatcher:
+    """Sends a command to many readers with bounded concurrency, timeouts and retries"""
+
+    def __init__(self, client, db_service, topic=MQTT_COMMAND_TOPIC, max_in_flight=COMMAND_MAX_IN_FLIGHT,
+                 timeout=COMMAND_TIMEOUT, max_retries=COMMAND_MAX_RETRIES):
+        self.client = client  # connected paho client, subscribed to the response topic
+        self.db_service = db_service
+        self.topic = topic
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._responses = queue.Queue()
+        self._active = False
+
+    def handle_response(self, payload):
+        """Pass a reply from the response topic to the running dispatch (any thread)"""
+        if not self._active:
+            return
+        try:
+            parsed = parse_response(json.loads(payload))
+        except (ValueError, UnicodeDecodeError):
+            logger.warning("Ignoring malformed command response")
+            return
+        if parsed:
+            self._responses.put((time.monotonic(), parsed))
+
+    def dispatch(self, command_type, reader_codes, parameters=None, created_by=None, progress=None):
+        """
+        Send a command to every reader code and wait until each has replied
+        or timed out. progress, if given, is called with a summary now and
+        then. Returns (batch_id, commands).
+        """
+        batch_id = str(uuid.uuid4())
+        created_at = get_current_est_time().replace(tzinfo=None)
+        commands = {}
+        for reader_code in reader_codes:
+            command_id = str(uuid.uuid4())
+            commands[command_id] = {
+                'id': command_id,
+                'batch_id': batch_id,
+                'reader_code': reader_code,
+                'command_type': command_type,
+                'parameters': parameters,
+                'created_by': created_by,
+                'created_at': created_at,
+                'status': 'Pending',
+                'attempts': 0
+            }
+        self.db_service.create_reader_commands(list(commands.values()))
+        logger.info(f"Dispatching {command_type} to {len(commands)} readers (batch {batch_id})")
+
+        pending = deque(commands.values())
+        in_flight = {}  # command id -> monotonic deadline
+        dirty = set()
+        last_flush = time.monotonic()
+        self._active = True
+
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.max_in_flight:
+                    command = pending.popleft()
+                    self._send(command)
+                    in_flight[command['id']] = command['_sent'] + self.timeout
+                    dirty.add(command['id'])
+
+                # Wait for replies, but no longer than the nearest deadline
+                wait = max(min(in_flight.values()) - time.monotonic(), 0) if in_flight else 0
+                try:
+                    received_at, (command_id, succeeded, body) = self._responses.get(timeout=min(wait, FLUSH_INTERVAL))
+                    if command_id in in_flight:
+                        self._complete(commands[command_id], received_at, succeeded, body)
+                        del in_flight[command_id]
+                        dirty.add(command_id)
+                    else:
+                        logger.debug(f"Ignoring reply for command {command_id} not awaiting one")
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                for command_id, deadline in list(in_flight.items()):
+                    if now < deadline:
+                        continue
+                    command = commands[command_id]
+                    if command['attempts'] <= self.max_retries:
+                        logger.info(f"No reply from {command['reader_code']} for {command_id}, resending (attempt {command['attempts'] + 1})")
+                        self._send(command)
+                        in_flight[command_id] = command['_sent'] + self.timeout
+                    else:
+                        command['status'] = 'Timed Out'
+                        command['completed_at'] = get_current_est_time().replace(tzinfo=None)
+                        command['error'] = f"No reply after {command['attempts']} attempts"
+                        del in_flight[command_id]
+                    dirty.add(command_id)
+
+                if now - last_flush >= FLUSH_INTERVAL:
+                    self._flush(commands, dirty)
+                    last_flush = now
+                    if progress:
+                        progress(summarize(list(commands.values())))
+        finally:
+            self._active = False
+            self._flush(commands, dirty)
+
+        return batch_id, list(commands.values())
+
+    def _send(self, command):
+        message = build_command(command['id'], command['command_type'], command['reader_code'], command['parameters'])
+        result = self.client.publish(self.topic, json.dumps(message), qos=1)
+        if result.rc != 0:
+            # paho queues QoS 1 messages while reconnecting; the timeout resends otherwise
+            command['error'] = f"Publish failed with code {result.rc}"
+        command['attempts'] += 1
+        command['status'] = 'Sent'
+        command['sent_at'] = get_current_est_time().replace(tzinfo=None)
+        command['_sent'] = time.monotonic()
+
+    def _complete(self, command, received_at, succeeded, body):
+        command['status'] = 'Succeeded' if succeeded else 'Failed'
+        command['completed_at'] = get_current_est_time().replace(tzinfo=None)
+        command['latency_ms'] = int((received_at - command['_sent']) * 1000)
+        command['response'] = body
+        command['error'] = None
+        if not succeeded and isinstance(body, dict):
+            error = body.get('message') or body.get('error')
+            command['error'] = str(error) if error else None
+
+    def _flush(self, commands, dirty):
+        """Write changed commands; failures are retried on the next flush"""
+        if not dirty:
+            return
+        try:
+            self.db_service.update_reader_commands([commands[command_id] for command_id in dirty])
+            dirty.clear()
+        except Exception as e:
+            logger.error(f"Error saving command state: {e}")
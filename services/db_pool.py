@@ -0,0 +1,110 @@
+"""
+Connection pool for cooperative (gevent) web workers.
+
+mysql-connector's own pool raises PoolError as soon as every connection is
+in use, which with hundreds of concurrent requests per worker would happen
+all the time. This pool makes callers wait, up to timeout seconds, for a
+free connection instead. It is built on queue and threading primitives, so
+once gevent has monkey-patched the process a waiting request yields to the
+others rather than blocking the worker.
+
+Connections are opened on demand up to size, pinged before being handed
+out, and rolled back when returned. A connection returned with unread
+results is closed rather than reused.
+"""
+import sys
+import queue
+import logging
+import threading
+
+import mysql.connector
+from mysql.connector.errors import Error, PoolError
+
+logger = logging.getLogger(__name__)
+
+
+def is_cooperative():
+    """True when gevent has monkey-patched sockets in this process"""
+    monkey = sys.modules.get('gevent.monkey')
+    return bool(monkey and monkey.is_module_patched('socket'))
+
+
+class PooledConnection:
+    """A connection checked out of a CooperativeConnectionPool; close() returns it"""
+
+    __slots__ = ('_pool', '_connection')
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool._release(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CooperativeConnectionPool:
+    """A bounded pool whose get_connection() waits for a free connection"""
+
+    def __init__(self, size, timeout, **config):
+        self.size = size
+        self.timeout = timeout
+        self._config = config
+        self._idle = queue.LifoQueue()  # most recently used first, so idle extras go stale together
+        self._slots = threading.BoundedSemaphore(size)
+
+    def get_connection(self):
+        """Check out a connection, waiting up to timeout seconds for one to be free"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"No database connection free after {self.timeout}s (pool size {self.size})")
+
+        try:
+            connection = None
+            try:
+                connection = self._idle.get_nowait()
+                connection.ping(reconnect=True, attempts=1, delay=0)
+            except queue.Empty:
+                pass
+            except Error as e:
+                logger.warning(f"Discarding broken pooled connection: {e}")
+                self._discard(connection)
+                connection = None
+
+            if connection is None:
+                connection = mysql.connector.connect(**self._config)
+        except Exception:
+            self._slots.release()
+            raise
+
+        return PooledConnection(self, connection)
+
+    def _release(self, connection):
+        try:
+            if connection.unread_result:
+                # Draining an abandoned result set could take arbitrarily long
+                self._discard(connection)
+            else:
+                if connection.in_transaction:
+                    connection.rollback()
+                self._idle.put(connection)
+        except Error as e:
+            logger.warning(f"Discarding pooled connection after error: {e}")
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -6,69 +6,282 @@ import json
 from dotenv import load_dotenv
 import uuid
 import pytz
+import time
+import atexit
+import re
 import logging
+import threading
 
 # Import from configuration file
 try:
-    from pycube_mdm.config.app_config import MISSING_THRESHOLD, TIMEZONE, get_current_est_time
+    from pycube_mdm.config.app_config import (
+        MISSING_THRESHOLD, TIMEZONE, get_current_est_time,
+        QUERY_CACHE_ENABLED, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_VERSION_TTL, TABLE_VERSION_BUMP_INTERVAL,
+        EXPORT_FETCH_SIZE, EXPORT_NET_WRITE_TIMEOUT,
+        READER_OFFLINE_THRESHOLD,
+        DB_POOL_SIZE, DB_POOL_SIZE_COOPERATIVE, DB_POOL_TIMEOUT
+    )
 except ImportError:
     # Try relative import for when running within the package
     try:
-        from ..config.app_config import MISSING_THRESHOLD, TIMEZONE, get_current_est_time
+        from ..config.app_config import (
+            MISSING_THRESHOLD, TIMEZONE, get_current_est_time,
+            QUERY_CACHE_ENABLED, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_VERSION_TTL, TABLE_VERSION_BUMP_INTERVAL,
+            EXPORT_FETCH_SIZE, EXPORT_NET_WRITE_TIMEOUT,
+            READER_OFFLINE_THRESHOLD,
+            DB_POOL_SIZE, DB_POOL_SIZE_COOPERATIVE, DB_POOL_TIMEOUT
+        )
     except ImportError:
         # Fallback for direct script execution
-        from config.app_config import MISSING_THRESHOLD, TIMEZONE, get_current_est_time
+        from config.app_config import (
+            MISSING_THRESHOLD, TIMEZONE, get_current_est_time,
+            QUERY_CACHE_ENABLED, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_VERSION_TTL, TABLE_VERSION_BUMP_INTERVAL,
+            EXPORT_FETCH_SIZE, EXPORT_NET_WRITE_TIMEOUT,
+            READER_OFFLINE_THRESHOLD,
+            DB_POOL_SIZE, DB_POOL_SIZE_COOPERATIVE, DB_POOL_TIMEOUT
+        )
+
+from .device_search import build_search_filter, SEARCH_INDEX_NAME, SEARCH_COLUMNS
+from .query_cache import QueryCache, cached_query
+from .records import fetch_records, fetch_record, record_type
+from .db_pool import CooperativeConnectionPool, is_cooperative
 
 # Load environment variables from .env file
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever initialize_db() changes, so each database applies the change once
+SCHEMA_VERSION = 5
+
+# Named lock that keeps workers starting together from running the DDL at once
+SCHEMA_LOCK_NAME = 'pycube_mdm_schema'
+SCHEMA_LOCK_TIMEOUT = 60  # seconds
+
+# A device is stored in two rows: devices holds what is edited in the web
+# app, device_state the status, location and last read that ingest updates
+# many times a minute. Reads join them (d, ds) back into the devices columns.
+DEVICE_COLUMNS = """
+    d.id, d.serial_number, d.model, d.manufacturer, d.rfid_tag, d.barcode,
+    ds.status, d.hospital_id, ds.location_id, d.assigned_to, d.purchase_date,
+    d.last_maintenance_date, d.eol_date, d.eol_status, d.eol_notes, d.created_at,
+    GREATEST(COALESCE(d.updated_at, ds.updated_at), ds.updated_at) AS updated_at,
+    ds.last_seen_at, ds.last_reader_id
+"""
+DEVICE_STATE_JOIN = "JOIN device_state ds ON ds.device_id = d.id"
+
+# Every status the app stores in device_state.status: the tracking statuses
+# ingest sets and the assignment statuses set in the web app
+DEVICE_STATUSES = ('In-Facility', 'Missing', 'Temporarily Out', 'Available', 'In-Use', 'Maintenance')
+
 class DBService:
     """Service to handle database operations"""
     
     _instance = None
     _pool = None
+    _pool_pid = None
+    _pool_lock = threading.Lock()
+    _db_config = None
+    _search_index_available = None
+    _alert_seq_available = None
+    
+    # Per-process result cache for reference data, invalidated via table_versions
+    query_cache = QueryCache(
+        max_entries=QUERY_CACHE_MAX_ENTRIES,
+        version_ttl=QUERY_CACHE_VERSION_TTL,
+        enabled=QUERY_CACHE_ENABLED
+    )
+    
+    # Tables written by ingest since their versions were last bumped
+    _deferred_tables = set()
+    _deferred_lock = threading.Lock()
+    _deferred_thread = None
     
     def __new__(cls):
+        # The pool is created on first use, so importing and constructing
+        # the service (e.g. in a gunicorn master with --preload) is free
         if cls._instance is None:
             cls._instance = super(DBService, cls).__new__(cls)
-            cls._initialize_pool()
         return cls._instance
     
     @classmethod
-    def _initialize_pool(cls):
-        """Initialize connection pool to RDS"""
-        try:
-            # Get database config from environment variables
-            db_config = {
+    def _get_db_config(cls):
+        """Get database config from environment variables"""
+        if cls._db_config is None:
+            cls._db_config = {
                 'host': os.environ.get('RDS_HOST', 'localhost'),
                 'port': int(os.environ.get('RDS_PORT', 3306)),
                 'user': os.environ.get('RDS_USER', 'root'),
                 'password': os.environ.get('RDS_PASSWORD', 'password'),
                 'database': os.environ.get('RDS_DB', 'pycube_mdm'),
             }
-            
-            # Create a connection pool
-            cls._pool = pooling.MySQLConnectionPool(
-                pool_name="pycube_pool",
-                pool_size=5,
-                **db_config
-            )
-            print("Connection pool created successfully")
-        except Exception as e:
-            print(f"Error initializing DB pool: {e}")
+            if is_cooperative():
+                # The C extension does its socket I/O outside Python, where
+                # gevent cannot switch to another request while it waits
+                cls._db_config['use_pure'] = True
+        return cls._db_config
+    
+    @classmethod
+    def _initialize_pool(cls):
+        """Initialize connection pool to RDS"""
+        with cls._pool_lock:
+            # A pool inherited from the parent of a forked worker shares its
+            # sockets, so every process builds its own
+            if cls._pool is not None and cls._pool_pid == os.getpid():
+                return
+            
+            try:
+                if is_cooperative():
+                    # gevent workers run many requests at once; they wait for a
+                    # free connection instead of failing when all are in use
+                    cls._pool = CooperativeConnectionPool(
+                        size=DB_POOL_SIZE_COOPERATIVE,
+                        timeout=DB_POOL_TIMEOUT,
+                        **cls._get_db_config()
+                    )
+                else:
+                    cls._pool = pooling.MySQLConnectionPool(
+                        pool_name="pycube_pool",
+                        pool_size=DB_POOL_SIZE,
+                        **cls._get_db_config()
+                    )
+                cls._pool_pid = os.getpid()
+                print("Connection pool created successfully")
+            except Exception as e:
+                cls._pool = None
+                print(f"Error initializing DB pool: {e}")
     
     def get_connection(self):
-        """Get a connection from the pool"""
+        """Get a connection from the pool, creating the pool on first use"""
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._initialize_pool()
         if self._pool:
             return self._pool.get_connection()
         else:
             raise Exception("Database pool not initialized")
     
-    def initialize_db(self):
-        """Create tables if they don't exist"""
-        connection = self.get_connection()
+    def get_streaming_connection(self):
+        """
+        Open a dedicated connection for long-running streaming reads.
+        
+        Exports can hold a connection for minutes, so they get their own
+        connection instead of tying up one of the pooled ones.
+        """
+        connection = mysql.connector.connect(**self._get_db_config())
+        cursor = connection.cursor()
+        try:
+            # Rows are only read as fast as the HTTP client consumes them
+            cursor.execute("SET SESSION net_write_timeout = %s", (EXPORT_NET_WRITE_TIMEOUT,))
+        finally:
+            cursor.close()
+        return connection
+    
+    def _stream_query(self, query, params=(), fetch_size=None):
+        """
+        Yield rows of a query one at a time from an unbuffered cursor.
+        
+        Rows are pulled from the server fetch_size at a time, so memory use
+        stays constant however many rows the query returns.
+        """
+        fetch_size = fetch_size or EXPORT_FETCH_SIZE
+        connection = self.get_streaming_connection()
+        cursor = connection.cursor(buffered=False)
+        finished = False
+        
+        try:
+            cursor.execute(query, tuple(params))
+            # Tuple rows with one shared column index instead of a dict per row
+            record = record_type(cursor.column_names)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield record(row)
+            finished = True
+        finally:
+            # If the consumer stopped early there are unread rows on the wire;
+            # dropping the connection is much cheaper than draining them
+            try:
+                if finished:
+                    cursor.close()
+                connection.close()
+            except Exception as e:
+                print(f"Error closing streaming connection: {e}")
+    
+    def _stream_query_batches(self, query, params=(), fetch_size=None):
+        """Yield the rows of a query as lists of tuples, fetch_size rows at a time"""
+        fetch_size = fetch_size or EXPORT_FETCH_SIZE
+        connection = self.get_streaming_connection()
+        cursor = connection.cursor(buffered=False)
+        finished = False
+        
+        try:
+            cursor.execute(query, tuple(params))
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield rows
+            finished = True
+        finally:
+            try:
+                if finished:
+                    cursor.close()
+                connection.close()
+            except Exception as e:
+                print(f"Error closing streaming connection: {e}")
+    
+    def ensure_schema(self):
+        """
+        Run initialize_db() only if the database's schema_version is older
+        than SCHEMA_VERSION.
+        
+        When the schema is current this is one single-row query on a
+        connection of its own, so app startup takes no DDL metadata locks
+        and creates no pool. Returns True if initialize_db() ran.
+        """
+        connection = mysql.connector.connect(**self._get_db_config())
+        cursor = connection.cursor()
+        
+        try:
+            if self._schema_is_current(cursor):
+                return False
+            
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK_NAME, SCHEMA_LOCK_TIMEOUT))
+            if not cursor.fetchone()[0]:
+                raise Exception(f"Timed out waiting for schema lock {SCHEMA_LOCK_NAME}")
+            try:
+                # Another worker may have finished the upgrade while we waited
+                if self._schema_is_current(cursor):
+                    return False
+                print(f"Schema is behind version {SCHEMA_VERSION}, initializing database")
+                return self.initialize_db(connection)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK_NAME,))
+                cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def _schema_is_current(self, cursor):
+        """Check the schema_version row against SCHEMA_VERSION"""
+        try:
+            cursor.execute("SELECT version FROM schema_version WHERE id = 1")
+            row = cursor.fetchone()
+        except mysql.connector.errors.ProgrammingError:
+            return False  # table not created yet
+        return row is not None and row[0] >= SCHEMA_VERSION
+    
+    def initialize_db(self, connection=None):
+        """
+        Create tables if they don't exist and record SCHEMA_VERSION.
+        
+        Uses the given connection, or one from the pool. Returns True on
+        success.
+        """
+        own_connection = connection is None
+        connection = connection or self.get_connection()
         cursor = connection.cursor()
         
         try:
@@ -149,9 +362,7 @@ class DBService:
                     manufacturer VARCHAR(100),
                     rfid_tag VARCHAR(100) UNIQUE,
                     barcode VARCHAR(100) UNIQUE,
-                    status ENUM('In-Facility', 'Missing', 'Temporarily Out') DEFAULT 'In-Facility',
                     hospital_id VARCHAR(36),
-                    location_id VARCHAR(36),
                     assigned_to VARCHAR(100),
                     purchase_date DATE,
                     last_maintenance_date DATE,
@@ -160,10 +371,27 @@ class DBService:
                     eol_notes TEXT,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
-                    FOREIGN KEY (location_id) REFERENCES locations(id)
+                    FOREIGN KEY (hospital_id) REFERENCES hospitals(id)
+                )
+            """)
+            
+            # Create device_state table (tracking columns of devices, one narrow row per device)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS device_state (
+                    device_id VARCHAR(36) PRIMARY KEY,
+                    status ENUM('In-Facility', 'Missing', 'Temporarily Out', 'Available', 'In-Use', 'Maintenance')
+                        NOT NULL DEFAULT 'In-Facility',
+                    location_id VARCHAR(36),
+                    last_reader_id VARCHAR(36),
+                    last_seen_at DATETIME,
+                    updated_at DATETIME NOT NULL,
+                    FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE,
+                    FOREIGN KEY (location_id) REFERENCES locations(id),
+                    INDEX idx_device_state_status (status, updated_at)
                 )
             """)
+            self._migrate_device_state(cursor)
+            self._ensure_device_statuses(cursor)
             
             # Create users table (depends on hospitals)
             cursor.execute("""
@@ -222,6 +450,7 @@ class DBService:
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS rfid_alerts (
                     id VARCHAR(36) PRIMARY KEY,
+                    seq BIGINT UNSIGNED NOT NULL AUTO_INCREMENT UNIQUE,
                     device_id VARCHAR(36),
                     reader_id VARCHAR(36),
                     hospital_id VARCHAR(36),
@@ -238,16 +467,407 @@ class DBService:
                 )
             """)
 
+            # Create reader_uptime_intervals table (one row per run of consecutive heartbeats)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS reader_uptime_intervals (
+                    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                    reader_id VARCHAR(36) NOT NULL,
+                    started_at DATETIME NOT NULL,
+                    ended_at DATETIME NOT NULL,
+                    FOREIGN KEY (reader_id) REFERENCES readers(id) ON DELETE CASCADE,
+                    INDEX idx_reader_uptime_ended (reader_id, ended_at)
+                )
+            """)
+
+            # Create reader_commands table (one row per command sent to a reader)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS reader_commands (
+                    id VARCHAR(36) PRIMARY KEY,
+                    batch_id VARCHAR(36) NOT NULL,
+                    reader_code VARCHAR(100) NOT NULL,
+                    command_type VARCHAR(64) NOT NULL,
+                    parameters TEXT,
+                    status ENUM('Pending', 'Sent', 'Succeeded', 'Failed', 'Timed Out') NOT NULL DEFAULT 'Pending',
+                    attempts INT NOT NULL DEFAULT 0,
+                    response TEXT,
+                    error VARCHAR(255),
+                    created_by VARCHAR(36),
+                    created_at DATETIME NOT NULL,
+                    sent_at DATETIME,
+                    completed_at DATETIME,
+                    latency_ms INT,
+                    INDEX idx_reader_commands_batch (batch_id, status),
+                    INDEX idx_reader_commands_reader (reader_code, created_at)
+                )
+            """)
+
+            # Create alert_rules table (conditions evaluated on device movements by the ingest client)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS alert_rules (
+                    id VARCHAR(36) PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    hospital_id VARCHAR(36),
+                    location_id VARCHAR(36),
+                    reader_id VARCHAR(36),
+                    status ENUM('In-Facility', 'Missing', 'Temporarily Out'),
+                    start_time TIME,
+                    end_time TIME,
+                    window_seconds INT NOT NULL DEFAULT 0,
+                    threshold INT NOT NULL DEFAULT 1,
+                    group_by ENUM('rule', 'hospital', 'location', 'device') NOT NULL DEFAULT 'rule',
+                    count_distinct ENUM('read', 'device', 'hospital') NOT NULL DEFAULT 'device',
+                    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+                    created_by VARCHAR(36),
+                    created_at DATETIME NOT NULL,
+                    updated_at DATETIME NOT NULL,
+                    FOREIGN KEY (hospital_id) REFERENCES hospitals(id) ON DELETE CASCADE,
+                    FOREIGN KEY (location_id) REFERENCES locations(id) ON DELETE CASCADE,
+                    FOREIGN KEY (reader_id) REFERENCES readers(id) ON DELETE CASCADE
+                )
+            """)
+            
+            # Create rule_alerts table (one row each time an alert rule triggers)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS rule_alerts (
+                    id VARCHAR(36) PRIMARY KEY,
+                    rule_id VARCHAR(36) NOT NULL,
+                    device_id VARCHAR(36),
+                    reader_id VARCHAR(36),
+                    hospital_id VARCHAR(36),
+                    location_id VARCHAR(36),
+                    match_count INT NOT NULL DEFAULT 1,
+                    triggered_at DATETIME NOT NULL,
+                    FOREIGN KEY (rule_id) REFERENCES alert_rules(id) ON DELETE CASCADE,
+                    INDEX idx_rule_alerts_rule (rule_id, triggered_at),
+                    INDEX idx_rule_alerts_hospital (hospital_id, triggered_at)
+                )
+            """)
+
+            # Create device_utilization_daily table (cached daily assignment totals per device, model, department and hospital)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS device_utilization_daily (
+                    day DATE NOT NULL,
+                    hospital_id VARCHAR(36) NOT NULL,
+                    scope ENUM('hospital', 'model', 'department', 'device') NOT NULL,
+                    scope_key VARCHAR(100) NOT NULL,
+                    assigned_seconds INT NOT NULL DEFAULT 0,
+                    assignments INT NOT NULL DEFAULT 0,
+                    peak_concurrent INT NOT NULL DEFAULT 0,
+                    computed_at DATETIME NOT NULL,
+                    PRIMARY KEY (hospital_id, day, scope, scope_key)
+                )
+            """)
+
+            # Create table_versions table (bumped on writes to invalidate cached queries)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS table_versions (
+                    table_name VARCHAR(64) PRIMARY KEY,
+                    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+                    updated_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+                )
+            """)
+            
+            # Monotonic cursor used to tail new alerts for live updates. Adding it
+            # to an existing table rebuilds the table, so that is left to
+            # scripts/migrate_alert_seq.py rather than done at startup
+            if not self._has_column(cursor, 'rfid_alerts', 'seq'):
+                print("rfid_alerts.seq is missing: live updates are off until scripts/migrate_alert_seq.py is run")
+            
+            # Add the ngram FULLTEXT index used by device search
+            self._ensure_device_search_index(cursor)
+            
+            # Range scans of one hospital's history (dwell analytics)
+            self._ensure_index(cursor, 'reader_events', 'idx_reader_events_hospital_time', 'hospital_id, timestamp')
+            self._ensure_index(cursor, 'rfid_alerts', 'idx_rfid_alerts_hospital_time', 'hospital_id, timestamp')
+            self._ensure_index(cursor, 'device_assignments', 'idx_device_assignments_assigned', 'assigned_at')
+            
+            # Record the schema version last, so a failed run is retried on the next start
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    id TINYINT PRIMARY KEY,
+                    version INT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                INSERT INTO schema_version (id, version) VALUES (1, %s)
+                ON DUPLICATE KEY UPDATE version = GREATEST(version, VALUES(version))
+            """, (SCHEMA_VERSION,))
+
             connection.commit()
             print("All tables created successfully!")
+            return True
             
         except Exception as e:
             print(f"Error initializing database: {e}")
             connection.rollback()
+            return False
+        finally:
+            cursor.close()
+            if own_connection:
+                connection.close()
+    
+    def _has_column(self, cursor, table_name, column_name):
+        cursor.execute("""
+            SELECT COUNT(*) as count
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE()
+            AND table_name = %s
+            AND column_name = %s
+        """, (table_name, column_name))
+        row = cursor.fetchone()
+        return (row['count'] if isinstance(row, dict) else row[0]) > 0
+    
+    def _ensure_column(self, cursor, table_name, column_name, definition):
+        """Add a column to an existing table if it isn't there yet"""
+        if not self._has_column(cursor, table_name, column_name):
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}")
+            print(f"Added column {table_name}.{column_name}")
+    
+    def _column_type(self, cursor, table_name, column_name):
+        """The full type of a column, e.g. enum('a','b') or varchar(50), or None if it doesn't exist"""
+        cursor.execute("""
+            SELECT column_type
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE()
+            AND table_name = %s
+            AND column_name = %s
+        """, (table_name, column_name))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return row['column_type'] if isinstance(row, dict) else row[0]
+    
+    def _migrate_device_state(self, cursor):
+        """Move the tracking columns of devices created before device_state into it"""
+        status_type = self._column_type(cursor, 'devices', 'status')
+        if status_type is None:
+            return
+        
+        # The old column may have been altered to hold more statuses than the
+        # original ENUM; copy into the same type so no value is lost
+        if self._column_type(cursor, 'device_state', 'status') != status_type:
+            cursor.execute(f"ALTER TABLE device_state MODIFY status {status_type} NOT NULL DEFAULT 'In-Facility'")
+        
+        # Columns added in schema version 2 may not exist yet
+        last_read = [f"d.{column}" if self._has_column(cursor, 'devices', column) else 'NULL'
+                     for column in ('last_reader_id', 'last_seen_at')]
+        # A plain INSERT, so a value that doesn't fit fails the migration
+        # before devices.status is dropped; devices copied by an earlier,
+        # interrupted run are skipped
+        cursor.execute(f"""
+            INSERT INTO device_state (device_id, status, location_id, last_reader_id, last_seen_at, updated_at)
+            SELECT d.id, COALESCE(d.status, 'In-Facility'), d.location_id, {last_read[0]}, {last_read[1]},
+                   COALESCE(d.updated_at, d.created_at, NOW())
+            FROM devices d
+            LEFT JOIN device_state ds ON ds.device_id = d.id
+            WHERE ds.device_id IS NULL
+        """)
+        print(f"Copied tracking state of {cursor.rowcount} devices to device_state")
+        
+        cursor.execute("""
+            SELECT constraint_name
+            FROM information_schema.key_column_usage
+            WHERE table_schema = DATABASE()
+            AND table_name = 'devices'
+            AND column_name = 'location_id'
+            AND referenced_table_name IS NOT NULL
+        """)
+        for row in cursor.fetchall():
+            constraint = row['constraint_name'] if isinstance(row, dict) else row[0]
+            cursor.execute(f"ALTER TABLE devices DROP FOREIGN KEY {constraint}")
+        
+        columns = [column for column in ('status', 'location_id', 'last_seen_at', 'last_reader_id')
+                   if self._has_column(cursor, 'devices', column)]
+        cursor.execute(f"ALTER TABLE devices {', '.join(f'DROP COLUMN {column}' for column in columns)}")
+        print(f"Moved devices.{', devices.'.join(columns)} to device_state")
+    
+    def _ensure_device_statuses(self, cursor):
+        """Add the statuses the app writes to a device_state.status ENUM that lacks them"""
+        status_type = self._column_type(cursor, 'device_state', 'status')
+        if not status_type or not status_type.lower().startswith('enum('):
+            return
+        
+        values = [value.replace("''", "'") for value in re.findall(r"'((?:[^']|'')*)'", status_type)]
+        missing = [status for status in DEVICE_STATUSES if status not in values]
+        if not missing:
+            return
+        
+        # Existing values keep their place, so MySQL doesn't rewrite the rows
+        cursor.execute(f"""
+            ALTER TABLE device_state MODIFY status
+            ENUM({', '.join(['%s'] * (len(values) + len(missing)))}) NOT NULL DEFAULT 'In-Facility'
+        """, values + missing)
+        print(f"Added {', '.join(missing)} to device_state.status")
+    
+    def _ensure_index(self, cursor, table_name, index_name, columns):
+        """Add an index to an existing table if it isn't there yet"""
+        cursor.execute("""
+            SELECT COUNT(*) as count
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+            AND table_name = %s
+            AND index_name = %s
+        """, (table_name, index_name))
+        row = cursor.fetchone()
+        count = row['count'] if isinstance(row, dict) else row[0]
+        
+        if count == 0:
+            cursor.execute(f"ALTER TABLE {table_name} ADD INDEX {index_name} ({columns})")
+            print(f"Added index {table_name}.{index_name}")
+    
+    def _ensure_device_search_index(self, cursor):
+        """Create the FULLTEXT ngram index on devices if it doesn't exist"""
+        try:
+            if self._device_search_index_exists(cursor):
+                return
+            
+            # Stopwords are read when the index is built; disable them so
+            # ngrams like 'in' or 'at' inside serial numbers still get indexed
+            cursor.execute("SET SESSION innodb_ft_enable_stopword = 0")
+            cursor.execute(f"""
+                ALTER TABLE devices
+                ADD FULLTEXT INDEX {SEARCH_INDEX_NAME} ({', '.join(SEARCH_COLUMNS)})
+                WITH PARSER ngram
+            """)
+            DBService._search_index_available = True
+            print("Device search index created successfully")
+        except Exception as e:
+            # Search still works without the index, it just falls back to LIKE
+            DBService._search_index_available = False
+            print(f"Error creating device search index: {e}")
+    
+    def _device_search_index_exists(self, cursor):
+        """Check whether the device search index exists in the current schema"""
+        cursor.execute("""
+            SELECT COUNT(*) as count
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+            AND table_name = 'devices'
+            AND index_name = %s
+        """, (SEARCH_INDEX_NAME,))
+        row = cursor.fetchone()
+        count = row['count'] if isinstance(row, dict) else row[0]
+        DBService._search_index_available = count > 0
+        return DBService._search_index_available
+    
+    def _get_device_search_filter(self, cursor, search_query, alias='d'):
+        """Build the search filter, checking index availability once per process"""
+        if DBService._search_index_available is None:
+            try:
+                self._device_search_index_exists(cursor)
+            except Exception as e:
+                print(f"Error checking device search index: {e}")
+                DBService._search_index_available = False
+        
+        return build_search_filter(search_query, alias=alias, use_index=DBService._search_index_available)
+    
+    # Query cache support
+    def get_table_versions(self):
+        """Get the current change version of every tracked table"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("SELECT table_name, version FROM table_versions")
+            return {table_name: version for table_name, version in cursor.fetchall()}
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def bump_table_versions(self, cursor, *tables):
+        """Record a write to the given tables as part of the caller's transaction"""
+        cursor.executemany("""
+            INSERT INTO table_versions (table_name, version)
+            VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """, [(table,) for table in tables])
+        
+        # Make this worker re-read versions instead of waiting for the TTL
+        self.query_cache.invalidate()
+    
+    def defer_table_versions(self, *tables):
+        """
+        Record a write to the given tables, bumped later outside the caller's transaction.
+        
+        Ingest writes many times a second; bumping table_versions in each of
+        its transactions would serialize them on the same rows and change
+        every ETag on every read. Instead the tables are collected and bumped
+        once every TABLE_VERSION_BUMP_INTERVAL seconds by a background thread.
+        """
+        with DBService._deferred_lock:
+            DBService._deferred_tables.update(tables)
+            thread = DBService._deferred_thread
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._bump_deferred_loop, name='table-versions', daemon=True)
+                DBService._deferred_thread = thread
+                thread.start()
+    
+    def flush_deferred_table_versions(self):
+        """Bump the versions of the tables recorded by defer_table_versions()"""
+        with DBService._deferred_lock:
+            tables = DBService._deferred_tables
+            DBService._deferred_tables = set()
+        if not tables:
+            return
+        
+        try:
+            connection = self.get_connection()
+            cursor = connection.cursor()
+            try:
+                self.bump_table_versions(cursor, *sorted(tables))
+                connection.commit()
+            finally:
+                cursor.close()
+                connection.close()
+        except Exception:
+            # Try again on the next tick
+            with DBService._deferred_lock:
+                DBService._deferred_tables.update(tables)
+            raise
+    
+    def _bump_deferred_loop(self):
+        # Bump what is left when the process exits normally
+        atexit.register(self._bump_deferred_at_exit)
+        while True:
+            time.sleep(TABLE_VERSION_BUMP_INTERVAL)
+            try:
+                self.flush_deferred_table_versions()
+            except Exception as e:
+                logger.warning(f"Could not bump deferred table versions: {e}")
+    
+    def _bump_deferred_at_exit(self):
+        try:
+            self.flush_deferred_table_versions()
+        except Exception as e:
+            logger.warning(f"Could not bump deferred table versions at exit: {e}")
+    
+    def get_table_change_info(self, tables):
+        """Get (version, last modified epoch seconds) for each of the given tables"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            placeholders = ', '.join(['%s'] * len(tables))
+            cursor.execute(f"""
+                SELECT table_name, version, UNIX_TIMESTAMP(updated_at)
+                FROM table_versions
+                WHERE table_name IN ({placeholders})
+            """, tuple(tables))
+            
+            # Tables that have never been written to are reported as version 0
+            info = {table: (0, None) for table in tables}
+            for table_name, version, modified_at in cursor.fetchall():
+                info[table_name] = (version, float(modified_at) if modified_at is not None else None)
+            return info
         finally:
             cursor.close()
             connection.close()
     
+    def get_cache_stats(self):
+        """Get query cache hit/miss statistics for this worker"""
+        return self.query_cache.get_stats()
+    
     # Device CRUD operations
     def create_device(self, device):
         """Create a new device record"""
@@ -258,21 +878,26 @@ class DBService:
             query = """
                 INSERT INTO devices (
                     id, serial_number, model, manufacturer, rfid_tag, barcode,
-                    status, hospital_id, location_id, assigned_to, purchase_date, 
+                    hospital_id, assigned_to, purchase_date, 
                     last_maintenance_date, eol_date, eol_status, eol_notes,
                     created_at, updated_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             
             values = (
                 device.id, device.serial_number, device.model, device.manufacturer,
-                device.rfid_tag, device.barcode, device.status, device.hospital_id,
-                device.location_id, device.assigned_to, device.purchase_date,
+                device.rfid_tag, device.barcode, device.hospital_id,
+                device.assigned_to, device.purchase_date,
                 device.last_maintenance_date, device.eol_date, device.eol_status,
                 device.eol_notes, device.created_at, device.updated_at
             )
             
             cursor.execute(query, values)
+            cursor.execute("""
+                INSERT INTO device_state (device_id, status, location_id, updated_at)
+                VALUES (%s, %s, %s, %s)
+            """, (device.id, device.status or 'In-Facility', device.location_id, device.updated_at))
+            self.bump_table_versions(cursor, 'devices')
             connection.commit()
             return device.id
         except Exception as e:
@@ -289,11 +914,12 @@ class DBService:
         cursor = connection.cursor(dictionary=True)
         
         try:
-            query = """
-                SELECT d.*, h.name as hospital_name, l.name as location_name
+            query = f"""
+                SELECT {DEVICE_COLUMNS}, h.name as hospital_name, l.name as location_name
                 FROM devices d
+                {DEVICE_STATE_JOIN}
                 LEFT JOIN hospitals h ON d.hospital_id = h.id
-                LEFT JOIN locations l ON d.location_id = l.id
+                LEFT JOIN locations l ON ds.location_id = l.id
                 WHERE d.id = %s
             """
             cursor.execute(query, (device_id,))
@@ -309,19 +935,19 @@ class DBService:
     def get_device_by_rfid(self, rfid_tag):
         """Get a device by RFID tag"""
         connection = self.get_connection()
-        cursor = connection.cursor(dictionary=True)
+        cursor = connection.cursor()
         
         try:
-            query = """
-                SELECT d.*, h.name as hospital_name, l.name as location_name
+            query = f"""
+                SELECT {DEVICE_COLUMNS}, h.name as hospital_name, l.name as location_name
                 FROM devices d
+                {DEVICE_STATE_JOIN}
                 LEFT JOIN hospitals h ON d.hospital_id = h.id
-                LEFT JOIN locations l ON d.location_id = l.id
+                LEFT JOIN locations l ON ds.location_id = l.id
                 WHERE d.rfid_tag = %s
             """
             cursor.execute(query, (rfid_tag,))
-            result = cursor.fetchone()
-            return result
+            return fetch_record(cursor)
         except Exception as e:
             print(f"Error retrieving device by RFID: {e}")
             raise
@@ -335,11 +961,12 @@ class DBService:
         cursor = connection.cursor(dictionary=True)
         
         try:
-            query = """
-                SELECT d.*, h.name as hospital_name, l.name as location_name
+            query = f"""
+                SELECT {DEVICE_COLUMNS}, h.name as hospital_name, l.name as location_name
                 FROM devices d
+                {DEVICE_STATE_JOIN}
                 LEFT JOIN hospitals h ON d.hospital_id = h.id
-                LEFT JOIN locations l ON d.location_id = l.id
+                LEFT JOIN locations l ON ds.location_id = l.id
                 WHERE d.barcode = %s
             """
             cursor.execute(query, (barcode,))
@@ -355,7 +982,7 @@ class DBService:
     def get_all_devices(self, limit=100, offset=0, status=None, sort_by=None, sort_dir='asc', search_query=None):
         """Get all devices with optional filtering and sorting"""
         connection = self.get_connection()
-        cursor = connection.cursor(dictionary=True)
+        cursor = connection.cursor()
         
         try:
             # Define valid sort columns and their SQL equivalents
@@ -367,31 +994,40 @@ class DBService:
                 'created_at': 'created_at'
             }
             
+            # Search by serial number, barcode, EPC code, model or assignee
+            search_filter = self._get_device_search_filter(cursor, search_query) if search_query else None
+            
             # Base query
-            query = "SELECT * FROM devices"
             params = []
+            if search_filter:
+                query = f"SELECT {DEVICE_COLUMNS}, {search_filter[2]} as search_score FROM devices d {DEVICE_STATE_JOIN}"
+                params.extend(search_filter[3])
+            else:
+                query = f"SELECT {DEVICE_COLUMNS} FROM devices d {DEVICE_STATE_JOIN}"
             
             # Build WHERE clause conditionally
             where_clauses = []
             
             # Add status filter if provided
             if status:
-                where_clauses.append("status = %s")
+                where_clauses.append("ds.status = %s")
                 params.append(status)
             
-            # Add search filter if provided (search by serial number)
-            if search_query:
-                where_clauses.append("serial_number LIKE %s")
-                params.append(f'%{search_query}%')
+            # Add search filter if provided
+            if search_filter:
+                where_clauses.append(search_filter[0])
+                params.extend(search_filter[1])
             
             # Combine WHERE clauses if any
             if where_clauses:
                 query += " WHERE " + " AND ".join(where_clauses)
             
-            # Add sorting if valid column is provided
+            # Add sorting if valid column is provided, otherwise rank search results
             if sort_by and sort_by in valid_sort_columns:
                 sort_dir = sort_dir.upper() if sort_dir.lower() in ['asc', 'desc'] else 'ASC'
                 query += f" ORDER BY {valid_sort_columns[sort_by]} {sort_dir}, id ASC"
+            elif search_filter:
+                query += " ORDER BY search_score DESC, created_at DESC, id ASC"
             else:
                 query += " ORDER BY created_at DESC, id ASC"
             
@@ -400,8 +1036,7 @@ class DBService:
             params.extend([int(limit), int(offset)])
             
             cursor.execute(query, params)
-            result = cursor.fetchall()
-            return result
+            return fetch_records(cursor)
         except Exception as e:
             print(f"Error retrieving devices: {e}")
             raise
@@ -409,6 +1044,43 @@ class DBService:
             cursor.close()
             connection.close()
     
+    def search_devices(self, search_query, status=None, limit=10, offset=0):
+        """Search devices across serial, barcode, EPC, model and assignee, best matches first"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            search_filter = self._get_device_search_filter(cursor, search_query)
+            if not search_filter:
+                return []
+            
+            query = f"""
+                SELECT {DEVICE_COLUMNS}, h.name as hospital_name, l.name as location_name,
+                       {search_filter[2]} as search_score
+                FROM devices d
+                {DEVICE_STATE_JOIN}
+                LEFT JOIN hospitals h ON d.hospital_id = h.id
+                LEFT JOIN locations l ON ds.location_id = l.id
+                WHERE {search_filter[0]}
+            """
+            params = list(search_filter[3]) + list(search_filter[1])
+            
+            if status:
+                query += " AND ds.status = %s"
+                params.append(status)
+            
+            query += " ORDER BY search_score DESC, d.serial_number ASC LIMIT %s OFFSET %s"
+            params.extend([int(limit), int(offset)])
+            
+            cursor.execute(query, params)
+            return fetch_records(cursor)
+        except Exception as e:
+            print(f"Error searching devices: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
     def update_device(self, device):
         """Update a device record"""
         connection = self.get_connection()
@@ -416,7 +1088,7 @@ class DBService:
         
         try:
             # First get existing device data
-            cursor.execute("SELECT * FROM devices WHERE id = %s", (device.id,))
+            cursor.execute(f"SELECT {DEVICE_COLUMNS} FROM devices d {DEVICE_STATE_JOIN} WHERE d.id = %s", (device.id,))
             existing_device = cursor.fetchone()
             
             if not existing_device:
@@ -430,9 +1102,7 @@ class DBService:
                     manufacturer = %s,
                     rfid_tag = %s,
                     barcode = %s,
-                    status = %s,
                     hospital_id = %s,
-                    location_id = %s,
                     assigned_to = %s,
                     purchase_date = %s,
                     last_maintenance_date = %s,
@@ -449,9 +1119,7 @@ class DBService:
                 device.manufacturer or existing_device['manufacturer'],
                 device.rfid_tag or existing_device['rfid_tag'],
                 device.barcode or existing_device['barcode'],
-                device.status or existing_device['status'],
                 device.hospital_id or existing_device['hospital_id'],
-                device.location_id or existing_device['location_id'],
                 device.assigned_to if device.assigned_to is not None else existing_device['assigned_to'],
                 device.purchase_date or existing_device['purchase_date'],
                 device.last_maintenance_date or existing_device['last_maintenance_date'],
@@ -463,8 +1131,21 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            updated = cursor.rowcount > 0
+            
+            # Only touch the tracking row (which ingest updates) if the edit changes it
+            status = device.status or existing_device['status']
+            location_id = device.location_id or existing_device['location_id']
+            if (status, location_id) != (existing_device['status'], existing_device['location_id']):
+                cursor.execute("""
+                    UPDATE device_state
+                    SET status = %s, location_id = %s, updated_at = %s
+                    WHERE device_id = %s
+                """, (status, location_id, datetime.now(TIMEZONE), device.id))
+                updated = True
+            self.bump_table_versions(cursor, 'devices')
             connection.commit()
-            return cursor.rowcount > 0
+            return updated
         except Exception as e:
             connection.rollback()
             print(f"Error updating device: {e}")
@@ -481,8 +1162,10 @@ class DBService:
         try:
             query = "DELETE FROM devices WHERE id = %s"
             cursor.execute(query, (device_id,))
+            deleted = cursor.rowcount > 0
+            self.bump_table_versions(cursor, 'devices')
             connection.commit()
-            return cursor.rowcount > 0
+            return deleted
         except Exception as e:
             connection.rollback()
             print(f"Error deleting device: {e}")
@@ -512,6 +1195,7 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'locations')
             connection.commit()
             return location.id
         except Exception as e:
@@ -539,6 +1223,7 @@ class DBService:
             cursor.close()
             connection.close()
     
+    @cached_query('locations')
     def get_all_locations(self):
         """Get all locations"""
         connection = self.get_connection()
@@ -560,7 +1245,7 @@ class DBService:
     def record_movement(self, rfid_alert):
         """Record a device reader event and create RFID alert"""
         connection = self.get_connection()
-        cursor = connection.cursor(dictionary=True)
+        cursor = connection.cursor()
         
         try:
             # First get the reader details to validate and get location
@@ -572,7 +1257,7 @@ class DBService:
                 WHERE r.reader_code = %s AND r.antenna_number = %s
             """
             cursor.execute(reader_query, (rfid_alert.reader_code, rfid_alert.antenna_number))
-            reader = cursor.fetchone()
+            reader = fetch_record(cursor)
             
             if not reader:
                 raise Exception(f"Reader {rfid_alert.reader_code} with antenna {rfid_alert.antenna_number} not found")
@@ -580,7 +1265,7 @@ class DBService:
             # Get device by RFID tag
             device_query = "SELECT id FROM devices WHERE rfid_tag = %s"
             cursor.execute(device_query, (rfid_alert.rfid_tag,))
-            device = cursor.fetchone()
+            device = fetch_record(cursor)
             
             if not device:
                 raise Exception(f"Device with RFID tag {rfid_alert.rfid_tag} not found")
@@ -627,9 +1312,9 @@ class DBService:
             device_status = getattr(rfid_alert, 'status', None)
             if device_status is None:
                 # Fall back to getting status from the database
-                status_query = "SELECT status FROM devices WHERE id = %s"
+                status_query = "SELECT status FROM device_state WHERE device_id = %s"
                 cursor.execute(status_query, (device['id'],))
-                device_status_row = cursor.fetchone()
+                device_status_row = fetch_record(cursor)
                 device_status = device_status_row['status'] if device_status_row else 'Temporarily Out'
             
             # Get previous status from alert object
@@ -652,13 +1337,14 @@ class DBService:
             
             # Update device location
             update_query = """
-                UPDATE devices 
-                SET location_id = %s, updated_at = %s
-                WHERE id = %s
+                UPDATE device_state
+                SET location_id = %s, last_reader_id = %s, last_seen_at = %s, updated_at = %s
+                WHERE device_id = %s
             """
-            cursor.execute(update_query, (reader['location_id'], current_time, device['id']))
+            cursor.execute(update_query, (reader['location_id'], reader['id'], alert_timestamp, current_time, device['id']))
             
             connection.commit()
+            self.defer_table_versions('reader_events', 'rfid_alerts', 'devices')
             return rfid_alert.id
             
         except Exception as e:
@@ -676,7 +1362,7 @@ class DBService:
         
         try:
             # First, get the current device status to use for comparison
-            cursor.execute("SELECT status FROM devices WHERE id = %s", (device_id,))
+            cursor.execute("SELECT status FROM device_state WHERE device_id = %s", (device_id,))
             current_device = cursor.fetchone()
             current_status = current_device['status'] if current_device else 'In-Facility'
             
@@ -734,7 +1420,7 @@ class DBService:
                             status_query = """
                                 SELECT status 
                                 FROM reader_events re
-                                JOIN devices d ON re.device_id = d.id
+                                JOIN device_state ds ON re.device_id = ds.device_id
                                 WHERE re.id = %s
                             """
                             cursor.execute(status_query, (events[1]['id'],))
@@ -792,7 +1478,7 @@ class DBService:
             # Count devices by status
             status_query = """
                 SELECT status, COUNT(*) as count 
-                FROM devices 
+                FROM device_state 
                 GROUP BY status
             """
             cursor.execute(status_query)
@@ -805,7 +1491,7 @@ class DBService:
             stats['status_counts'] = status_data
             
             # Count temporarily out devices
-            temp_out_query = "SELECT COUNT(*) as count FROM devices WHERE status = 'Temporarily Out'"
+            temp_out_query = "SELECT COUNT(*) as count FROM device_state WHERE status = 'Temporarily Out'"
             cursor.execute(temp_out_query)
             temp_out_count = cursor.fetchone()
             
@@ -836,7 +1522,7 @@ class DBService:
             stats['recent_alerts'] = recent_alerts['count'] if recent_alerts else 0
             
             # Count missing devices
-            missing_query = "SELECT COUNT(*) as count FROM devices WHERE status = 'Missing'"
+            missing_query = "SELECT COUNT(*) as count FROM device_state WHERE status = 'Missing'"
             cursor.execute(missing_query)
             missing_count = cursor.fetchone()
             
@@ -868,64 +1554,75 @@ class DBService:
             cursor.close()
             connection.close()
 
+    def _build_rfid_alert_filters(self, device_id=None, status=None, start_date=None, end_date=None):
+        """Build the WHERE conditions shared by the RFID alert queries"""
+        query = ""
+        params = []
+        
+        if device_id:
+            query += " AND a.device_id = %s"
+            params.append(device_id)
+
+        if status:
+            query += " AND a.status = %s"
+            params.append(status)
+            
+        if start_date:
+            query += " AND a.timestamp >= %s"
+            # Ensure start date is at the beginning of the day
+            if len(start_date) == 10:  # If only date is provided (YYYY-MM-DD)
+                start_date = f"{start_date} 00:00:00"
+            params.append(start_date)
+            
+        if end_date:
+            query += " AND a.timestamp <= %s"
+            # Ensure end date is at the end of the day
+            if len(end_date) == 10:  # If only date is provided (YYYY-MM-DD)
+                end_date = f"{end_date} 23:59:59"
+            params.append(end_date)
+        
+        return query, params
+    
+    def _build_rfid_alert_order(self, sort_by=None, sort_dir='asc'):
+        """Build the ORDER BY clause shared by the RFID alert queries"""
+        valid_sort_columns = ['timestamp', 'device_name', 'location_name', 'alert_status']
+        if sort_by in valid_sort_columns:
+            sort_dir = sort_dir.upper() if sort_dir.upper() in ['ASC', 'DESC'] else 'ASC'
+            if sort_by == 'device_name':
+                return f" ORDER BY d.model {sort_dir}"
+            elif sort_by == 'location_name':
+                return f" ORDER BY l.name {sort_dir}"
+            elif sort_by == 'alert_status':
+                return f" ORDER BY a.status {sort_dir}"
+            return f" ORDER BY a.{sort_by} {sort_dir}"
+        
+        # Default sort by timestamp descending
+        return " ORDER BY a.timestamp DESC"
+    
     def get_rfid_alerts(self, limit=None, offset=None, sort_by=None, sort_dir='asc', device_id=None, status=None, start_date=None, end_date=None):
         """Get RFID alerts with optional filtering and sorting"""
         try:
             conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True)  # Changed to dictionary cursor
+            cursor = conn.cursor()  # Rows are returned as Records (see services/records.py)
             
             # Start building the query with a WHERE 1=1 clause to make dynamic filtering easier
             query = """
                 SELECT a.id, a.timestamp, a.device_id, a.location_id, a.status as alert_status,
-                       d.model as device_name, d.serial_number, d.status as device_status,
+                       d.model as device_name, d.serial_number, ds.status as device_status,
                        l.name as location_name
                 FROM rfid_alerts a
                 LEFT JOIN devices d ON a.device_id = d.id
+                LEFT JOIN device_state ds ON ds.device_id = a.device_id
                 LEFT JOIN locations l ON a.location_id = l.id
                 WHERE 1=1
             """
             
-            # Initialize parameters list
-            params = []
-            
             # Add filters if provided
-            if device_id:
-                query += " AND a.device_id = %s"
-                params.append(device_id)
-
-            if status:
-                query += " AND a.status = %s"
-                params.append(status)
-                
-            if start_date:
-                query += " AND a.timestamp >= %s"
-                # Ensure start date is at the beginning of the day
-                if len(start_date) == 10:  # If only date is provided (YYYY-MM-DD)
-                    start_date = f"{start_date} 00:00:00"
-                params.append(start_date)
-                
-            if end_date:
-                query += " AND a.timestamp <= %s"
-                # Ensure end date is at the end of the day
-                if len(end_date) == 10:  # If only date is provided (YYYY-MM-DD)
-                    end_date = f"{end_date} 23:59:59"
-                params.append(end_date)
+            filter_sql, params = self._build_rfid_alert_filters(device_id, status, start_date, end_date)
+            query += filter_sql
             
             # Add sorting if provided
-            valid_sort_columns = ['timestamp', 'device_name', 'location_name', 'alert_status']
-            if sort_by in valid_sort_columns:
-                sort_dir = sort_dir.upper() if sort_dir.upper() in ['ASC', 'DESC'] else 'ASC'
-                if sort_by == 'device_name':
-                    query += f" ORDER BY d.model {sort_dir}"
-                elif sort_by == 'location_name':
-                    query += f" ORDER BY l.name {sort_dir}"
-                elif sort_by == 'alert_status':
-                    query += f" ORDER BY a.status {sort_dir}"
-                else:
-                    query += f" ORDER BY a.{sort_by} {sort_dir}"
-            else:
-                # Default sort by timestamp descending
-                query += " ORDER BY a.timestamp DESC"
+            query += self._build_rfid_alert_order(sort_by, sort_dir)
             
             # Add pagination if provided
             if limit is not None:
@@ -937,7 +1634,7 @@ class DBService:
                     params.append(offset)
             
             cursor.execute(query, tuple(params))
-            alerts = cursor.fetchall()
+            alerts = fetch_records(cursor)
             
             cursor.close()
             conn.close()
@@ -961,31 +1658,9 @@ class DBService:
                 WHERE 1=1
             """
             
-            # Initialize parameters list
-            params = []
-            
             # Add filters if provided
-            if device_id:
-                query += " AND a.device_id = %s"
-                params.append(device_id)
-                
-            if status:
-                query += " AND a.status = %s"
-                params.append(status)
-                
-            if start_date:
-                query += " AND a.timestamp >= %s"
-                # Ensure start date is at the beginning of the day
-                if len(start_date) == 10:  # If only date is provided (YYYY-MM-DD)
-                    start_date = f"{start_date} 00:00:00"
-                params.append(start_date)
-                
-            if end_date:
-                query += " AND a.timestamp <= %s"
-                # Ensure end date is at the end of the day
-                if len(end_date) == 10:  # If only date is provided (YYYY-MM-DD)
-                    end_date = f"{end_date} 23:59:59"
-                params.append(end_date)
+            filter_sql, params = self._build_rfid_alert_filters(device_id, status, start_date, end_date)
+            query += filter_sql
             
             cursor.execute(query, tuple(params))
             result = cursor.fetchone()
@@ -1050,16 +1725,84 @@ class DBService:
             print(f"Error getting RFID alerts status counts: {str(e)}")
             return {}
 
-    def create_rfid_alert(self, alert):
-        """Create a new RFID alert"""
+    def has_alert_seq(self):
+        """True if rfid_alerts has the seq column that live updates tail"""
+        if DBService._alert_seq_available is None:
+            connection = self.get_connection()
+            cursor = connection.cursor()
+            try:
+                DBService._alert_seq_available = self._has_column(cursor, 'rfid_alerts', 'seq')
+            finally:
+                cursor.close()
+                connection.close()
+        return DBService._alert_seq_available
+    
+    def add_alert_seq(self):
+        """
+        Add rfid_alerts.seq to a database created without it.
+        
+        MySQL cannot add an AUTO_INCREMENT column in place: the table is
+        copied, and writes to it wait until the copy is done.
+        """
         connection = self.get_connection()
         cursor = connection.cursor()
         
         try:
-            query = """
-                INSERT INTO rfid_alerts (
-                    id, device_id, reader_id, alert_type, location,
-                    timestamp, created_at, updated_at
+            if self._has_column(cursor, 'rfid_alerts', 'seq'):
+                return False
+            cursor.execute("ALTER TABLE rfid_alerts ADD COLUMN seq BIGINT UNSIGNED NOT NULL AUTO_INCREMENT UNIQUE AFTER id")
+            DBService._alert_seq_available = True
+            return True
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_latest_alert_seq(self):
+        """Get the sequence number of the newest RFID alert"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM rfid_alerts")
+            return int(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_alerts_after(self, seq, limit=500):
+        """Get RFID alerts with a sequence number above seq, oldest first"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            query = """
+                SELECT a.seq, a.id, a.timestamp, a.device_id, a.reader_id, a.location_id,
+                       a.status as alert_status, a.previous_status,
+                       d.model as device_name, d.serial_number,
+                       l.name as location_name
+                FROM rfid_alerts a
+                LEFT JOIN devices d ON a.device_id = d.id
+                LEFT JOIN locations l ON a.location_id = l.id
+                WHERE a.seq > %s
+                ORDER BY a.seq
+                LIMIT %s
+            """
+            cursor.execute(query, (seq, limit))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def create_rfid_alert(self, alert):
+        """Create a new RFID alert"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            query = """
+                INSERT INTO rfid_alerts (
+                    id, device_id, reader_id, alert_type, location,
+                    timestamp, created_at, updated_at
                 ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """
             
@@ -1070,6 +1813,7 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'rfid_alerts')
             connection.commit()
             return alert.id
         except Exception as e:
@@ -1099,6 +1843,7 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'nurses')
             connection.commit()
             return nurse.id
         except Exception as e:
@@ -1147,6 +1892,7 @@ class DBService:
                 )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'device_assignments')
             connection.commit()
             return assignment['id'] if isinstance(assignment, dict) else assignment.id
         except Exception as e:
@@ -1164,9 +1910,9 @@ class DBService:
         
         try:
             query = """
-                UPDATE devices 
+                UPDATE device_state 
                 SET status = %s, updated_at = %s
-                WHERE id = %s
+                WHERE device_id = %s
             """
             
             # Use timezone-aware EST timestamp
@@ -1175,6 +1921,7 @@ class DBService:
             values = (status, current_time_est, device_id)
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'devices')
             connection.commit()
             print(f"Updated device {device_id} status to {status} at {current_time_est}")
             return True
@@ -1234,6 +1981,7 @@ class DBService:
         """Get a nurse by barcode (alias for get_nurse_by_badge)"""
         return self.get_nurse_by_badge(barcode)
 
+    @cached_query('nurses')
     def get_all_nurses(self, limit=10, offset=0, sort_by=None, sort_dir='asc'):
         """Get all nurses with pagination and sorting"""
         connection = self.get_connection()
@@ -1301,8 +2049,10 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            updated = cursor.rowcount > 0
+            self.bump_table_versions(cursor, 'nurses')
             connection.commit()
-            return cursor.rowcount > 0
+            return updated
         except Exception as e:
             connection.rollback()
             print(f"Error updating nurse: {e}")
@@ -1355,8 +2105,10 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            updated = cursor.rowcount > 0
+            self.bump_table_versions(cursor, 'device_assignments')
             connection.commit()
-            return cursor.rowcount > 0
+            return updated
         except Exception as e:
             connection.rollback()
             print(f"Error updating device assignment: {e}")
@@ -1392,6 +2144,206 @@ class DBService:
             cursor.close()
             connection.close()
 
+    def bulk_assign_devices(self, items, action='assign', all_or_nothing=False):
+        """
+        Assign (or transfer) or return a batch of devices in one transaction.
+        
+        items is a list of dicts with device_barcode and nurse_badge_id. All
+        devices and nurses are resolved with one IN query each, and every
+        assignment and device change is written with set-based statements, so
+        the cost barely grows with the batch size. Returns one result dict per
+        item, in order. Items that fail validation are reported and skipped,
+        or abort the whole batch when all_or_nothing is set.
+        """
+        if action not in ('assign', 'return'):
+            raise ValueError(f"Unsupported bulk action: {action}")
+        
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            barcodes = list({item.get('device_barcode') for item in items if item.get('device_barcode')})
+            badges = list({item.get('nurse_badge_id') for item in items if item.get('nurse_badge_id')})
+            
+            devices = {}
+            if barcodes:
+                # Lock the devices and their active assignments so two carts
+                # can't hand out the same device at the same time
+                placeholders = ', '.join(['%s'] * len(barcodes))
+                cursor.execute(f"""
+                    SELECT d.id, d.barcode, d.serial_number, d.model, ds.status,
+                           da.id as assignment_id, da.nurse_id as assigned_nurse_id
+                    FROM devices d
+                    {DEVICE_STATE_JOIN}
+                    LEFT JOIN device_assignments da ON da.device_id = d.id AND da.status = 'Active'
+                    WHERE d.barcode IN ({placeholders})
+                    FOR UPDATE
+                """, tuple(barcodes))
+                for row in cursor.fetchall():
+                    devices.setdefault(row['barcode'], row)
+            
+            nurses = {}
+            if badges:
+                placeholders = ', '.join(['%s'] * len(badges))
+                cursor.execute(f"""
+                    SELECT id, badge_id, first_name, last_name, department
+                    FROM nurses
+                    WHERE badge_id IN ({placeholders})
+                """, tuple(badges))
+                for row in cursor.fetchall():
+                    nurses.setdefault(row['badge_id'], row)
+            
+            now = datetime.now()
+            results = []
+            new_assignments = []
+            closed_assignments = {'Transferred': [], 'Returned': []}
+            device_updates = []  # (device id, nurse name or None)
+            seen_devices = set()
+            
+            for index, item in enumerate(items):
+                device_barcode = item.get('device_barcode')
+                nurse_badge_id = item.get('nurse_badge_id')
+                result = {
+                    'index': index,
+                    'device_barcode': device_barcode,
+                    'nurse_badge_id': nurse_badge_id,
+                    'success': False
+                }
+                results.append(result)
+                
+                device = devices.get(device_barcode)
+                nurse = nurses.get(nurse_badge_id)
+                
+                if not device_barcode or (action == 'assign' and not nurse_badge_id):
+                    result['error'] = 'device_barcode and nurse_badge_id are required'
+                    continue
+                if not device:
+                    result['error'] = 'Device not found'
+                    continue
+                if nurse_badge_id and not nurse:
+                    result['error'] = 'Nurse not found'
+                    continue
+                if device['id'] in seen_devices:
+                    result['error'] = 'Device appears more than once in this batch'
+                    continue
+                
+                result['device_id'] = device['id']
+                result['serial_number'] = device['serial_number']
+                
+                if action == 'assign':
+                    if device['assigned_nurse_id'] == nurse['id']:
+                        result['error'] = 'Device is already assigned to this nurse'
+                        continue
+                    # Same rule as the single assign endpoints; a device being
+                    # handed over from another nurse is In-Use instead
+                    if device['status'] != ('In-Use' if device['assignment_id'] else 'Available'):
+                        result['error'] = 'Device is not available for assignment'
+                        continue
+
+                    nurse_name = f"{nurse['first_name']} {nurse['last_name']}"
+                    assignment_id = str(uuid.uuid4())
+                    
+                    if device['assignment_id']:
+                        closed_assignments['Transferred'].append(device['assignment_id'])
+                        result['action'] = 'transferred'
+                    else:
+                        result['action'] = 'assigned'
+                    
+                    new_assignments.append((
+                        assignment_id, device['id'], nurse['id'], now, None, 'Active', now, now
+                    ))
+                    device_updates.append((device['id'], nurse_name))
+                    result.update({
+                        'assignment_id': assignment_id,
+                        'nurse_id': nurse['id'],
+                        'nurse_name': nurse_name
+                    })
+                else:
+                    if not device['assignment_id']:
+                        result['error'] = 'Device is not currently assigned'
+                        continue
+                    if nurse and device['assigned_nurse_id'] != nurse['id']:
+                        result['error'] = 'Device is not currently assigned to the specified nurse'
+                        continue
+                    
+                    closed_assignments['Returned'].append(device['assignment_id'])
+                    device_updates.append((device['id'], None))
+                    result.update({
+                        'action': 'returned',
+                        'assignment_id': device['assignment_id']
+                    })
+                
+                seen_devices.add(device['id'])
+                result['success'] = True
+            
+            failed = any(not result['success'] for result in results)
+            if all_or_nothing and failed:
+                connection.rollback()
+                for result in results:
+                    if result['success']:
+                        result['success'] = False
+                        result['error'] = 'Not applied because another item in the batch failed'
+                return results
+            
+            if not device_updates:
+                connection.rollback()
+                return results
+            
+            # Close replaced or returned assignments
+            for status, assignment_ids in closed_assignments.items():
+                if assignment_ids:
+                    placeholders = ', '.join(['%s'] * len(assignment_ids))
+                    cursor.execute(f"""
+                        UPDATE device_assignments
+                        SET status = %s, returned_at = %s, updated_at = %s
+                        WHERE id IN ({placeholders})
+                    """, (status, now, now, *assignment_ids))
+            
+            # Multi-row insert of the new assignments
+            if new_assignments:
+                cursor.executemany("""
+                    INSERT INTO device_assignments (
+                        id, device_id, nurse_id, assigned_at, returned_at,
+                        status, created_at, updated_at
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, new_assignments)
+            
+            # One UPDATE for every device in the batch
+            device_ids = [device_id for device_id, _ in device_updates]
+            placeholders = ', '.join(['%s'] * len(device_ids))
+            if action == 'assign':
+                cases = ' '.join(['WHEN %s THEN %s'] * len(device_updates))
+                params = [value for update in device_updates for value in update]
+                cursor.execute(f"""
+                    UPDATE devices
+                    SET assigned_to = CASE id {cases} END, updated_at = %s
+                    WHERE id IN ({placeholders})
+                """, (*params, now, *device_ids))
+                status = 'In-Use'
+            else:
+                cursor.execute(f"""
+                    UPDATE devices
+                    SET assigned_to = NULL, updated_at = %s
+                    WHERE id IN ({placeholders})
+                """, (now, *device_ids))
+                status = 'Available'
+            cursor.execute(f"""
+                UPDATE device_state
+                SET status = %s, updated_at = %s
+                WHERE device_id IN ({placeholders})
+            """, (status, now, *device_ids))
+            
+            self.bump_table_versions(cursor, 'devices', 'device_assignments')
+            connection.commit()
+            return results
+        except Exception as e:
+            connection.rollback()
+            print(f"Error applying bulk {action}: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
     def delete_nurse(self, nurse_id):
         """Delete a nurse by ID"""
         connection = self.get_connection()
@@ -1412,6 +2364,7 @@ class DBService:
             # Delete the nurse
             query = "DELETE FROM nurses WHERE id = %s"
             cursor.execute(query, (nurse_id,))
+            self.bump_table_versions(cursor, 'nurses')
             connection.commit()
             return nurse_id
         except Exception as e:
@@ -1472,13 +2425,13 @@ class DBService:
             connection.close()
 
     def get_device_count(self, status=None, search_query=None):
-        """Get total count of devices with optional status filter"""
+        """Get total count of devices with optional status and search filters"""
         connection = self.get_connection()
         cursor = connection.cursor()
         
         try:
             # Base query
-            query = "SELECT COUNT(*) FROM devices"
+            query = "SELECT COUNT(*) FROM devices d"
             params = []
             
             # Build WHERE clause conditionally
@@ -1486,13 +2439,15 @@ class DBService:
             
             # Add status filter if provided
             if status:
-                where_clauses.append("status = %s")
+                query += f" {DEVICE_STATE_JOIN}"
+                where_clauses.append("ds.status = %s")
                 params.append(status)
                 
-            # Add search filter if provided (search by serial number)
-            if search_query:
-                where_clauses.append("serial_number LIKE %s")
-                params.append(f'%{search_query}%')
+            # Add search filter if provided (same matching as get_all_devices)
+            search_filter = self._get_device_search_filter(cursor, search_query) if search_query else None
+            if search_filter:
+                where_clauses.append(search_filter[0])
+                params.extend(search_filter[1])
             
             # Combine WHERE clauses if any
             if where_clauses:
@@ -1550,6 +2505,7 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'users')
             connection.commit()
             return user_data['id']
         except Exception as e:
@@ -1620,6 +2576,7 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'users')
             connection.commit()
             return True
         except Exception as e:
@@ -1640,6 +2597,7 @@ class DBService:
             values = (password_hash, datetime.now(), user_id)
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'users')
             connection.commit()
             return True
         except Exception as e:
@@ -1678,6 +2636,7 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'hospitals')
             connection.commit()
             return hospital.id
         except Exception as e:
@@ -1704,6 +2663,7 @@ class DBService:
             cursor.close()
             connection.close()
     
+    @cached_query('hospitals', 'readers')
     def get_all_hospitals(self, sort_by=None, sort_dir='asc'):
         """Get all hospitals with optional sorting"""
         connection = self.get_connection()
@@ -1770,8 +2730,10 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            updated = cursor.rowcount > 0
+            self.bump_table_versions(cursor, 'hospitals')
             connection.commit()
-            return cursor.rowcount > 0
+            return updated
         except Exception as e:
             connection.rollback()
             print(f"Error updating hospital: {e}")
@@ -1790,10 +2752,11 @@ class DBService:
             
             # Get device counts by status
             cursor.execute("""
-                SELECT status, COUNT(*) as count
-                FROM devices
-                WHERE hospital_id = %s
-                GROUP BY status
+                SELECT ds.status, COUNT(*) as count
+                FROM devices d
+                JOIN device_state ds ON ds.device_id = d.id
+                WHERE d.hospital_id = %s
+                GROUP BY ds.status
             """, (hospital_id,))
             stats['devices'] = {row['status']: row['count'] for row in cursor.fetchall()}
             
@@ -1858,6 +2821,7 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            self.bump_table_versions(cursor, 'readers')
             connection.commit()
             return reader.id
         except Exception as e:
@@ -1961,6 +2925,16 @@ class DBService:
             connection.close()
     
     def get_hospital_readers(self, hospital_id):
+        """Get all readers for a hospital, with their latest heartbeat"""
+        # Imported here because the heartbeat buffer itself depends on DBService
+        from .heartbeat_buffer import heartbeats
+        
+        # Heartbeat flushes don't bump the readers version, so the cached
+        # rows can have an old last_heartbeat
+        return heartbeats.apply_state(self._get_hospital_readers(hospital_id))
+    
+    @cached_query('readers', 'locations')
+    def _get_hospital_readers(self, hospital_id):
         """Get all readers for a hospital"""
         connection = self.get_connection()
         cursor = connection.cursor(dictionary=True)
@@ -2006,8 +2980,10 @@ class DBService:
             )
             
             cursor.execute(query, values)
+            updated = cursor.rowcount > 0
+            self.bump_table_versions(cursor, 'readers')
             connection.commit()
-            return cursor.rowcount > 0
+            return updated
         except Exception as e:
             connection.rollback()
             print(f"Error updating reader: {e}")
@@ -2016,16 +2992,215 @@ class DBService:
             cursor.close()
             connection.close()
     
+    def get_reader_heartbeats(self):
+        """Get the status and last heartbeat of every reader"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            cursor.execute("""
+                SELECT id, reader_code, antenna_number, status, last_heartbeat
+                FROM readers
+            """)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def flush_reader_heartbeats(self, heartbeats, batch_size=500):
+        """Write buffered heartbeats ({reader id: timestamp}) with multi-row UPDATEs"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            items = list(heartbeats.items())
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+                placeholders = ', '.join(['%s'] * len(batch))
+                params = [value for item in batch for value in item]
+                
+                # Only last_heartbeat changes; GREATEST keeps a newer value
+                # written by another process, and updated_at is left alone
+                cursor.execute(f"""
+                    UPDATE readers
+                    SET last_heartbeat = GREATEST(
+                            COALESCE(last_heartbeat, '1970-01-01'),
+                            CASE id {cases} END
+                        ),
+                        updated_at = updated_at
+                    WHERE id IN ({placeholders})
+                """, (*params, *[reader_id for reader_id, _ in batch]))
+                
+                self._extend_uptime_intervals(cursor, batch)
+            
+            self.bump_table_versions(cursor, 'reader_heartbeats')
+            connection.commit()
+            return len(items)
+        except Exception as e:
+            connection.rollback()
+            print(f"Error flushing reader heartbeats: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def _extend_uptime_intervals(self, cursor, heartbeats):
+        """
+        Record heartbeats as runs of uptime.
+
+        A heartbeat within READER_OFFLINE_THRESHOLD of the end of the reader's
+        latest run extends that run; otherwise the reader was down in between
+        and a new run is started. Downtime is never stored, it is the gap
+        between runs.
+
+        Heartbeats are flushed by every worker, so this must run in the
+        transaction that updated the readers rows: their row locks make
+        flushers of the same reader wait for each other, and the runs are
+        read with FOR UPDATE so a run another flusher just committed is
+        extended instead of overlapped.
+        """
+        placeholders = ', '.join(['%s'] * len(heartbeats))
+        # Only a run ending within the threshold of a heartbeat can be extended
+        since = min(timestamp for _, timestamp in heartbeats) - READER_OFFLINE_THRESHOLD
+        cursor.execute(f"""
+            SELECT id, reader_id, ended_at
+            FROM reader_uptime_intervals
+            WHERE reader_id IN ({placeholders}) AND ended_at >= %s
+            FOR UPDATE
+        """, [*[reader_id for reader_id, _ in heartbeats], since])
+        latest = {}
+        for interval_id, reader_id, ended_at in cursor.fetchall():
+            if reader_id not in latest or ended_at > latest[reader_id][1]:
+                latest[reader_id] = (interval_id, ended_at)
+        
+        extended = []
+        started = []
+        for reader_id, timestamp in heartbeats:
+            interval_id, ended_at = latest.get(reader_id, (None, None))
+            if ended_at is not None and timestamp <= ended_at:
+                continue
+            if ended_at is not None and timestamp - ended_at <= READER_OFFLINE_THRESHOLD:
+                extended.append((timestamp, interval_id))
+            else:
+                started.append((reader_id, timestamp, timestamp))
+        
+        if extended:
+            cursor.executemany("""
+                UPDATE reader_uptime_intervals
+                SET ended_at = GREATEST(ended_at, %s)
+                WHERE id = %s
+            """, extended)
+        if started:
+            cursor.executemany("""
+                INSERT INTO reader_uptime_intervals (reader_id, started_at, ended_at)
+                VALUES (%s, %s, %s)
+            """, started)
+    
+    def get_reader_uptime(self, reader_ids=None, now=None):
+        """
+        Get uptime over the last 24 hours, 7 days and 30 days for readers.
+
+        Computed in one query from the uptime runs. A run whose last heartbeat
+        is within READER_OFFLINE_THRESHOLD of now is still open and counts up
+        to now. Percentages are relative to the part of each window after the
+        reader was created. Returns {reader_id: {...}}.
+        """
+        if reader_ids is not None and not reader_ids:
+            return {}
+        
+        now = now or datetime.utcnow()  # heartbeats are stored in UTC
+        windows = {
+            '24h': now - timedelta(hours=24),
+            '7d': now - timedelta(days=7),
+            '30d': now - timedelta(days=30)
+        }
+        
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            interval_filter = ''
+            reader_filter = ''
+            filter_params = []
+            if reader_ids is not None:
+                placeholders = ', '.join(['%s'] * len(reader_ids))
+                interval_filter = f"AND reader_id IN ({placeholders})"
+                reader_filter = f"WHERE r.id IN ({placeholders})"
+                filter_params = list(reader_ids)
+            
+            query = f"""
+                SELECT r.id AS reader_id, r.created_at,
+                       COALESCE(SUM(GREATEST(TIMESTAMPDIFF(SECOND, GREATEST(u.started_at, %s), u.ended_at), 0)), 0) AS up_24h,
+                       COALESCE(SUM(GREATEST(TIMESTAMPDIFF(SECOND, GREATEST(u.started_at, %s), u.ended_at), 0)), 0) AS up_7d,
+                       COALESCE(SUM(GREATEST(TIMESTAMPDIFF(SECOND, GREATEST(u.started_at, %s), u.ended_at), 0)), 0) AS up_30d,
+                       COALESCE(SUM(u.ended_at >= %s AND u.ended_at < %s), 0) AS outages_7d
+                FROM readers r
+                LEFT JOIN (
+                    SELECT reader_id, started_at,
+                           CASE WHEN ended_at >= %s THEN %s ELSE ended_at END AS ended_at
+                    FROM reader_uptime_intervals
+                    WHERE ended_at >= %s {interval_filter}
+                ) u ON u.reader_id = r.id
+                {reader_filter}
+                GROUP BY r.id, r.created_at
+            """
+            params = [
+                windows['24h'], windows['7d'], windows['30d'],
+                windows['7d'], now,
+                now - READER_OFFLINE_THRESHOLD, now,
+                windows['30d'], *filter_params,
+                *filter_params
+            ]
+            cursor.execute(query, params)
+            
+            uptime = {}
+            for row in cursor.fetchall():
+                result = {'outages_7d': int(row['outages_7d'])}
+                for name, window_start in windows.items():
+                    # Don't count the time before the reader existed as downtime
+                    start = max(window_start, row['created_at']) if row['created_at'] else window_start
+                    seconds = (now - start).total_seconds()
+                    up_seconds = float(row[f'up_{name}'])
+                    result[f'uptime_{name}'] = round(min(up_seconds / seconds * 100, 100), 1) if seconds > 0 else None
+                uptime[row['reader_id']] = result
+            return uptime
+        except Exception as e:
+            print(f"Error retrieving reader uptime: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def purge_reader_uptime_intervals(self, before):
+        """Delete uptime runs that ended before the given time"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("DELETE FROM reader_uptime_intervals WHERE ended_at < %s", (before,))
+            connection.commit()
+            return cursor.rowcount
+        except Exception as e:
+            connection.rollback()
+            print(f"Error purging reader uptime history: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
     def get_reader_statistics(self, reader_id):
         """Get statistics for a reader using rfid_alerts table"""
+        # Imported here because the heartbeat buffer itself depends on DBService
+        from .heartbeat_buffer import heartbeats
+        
         connection = self.get_connection()
         cursor = connection.cursor(dictionary=True)
         
         try:
             # First get the reader details to get reader information
             cursor.execute("""
-                SELECT reader_code, antenna_number, last_heartbeat, status,
-                       TIMESTAMPDIFF(MINUTE, last_heartbeat, NOW()) as minutes_since_heartbeat
+                SELECT reader_code, antenna_number, last_heartbeat, status
                 FROM readers
                 WHERE id = %s
             """, (reader_id,))
@@ -2061,13 +3236,14 @@ class DBService:
             """, (reader_id,))
             stats['devices_tracked'] = cursor.fetchone()['count']
             
-            # Calculate uptime percentage based on heartbeat
-            # Consider reader up if last heartbeat was within last 5 minutes
-            if reader['status'] == 'Active':
-                minutes_since_heartbeat = reader['minutes_since_heartbeat'] or float('inf')
-                stats['uptime_percentage'] = 100 if minutes_since_heartbeat <= 5 else 0
-            else:
-                stats['uptime_percentage'] = 0
+            # Online state comes from the in-memory heartbeat buffer, which
+            # includes heartbeats that haven't been flushed yet
+            stats['last_heartbeat'] = heartbeats.get_last_heartbeat(reader_id) or reader['last_heartbeat']
+            stats['online'] = heartbeats.is_online(reader_id, reader['status'])
+            
+            uptime = self.get_reader_uptime([reader_id]).get(reader_id, {})
+            stats.update(uptime)
+            stats['uptime_percentage'] = uptime.get('uptime_24h') or 0
             
             return stats
         except Exception as e:
@@ -2153,96 +3329,398 @@ class DBService:
             cursor.close()
             connection.close()
 
-    def get_all_users(self, sort_by=None, sort_dir='asc'):
-        """Get all users with optional sorting"""
+    def get_command_targets(self, hospital_id=None, location_id=None, reader_codes=None, match=None, include_inactive=False):
+        """
+        Get the readers a command should be sent to, one row per reader code.
+        
+        Filters are combined: hospital, location, explicit reader codes and a
+        reader code pattern where * matches anything (e.g. BAYCARE-R0*).
+        Inactive readers are left out unless include_inactive is set.
+        """
         connection = self.get_connection()
         cursor = connection.cursor(dictionary=True)
         
         try:
-            # Define valid sort columns and their SQL equivalents
-            valid_sort_columns = {
-                'username': 'username',
-                'role': 'role',
-                'name': 'CONCAT(first_name, " ", last_name)',
-                'created_at': 'created_at'
-            }
-            
-            # Base query
-            query = "SELECT * FROM users"
+            conditions = []
+            params = []
+            if hospital_id:
+                conditions.append("r.hospital_id = %s")
+                params.append(hospital_id)
+            if location_id:
+                conditions.append("r.location_id = %s")
+                params.append(location_id)
+            if reader_codes:
+                conditions.append(f"r.reader_code IN ({', '.join(['%s'] * len(reader_codes))})")
+                params.extend(reader_codes)
+            if match:
+                conditions.append("r.reader_code LIKE %s")
+                params.append(match.replace('%', '\\%').replace('_', '\\_').replace('*', '%'))
+            if not include_inactive:
+                conditions.append("r.status = 'Active'")
             
-            # Add sorting if valid column is provided
-            if sort_by and sort_by in valid_sort_columns:
-                sort_dir = sort_dir.upper() if sort_dir.lower() in ['asc', 'desc'] else 'ASC'
-                query += f" ORDER BY {valid_sort_columns[sort_by]} {sort_dir}"
-            else:
-                query += " ORDER BY created_at DESC"
+            query = """
+                SELECT r.reader_code, MIN(r.hospital_id) as hospital_id, MIN(h.name) as hospital_name,
+                       COUNT(*) as antennas
+                FROM readers r
+                LEFT JOIN hospitals h ON r.hospital_id = h.id
+            """
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += " GROUP BY r.reader_code ORDER BY r.reader_code"
             
-            cursor.execute(query)
-            result = cursor.fetchall()
-            return result
+            cursor.execute(query, params)
+            return cursor.fetchall()
         except Exception as e:
-            print(f"Error retrieving users: {e}")
+            print(f"Error retrieving command targets: {e}")
             raise
         finally:
             cursor.close()
             connection.close()
-
-    def get_rfid_alert(self, alert_id):
-        """Get detailed information about a specific RFID alert"""
+    
+    def create_reader_commands(self, commands):
+        """Insert a batch of pending reader commands (dicts with the reader_commands columns)"""
+        if not commands:
+            return 0
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.executemany("""
+                INSERT INTO reader_commands (
+                    id, batch_id, reader_code, command_type, parameters, created_by, created_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, [(
+                command['id'], command['batch_id'], command['reader_code'], command['command_type'],
+                json.dumps(command['parameters']) if command.get('parameters') is not None else None,
+                command.get('created_by'), command['created_at']
+            ) for command in commands])
+            connection.commit()
+            return cursor.rowcount
+        except Exception as e:
+            connection.rollback()
+            print(f"Error creating reader commands: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def update_reader_commands(self, updates):
+        """Write the current state of a batch of reader commands"""
+        if not updates:
+            return 0
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.executemany("""
+                UPDATE reader_commands
+                SET status = %s, attempts = %s, sent_at = %s, completed_at = %s,
+                    latency_ms = %s, response = %s, error = %s
+                WHERE id = %s
+            """, [(
+                update['status'], update['attempts'], update.get('sent_at'), update.get('completed_at'),
+                update.get('latency_ms'),
+                json.dumps(update['response']) if update.get('response') is not None else None,
+                (update.get('error') or '')[:255] or None,
+                update['id']
+            ) for update in updates])
+            connection.commit()
+            return cursor.rowcount
+        except Exception as e:
+            connection.rollback()
+            print(f"Error updating reader commands: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_reader_commands(self, batch_id):
+        """Get the commands of a dispatch batch"""
         connection = self.get_connection()
         cursor = connection.cursor(dictionary=True)
         
         try:
-            query = """
-                SELECT 
-                    ra.*,
-                    d.model as device_name,
-                    d.serial_number,
-                    d.model,
-                    d.status as device_status,
-                    d.rfid_tag as asset_tag,
-                    l.name as location_name,
-                    l.type as location_type,
-                    CONCAT_WS(', ',
-                        NULLIF(l.building, ''),
-                        NULLIF(l.floor, ''),
-                        NULLIF(l.room, '')
-                    ) as location_description,
-                    h.name as hospital_name,
-                    r.name as reader_name,
-                    r.reader_code as reader_serial,
-                    r.antenna_number
-                FROM rfid_alerts ra
-                LEFT JOIN devices d ON ra.device_id = d.id
-                LEFT JOIN locations l ON ra.location_id = l.id
-                LEFT JOIN hospitals h ON l.hospital_id = h.id
-                LEFT JOIN readers r ON ra.reader_id = r.id
-                WHERE ra.id = %s
-            """
-            cursor.execute(query, (alert_id,))
-            alert = cursor.fetchone()
-            
-            # Default alert status if not present in the database
-            if alert and 'status' not in alert:
-                alert['status'] = 'Temporarily Out'
-                
-            return alert
+            cursor.execute("""
+                SELECT * FROM reader_commands
+                WHERE batch_id = %s
+                ORDER BY reader_code
+            """, (batch_id,))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error retrieving reader commands: {e}")
+            raise
         finally:
             cursor.close()
             connection.close()
 
-    def create_alert_for_missing_device(self, rfid_alert):
-        """Create an RFID alert for a device that has been automatically marked as Missing"""
+    def get_alert_rules(self, enabled_only=False, hospital_id=None):
+        """Get alert rules, optionally only the enabled ones or those of one hospital"""
         connection = self.get_connection()
         cursor = connection.cursor(dictionary=True)
         
         try:
-            # First get the device details to validate and get hospital_id
-            device_query = """
-                SELECT d.*, h.id as hospital_id
-                FROM devices d
-                LEFT JOIN hospitals h ON d.hospital_id = h.id
-                WHERE d.id = %s
+            query = "SELECT * FROM alert_rules WHERE 1=1"
+            params = []
+            if enabled_only:
+                query += " AND enabled = TRUE"
+            if hospital_id:
+                query += " AND hospital_id = %s"
+                params.append(hospital_id)
+            query += " ORDER BY name"
+            cursor.execute(query, tuple(params))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error retrieving alert rules: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_alert_rule(self, rule_id):
+        """Get an alert rule by ID"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            cursor.execute("SELECT * FROM alert_rules WHERE id = %s", (rule_id,))
+            return cursor.fetchone()
+        except Exception as e:
+            print(f"Error retrieving alert rule: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def create_alert_rule(self, rule, created_by=None):
+        """Insert an alert rule (a dict with the alert_rules columns) and return its ID"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            rule_id = str(uuid.uuid4())
+            now = get_current_est_time().replace(tzinfo=None)
+            cursor.execute("""
+                INSERT INTO alert_rules (
+                    id, name, hospital_id, location_id, reader_id, status, start_time, end_time,
+                    window_seconds, threshold, group_by, count_distinct, enabled,
+                    created_by, created_at, updated_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                rule_id, rule['name'], rule['hospital_id'], rule['location_id'], rule['reader_id'],
+                rule['status'], rule['start_time'], rule['end_time'], rule['window_seconds'],
+                rule['threshold'], rule['group_by'], rule['count_distinct'], rule['enabled'],
+                created_by, now, now
+            ))
+            connection.commit()
+            return rule_id
+        except Exception as e:
+            connection.rollback()
+            print(f"Error creating alert rule: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def update_alert_rule(self, rule_id, rule):
+        """Replace the conditions of an alert rule"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("""
+                UPDATE alert_rules
+                SET name = %s, hospital_id = %s, location_id = %s, reader_id = %s, status = %s,
+                    start_time = %s, end_time = %s, window_seconds = %s, threshold = %s,
+                    group_by = %s, count_distinct = %s, enabled = %s, updated_at = %s
+                WHERE id = %s
+            """, (
+                rule['name'], rule['hospital_id'], rule['location_id'], rule['reader_id'], rule['status'],
+                rule['start_time'], rule['end_time'], rule['window_seconds'], rule['threshold'],
+                rule['group_by'], rule['count_distinct'], rule['enabled'],
+                get_current_est_time().replace(tzinfo=None), rule_id
+            ))
+            connection.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            connection.rollback()
+            print(f"Error updating alert rule: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def delete_alert_rule(self, rule_id):
+        """Delete an alert rule and the alerts it triggered"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("DELETE FROM alert_rules WHERE id = %s", (rule_id,))
+            connection.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            connection.rollback()
+            print(f"Error deleting alert rule: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def create_rule_alerts(self, rule_alerts):
+        """Insert a batch of triggered rule alerts (dicts with the rule_alerts columns)"""
+        if not rule_alerts:
+            return 0
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.executemany("""
+                INSERT IGNORE INTO rule_alerts (
+                    id, rule_id, device_id, reader_id, hospital_id, location_id, match_count, triggered_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, [(
+                alert['id'], alert['rule_id'], alert['device_id'], alert['reader_id'],
+                alert['hospital_id'], alert['location_id'], alert['match_count'], alert['triggered_at']
+            ) for alert in rule_alerts])
+            connection.commit()
+            return cursor.rowcount
+        except Exception as e:
+            connection.rollback()
+            print(f"Error creating rule alerts: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_rule_alerts(self, rule_id=None, hospital_id=None, limit=100):
+        """Get the most recent rule alerts with their rule, device and location names"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            query = """
+                SELECT ra.id, ra.rule_id, ar.name as rule_name, ra.device_id, d.serial_number,
+                       d.model as device_name, ra.reader_id, ra.hospital_id, ra.location_id,
+                       l.name as location_name, ra.match_count, ra.triggered_at
+                FROM rule_alerts ra
+                JOIN alert_rules ar ON ra.rule_id = ar.id
+                LEFT JOIN devices d ON ra.device_id = d.id
+                LEFT JOIN locations l ON ra.location_id = l.id
+                WHERE 1=1
+            """
+            params = []
+            if rule_id:
+                query += " AND ra.rule_id = %s"
+                params.append(rule_id)
+            if hospital_id:
+                query += " AND ra.hospital_id = %s"
+                params.append(hospital_id)
+            query += " ORDER BY ra.triggered_at DESC LIMIT %s"
+            params.append(limit)
+            cursor.execute(query, tuple(params))
+            return fetch_records(cursor)
+        except Exception as e:
+            print(f"Error retrieving rule alerts: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    @cached_query('users')
+    def get_all_users(self, sort_by=None, sort_dir='asc'):
+        """Get all users with optional sorting"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            # Define valid sort columns and their SQL equivalents
+            valid_sort_columns = {
+                'username': 'username',
+                'role': 'role',
+                'name': 'CONCAT(first_name, " ", last_name)',
+                'created_at': 'created_at'
+            }
+            
+            # Base query
+            query = "SELECT * FROM users"
+            
+            # Add sorting if valid column is provided
+            if sort_by and sort_by in valid_sort_columns:
+                sort_dir = sort_dir.upper() if sort_dir.lower() in ['asc', 'desc'] else 'ASC'
+                query += f" ORDER BY {valid_sort_columns[sort_by]} {sort_dir}"
+            else:
+                query += " ORDER BY created_at DESC"
+            
+            cursor.execute(query)
+            result = cursor.fetchall()
+            return result
+        except Exception as e:
+            print(f"Error retrieving users: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def get_rfid_alert(self, alert_id):
+        """Get detailed information about a specific RFID alert"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            query = """
+                SELECT 
+                    ra.*,
+                    d.model as device_name,
+                    d.serial_number,
+                    d.model,
+                    ds.status as device_status,
+                    d.rfid_tag as asset_tag,
+                    l.name as location_name,
+                    l.type as location_type,
+                    CONCAT_WS(', ',
+                        NULLIF(l.building, ''),
+                        NULLIF(l.floor, ''),
+                        NULLIF(l.room, '')
+                    ) as location_description,
+                    h.name as hospital_name,
+                    r.name as reader_name,
+                    r.reader_code as reader_serial,
+                    r.antenna_number
+                FROM rfid_alerts ra
+                LEFT JOIN devices d ON ra.device_id = d.id
+                LEFT JOIN device_state ds ON ds.device_id = ra.device_id
+                LEFT JOIN locations l ON ra.location_id = l.id
+                LEFT JOIN hospitals h ON l.hospital_id = h.id
+                LEFT JOIN readers r ON ra.reader_id = r.id
+                WHERE ra.id = %s
+            """
+            cursor.execute(query, (alert_id,))
+            alert = cursor.fetchone()
+            
+            # Default alert status if not present in the database
+            if alert and 'status' not in alert:
+                alert['status'] = 'Temporarily Out'
+                
+            return alert
+        finally:
+            cursor.close()
+            connection.close()
+
+    def create_alert_for_missing_device(self, rfid_alert):
+        """Create an RFID alert for a device that has been automatically marked as Missing"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            # First get the device details to validate and get hospital_id
+            device_query = """
+                SELECT d.*, h.id as hospital_id
+                FROM devices d
+                LEFT JOIN hospitals h ON d.hospital_id = h.id
+                WHERE d.id = %s
             """
             cursor.execute(device_query, (rfid_alert.device_id,))
             device = cursor.fetchone()
@@ -2300,6 +3778,7 @@ class DBService:
             )
             
             cursor.execute(alert_query, alert_values)
+            self.bump_table_versions(cursor, 'rfid_alerts')
             connection.commit()
             
             logger.info(f"Created Missing alert for device {device['id']} (previous status: {rfid_alert.previous_status}, reader_id: {reader_id})")
@@ -2368,4 +3847,698 @@ class DBService:
             return []
         finally:
             cursor.close()
-            connection.close() 
\ No newline at end of file
+            connection.close() 
+    
+    # Streaming reads
+    # The iter_* methods return generators over an unbuffered cursor on a
+    # dedicated connection. Nothing is queried until iteration starts, rows
+    # arrive fetch_size at a time, and the connection is closed when the
+    # loop ends, breaks or raises, so exports, scripts and sweeps over the
+    # whole fleet or history use the same memory for any number of rows.
+    def iter_devices(self, status=None, search_query=None, fetch_size=None):
+        """Iterate over all devices matching the filters without loading them into memory"""
+        search_filter = None
+        if search_query:
+            connection = self.get_connection()
+            cursor = connection.cursor()
+            try:
+                search_filter = self._get_device_search_filter(cursor, search_query)
+            finally:
+                cursor.close()
+                connection.close()
+        
+        query = f"SELECT {DEVICE_COLUMNS} FROM devices d {DEVICE_STATE_JOIN}"
+        
+        where_clauses = []
+        params = []
+        
+        if status:
+            where_clauses.append("ds.status = %s")
+            params.append(status)
+        
+        if search_filter:
+            where_clauses.append(search_filter[0])
+            params.extend(search_filter[1])
+        
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        
+        # Primary key order lets MySQL stream rows without sorting the table first
+        query += " ORDER BY d.id"
+        
+        return self._stream_query(query, params, fetch_size)
+    
+    def iter_rfid_alerts(self, sort_by=None, sort_dir='asc', device_id=None, status=None, start_date=None, end_date=None,
+                         fetch_size=None):
+        """Iterate over RFID alerts with the same filters and sorting as get_rfid_alerts"""
+        query = """
+            SELECT a.id, a.timestamp, a.device_id, a.reader_id, a.hospital_id, a.location_id,
+                   a.status as alert_status, a.previous_status,
+                   d.model as device_name, d.serial_number, d.rfid_tag, ds.status as device_status,
+                   l.name as location_name
+            FROM rfid_alerts a
+            LEFT JOIN devices d ON a.device_id = d.id
+            LEFT JOIN device_state ds ON ds.device_id = a.device_id
+            LEFT JOIN locations l ON a.location_id = l.id
+            WHERE 1=1
+        """
+        
+        filter_sql, params = self._build_rfid_alert_filters(device_id, status, start_date, end_date)
+        query += filter_sql
+        query += self._build_rfid_alert_order(sort_by, sort_dir)
+        
+        return self._stream_query(query, params, fetch_size)
+    
+    def iter_reader_events(self, device_id=None, reader_code=None, start_date=None, end_date=None, fetch_size=None):
+        """Iterate over raw reader events (device movements) in timestamp order"""
+        query = """
+            SELECT e.id, e.timestamp, e.device_id, e.rfid_tag, e.reader_code, e.antenna_number,
+                   e.hospital_id, e.location_id, d.serial_number, l.name as location_name
+            FROM reader_events e
+            LEFT JOIN devices d ON e.device_id = d.id
+            LEFT JOIN locations l ON e.location_id = l.id
+            WHERE 1=1
+        """
+        params = []
+        
+        if device_id:
+            query += " AND e.device_id = %s"
+            params.append(device_id)
+        
+        if reader_code:
+            query += " AND e.reader_code = %s"
+            params.append(reader_code)
+        
+        if start_date:
+            query += " AND e.timestamp >= %s"
+            if len(start_date) == 10:  # If only date is provided (YYYY-MM-DD)
+                start_date = f"{start_date} 00:00:00"
+            params.append(start_date)
+        
+        if end_date:
+            query += " AND e.timestamp <= %s"
+            if len(end_date) == 10:  # If only date is provided (YYYY-MM-DD)
+                end_date = f"{end_date} 23:59:59"
+            params.append(end_date)
+        
+        query += " ORDER BY e.timestamp"
+        
+        return self._stream_query(query, params, fetch_size)
+    
+    def iter_device_assignments(self, device_id=None, nurse_id=None, hospital_id=None, status=None,
+                                start_date=None, end_date=None, fetch_size=None):
+        """Iterate over device assignments (with the nurse's name and department) in assigned_at order"""
+        query = """
+            SELECT da.id, da.device_id, da.nurse_id, da.hospital_id, da.assigned_at, da.returned_at,
+                   da.status, da.created_at, da.updated_at,
+                   d.serial_number, d.model,
+                   n.department, CONCAT(n.first_name, ' ', n.last_name) as nurse_name
+            FROM device_assignments da
+            LEFT JOIN devices d ON da.device_id = d.id
+            LEFT JOIN nurses n ON da.nurse_id = n.id
+            WHERE 1=1
+        """
+        params = []
+        
+        if device_id:
+            query += " AND da.device_id = %s"
+            params.append(device_id)
+        
+        if nurse_id:
+            query += " AND da.nurse_id = %s"
+            params.append(nurse_id)
+        
+        if hospital_id:
+            query += " AND da.hospital_id = %s"
+            params.append(hospital_id)
+        
+        if status:
+            query += " AND da.status = %s"
+            params.append(status)
+        
+        if start_date:
+            query += " AND da.assigned_at >= %s"
+            if len(start_date) == 10:  # If only date is provided (YYYY-MM-DD)
+                start_date = f"{start_date} 00:00:00"
+            params.append(start_date)
+        
+        if end_date:
+            query += " AND da.assigned_at <= %s"
+            if len(end_date) == 10:  # If only date is provided (YYYY-MM-DD)
+                end_date = f"{end_date} 23:59:59"
+            params.append(end_date)
+        
+        query += " ORDER BY da.assigned_at"
+        
+        return self._stream_query(query, params, fetch_size)
+    
+    def iter_temporarily_out_devices(self, fetch_size=None):
+        """Iterate over Temporarily Out devices with the reader that last saw each one (for the missing sweep)"""
+        query = """
+            WITH latest_events AS (
+                SELECT re.device_id, re.reader_code, re.antenna_number,
+                       ROW_NUMBER() OVER(PARTITION BY re.device_id ORDER BY re.timestamp DESC) as rn
+                FROM reader_events re
+            )
+            SELECT d.id, ds.updated_at, d.serial_number, d.rfid_tag, ds.location_id, ds.status,
+                   le.reader_code, le.antenna_number
+            FROM device_state ds
+            JOIN devices d ON d.id = ds.device_id
+            LEFT JOIN latest_events le ON d.id = le.device_id AND le.rn = 1
+            WHERE ds.status = 'Temporarily Out'
+        """
+        return self._stream_query(query, (), fetch_size)
+    
+    # Dwell analytics
+    # Devices and locations are numbered by ROW_NUMBER() over their primary
+    # key, so event rows can be fetched as plain integers and the names
+    # looked up afterwards with the same numbering. All the queries run in
+    # one consistent snapshot, so a device added or deleted meanwhile can't
+    # shift the numbers between them.
+    _DEVICE_NUMBERS = "SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n FROM devices"
+    _LOCATION_NUMBERS = "SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n FROM locations"
+    
+    def iter_dwell_data(self, hospital_id, start, end, lookback, fetch_size=50000):
+        """
+        Yield everything a dwell report needs, read in one consistent snapshot,
+        as (kind, value) pairs in this order:
+        
+        - ('devices', rows) and ('locations', rows): dicts with n, id and
+          their names, in the numbering used by the other rows
+        - ('events', batch): a hospital's reader events in [start, end) as
+          (seconds since start, device number, location number) tuples
+        - ('status_changes', batch): the hospital's alerts in [start, end) as
+          (seconds since start, device number, out of facility) tuples. Each
+          device's last alert in the lookback period before start comes
+          first with seconds -1, so devices that were already out at start
+          are counted from the beginning of the range.
+        """
+        queries = [
+            ('devices', """
+                SELECT ROW_NUMBER() OVER (ORDER BY id) - 1 AS n, id, serial_number, model
+                FROM devices
+                ORDER BY id
+            """, ()),
+            ('locations', """
+                SELECT ROW_NUMBER() OVER (ORDER BY id) - 1 AS n, id, name, type
+                FROM locations
+                ORDER BY id
+            """, ()),
+            ('events', f"""
+                WITH dev AS ({self._DEVICE_NUMBERS}), loc AS ({self._LOCATION_NUMBERS})
+                SELECT TIMESTAMPDIFF(SECOND, %s, e.timestamp), dev.n, loc.n
+                FROM reader_events e
+                JOIN dev ON dev.id = e.device_id
+                JOIN loc ON loc.id = e.location_id
+                WHERE e.hospital_id = %s AND e.timestamp >= %s AND e.timestamp < %s
+            """, (start, hospital_id, start, end)),
+            ('status_changes', f"""
+                WITH dev AS ({self._DEVICE_NUMBERS})
+                SELECT -1, dev.n, latest.status <> 'In-Facility'
+                FROM (
+                    SELECT device_id, status,
+                           ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY timestamp DESC, id DESC) AS newest
+                    FROM rfid_alerts
+                    WHERE hospital_id = %s AND timestamp >= %s AND timestamp < %s
+                ) latest
+                JOIN dev ON dev.id = latest.device_id
+                WHERE latest.newest = 1
+                UNION ALL
+                SELECT TIMESTAMPDIFF(SECOND, %s, a.timestamp), dev.n, a.status <> 'In-Facility'
+                FROM rfid_alerts a
+                JOIN dev ON dev.id = a.device_id
+                WHERE a.hospital_id = %s AND a.timestamp >= %s AND a.timestamp < %s
+            """, (hospital_id, start - lookback, start, start, hospital_id, start, end))
+        ]
+        
+        connection = self.get_streaming_connection()
+        
+        try:
+            cursor = connection.cursor()
+            # A consistent snapshot needs REPEATABLE READ, whatever the session default
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            cursor.close()
+            
+            for kind, query, params in queries:
+                if kind in ('devices', 'locations'):
+                    cursor = connection.cursor(dictionary=True)
+                    cursor.execute(query, params)
+                    yield kind, cursor.fetchall()
+                    cursor.close()
+                    continue
+                
+                cursor = connection.cursor(buffered=False)
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    yield kind, rows
+                cursor.close()
+            connection.commit()
+        finally:
+            # Closing the connection ends the read-only transaction; as in
+            # _stream_query, it is cheaper than draining rows left unread
+            try:
+                connection.close()
+            except Exception as e:
+                print(f"Error closing dwell analytics connection: {e}")
+    
+    # Device utilization
+    def get_assignment_intervals(self, hospital_id, start, end):
+        """
+        Get the assignments of a hospital's devices that overlap [start, end).
+        
+        Rows are (device_id, model, department, assigned_at, ended_at).
+        ended_at is NULL for assignments still active; assignments closed
+        without a returned_at (e.g. Lost) end at their last update.
+        """
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("""
+                SELECT da.device_id, d.model, n.department, da.assigned_at,
+                       COALESCE(da.returned_at, CASE WHEN da.status = 'Active' THEN NULL ELSE da.updated_at END) AS ended_at
+                FROM device_assignments da
+                JOIN devices d ON d.id = da.device_id
+                LEFT JOIN nurses n ON n.id = da.nurse_id
+                WHERE COALESCE(da.hospital_id, d.hospital_id) = %s
+                AND da.assigned_at < %s
+                AND (da.returned_at IS NULL OR da.returned_at > %s)
+            """, (hospital_id, end, start))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error retrieving assignment intervals: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_utilization_devices(self, hospital_id):
+        """Get a hospital's devices with the columns the utilization report needs"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            cursor.execute("""
+                SELECT id, serial_number, model, created_at
+                FROM devices
+                WHERE hospital_id = %s
+            """, (hospital_id,))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error retrieving utilization devices: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_utilization_days(self, hospital_id, start_day, end_day):
+        """Get cached daily utilization rows for start_day <= day < end_day"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            cursor.execute("""
+                SELECT day, scope, scope_key, assigned_seconds, assignments, peak_concurrent
+                FROM device_utilization_daily
+                WHERE hospital_id = %s AND day >= %s AND day < %s
+            """, (hospital_id, start_day, end_day))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error retrieving cached utilization: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def save_utilization_days(self, hospital_id, rows):
+        """Cache daily utilization rows (dicts with day, scope, scope_key and the totals)"""
+        if not rows:
+            return 0
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            now = get_current_est_time().replace(tzinfo=None)
+            cursor.executemany("""
+                INSERT INTO device_utilization_daily (
+                    day, hospital_id, scope, scope_key, assigned_seconds,
+                    assignments, peak_concurrent, computed_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    assigned_seconds = VALUES(assigned_seconds),
+                    assignments = VALUES(assignments),
+                    peak_concurrent = VALUES(peak_concurrent),
+                    computed_at = VALUES(computed_at)
+            """, [(
+                row['day'], hospital_id, row['scope'], row['scope_key'], row['assigned_seconds'],
+                row['assignments'], row['peak_concurrent'], now
+            ) for row in rows])
+            connection.commit()
+            return len(rows)
+        except Exception as e:
+            connection.rollback()
+            print(f"Error caching utilization: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def delete_utilization_days(self, hospital_id, start_day, end_day):
+        """Drop cached utilization for start_day <= day < end_day so it is recomputed"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("""
+                DELETE FROM device_utilization_daily
+                WHERE hospital_id = %s AND day >= %s AND day < %s
+            """, (hospital_id, start_day, end_day))
+            connection.commit()
+            return cursor.rowcount
+        except Exception as e:
+            connection.rollback()
+            print(f"Error clearing cached utilization: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    # Edge gateway and ingest device state
+    def get_edge_registry(self):
+        """Get the readers and device tags an edge gateway needs to process reads locally"""
+        connection = self.get_connection()
+        cursor = connection.cursor(dictionary=True)
+        
+        try:
+            cursor.execute("""
+                SELECT id, reader_code, antenna_number, hospital_id, location_id
+                FROM readers
+            """)
+            readers = cursor.fetchall()
+            
+            cursor.execute("""
+                SELECT d.id, d.rfid_tag, ds.status, d.hospital_id, ds.location_id, ds.updated_at
+                FROM devices d
+                JOIN device_state ds ON ds.device_id = d.id
+                WHERE d.rfid_tag IS NOT NULL
+            """)
+            devices = cursor.fetchall()
+            
+            return readers, devices
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_reader_registry(self):
+        """Get every reader antenna with its hospital and location, for resolving reads in memory"""
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute("""
+                SELECT id, reader_code, antenna_number, hospital_id, location_id
+                FROM readers
+            """)
+            return fetch_records(cursor)
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def get_device_states(self, device_ids):
+        """Get the tracking state of the given devices, as iter_device_states returns it"""
+        if not device_ids:
+            return []
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute(f"""
+                SELECT d.id, d.rfid_tag, ds.status, d.hospital_id, ds.location_id,
+                       ds.last_reader_id, ds.last_seen_at, ds.updated_at
+                FROM devices d
+                JOIN device_state ds ON ds.device_id = d.id
+                WHERE d.id IN ({', '.join(['%s'] * len(device_ids))}) AND d.rfid_tag IS NOT NULL
+            """, list(device_ids))
+            return fetch_records(cursor)
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def iter_device_states(self, shard_count=1, shard_index=0, fetch_size=None):
+        """Iterate over the tracking state of the tagged devices in one ingest shard"""
+        query = """
+            SELECT d.id, d.rfid_tag, ds.status, d.hospital_id, ds.location_id,
+                   ds.last_reader_id, ds.last_seen_at, ds.updated_at
+            FROM devices d
+            JOIN device_state ds ON ds.device_id = d.id
+            WHERE d.rfid_tag IS NOT NULL
+        """
+        params = []
+        if shard_count > 1:
+            # Same split as device_state.shard_of
+            query += " AND MOD(CRC32(d.rfid_tag), %s) = %s"
+            params = [shard_count, shard_index]
+        return self._stream_query(query, params, fetch_size)
+    
+    def get_recorded_alert_ids(self, alert_ids):
+        """Get which of the given alert ids have already been written"""
+        if not alert_ids:
+            return set()
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            cursor.execute(f"""
+                SELECT id FROM rfid_alerts WHERE id IN ({', '.join(['%s'] * len(alert_ids))})
+            """, list(alert_ids))
+            return {alert_id for alert_id, in cursor.fetchall()}
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def apply_device_events(self, events):
+        """
+        Apply a batch of movement and missing events in one transaction.
+        
+        Used for events decided outside MySQL: forwarded by an edge gateway
+        or written behind by the ingest client's device state. Event ids are
+        assigned by the caller, so a batch that is resent after a lost
+        acknowledgement is a no-op. Events must be given in the order they
+        happened; each device ends up with the status and location of its
+        last event in the batch.
+        
+        Returns the ids of devices whose status was changed elsewhere since
+        the events were decided (see _write_movement_events); their events
+        were not applied and the caller should reload them.
+        """
+        if not events:
+            return []
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            conflicts = self._write_movement_events(cursor, events)
+            connection.commit()
+            self.defer_table_versions('reader_events', 'rfid_alerts', 'devices')
+            return conflicts
+        except Exception as e:
+            connection.rollback()
+            print(f"Error applying device events: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def ingest_reads(self, reads):
+        """
+        Record a batch of spooled tag reads in one transaction.
+        
+        Each read is a dict with id, reader_code, antenna_number, rfid_tag and
+        received_at. Reads are applied in order with the same status
+        transitions as live ingest. Row ids are derived from the read id, so
+        reads that were already written are recognized and skipped. Reads for
+        unknown readers or tags are skipped. Returns the number recorded.
+        """
+        if not reads:
+            return 0
+        
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        
+        try:
+            alert_ids = {read['id']: str(uuid.uuid5(uuid.NAMESPACE_URL, f"{read['id']}/alert")) for read in reads}
+            
+            # Reads from a batch that was committed before a crash are skipped,
+            # otherwise their status transitions would be applied twice
+            cursor.execute(f"""
+                SELECT id FROM rfid_alerts WHERE id IN ({', '.join(['%s'] * len(alert_ids))})
+            """, list(alert_ids.values()))
+            recorded = {alert_id for alert_id, in cursor.fetchall()}
+            reads = [read for read in reads if alert_ids[read['id']] not in recorded]
+            if not reads:
+                connection.commit()
+                return 0
+            
+            antennas = {(read['reader_code'], int(read['antenna_number'])) for read in reads}
+            cursor.execute(f"""
+                SELECT id, reader_code, antenna_number, hospital_id, location_id
+                FROM readers
+                WHERE (reader_code, antenna_number) IN ({', '.join(['(%s, %s)'] * len(antennas))})
+            """, [value for antenna in antennas for value in antenna])
+            readers = {(row['reader_code'], row['antenna_number']): row for row in fetch_records(cursor)}
+            
+            tags = {read['rfid_tag'] for read in reads}
+            # Only the narrow state rows are locked, not the devices rows the web app edits
+            cursor.execute(f"""
+                SELECT d.id, d.rfid_tag, ds.status
+                FROM devices d
+                JOIN device_state ds ON ds.device_id = d.id
+                WHERE d.rfid_tag IN ({', '.join(['%s'] * len(tags))})
+                FOR UPDATE OF ds
+            """, list(tags))
+            devices = {row['rfid_tag']: row for row in fetch_records(cursor)}
+            
+            events = []
+            for read in reads:
+                reader = readers.get((read['reader_code'], int(read['antenna_number'])))
+                device = devices.get(read['rfid_tag'])
+                if not reader or not device:
+                    continue
+                
+                previous_status = device['status']
+                if previous_status == 'In-Facility':
+                    status = 'Temporarily Out'
+                elif previous_status in ('Temporarily Out', 'Missing'):
+                    status = 'In-Facility'
+                else:
+                    status = previous_status
+                device['status'] = status
+                
+                events.append({
+                    'kind': 'movement',
+                    'event_id': str(uuid.uuid5(uuid.NAMESPACE_URL, f"{read['id']}/event")),
+                    'alert_id': alert_ids[read['id']],
+                    'device_id': device['id'],
+                    'rfid_tag': read['rfid_tag'],
+                    'reader_id': reader['id'],
+                    'reader_code': reader['reader_code'],
+                    'antenna_number': reader['antenna_number'],
+                    'hospital_id': reader['hospital_id'],
+                    'location_id': reader['location_id'],
+                    'status': status,
+                    'previous_status': previous_status,
+                    'timestamp': read['received_at']
+                })
+            
+            if events:
+                self._write_movement_events(cursor, events)
+            connection.commit()
+            if events:
+                self.defer_table_versions('reader_events', 'rfid_alerts', 'devices')
+            return len(events)
+        except Exception as e:
+            connection.rollback()
+            print(f"Error ingesting spooled reads: {e}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    
+    def _write_movement_events(self, cursor, events):
+        """
+        Insert reader events and alerts and update device state for a batch of events.
+        
+        Events are decided from a copy of the device's status (in memory or at
+        an edge gateway), so the status is compare-and-set: a device whose
+        status is no longer the previous_status of its first event in the
+        batch was changed elsewhere, for example marked Missing or assigned in
+        the web app. Its alerts are dropped and its status is left alone;
+        only the reads themselves are recorded. Events of devices that no
+        longer exist are dropped. Returns the ids of the devices whose events
+        were not applied, so the caller can reload them.
+        """
+        expected = {}  # device id -> status the batch was decided from
+        for event in events:
+            expected.setdefault(event['device_id'], event['previous_status'])
+        
+        cursor.execute(f"""
+            SELECT device_id, status FROM device_state
+            WHERE device_id IN ({', '.join(['%s'] * len(expected))})
+            FOR UPDATE
+        """, list(expected))
+        current = dict(cursor.fetchall())
+        conflicts = [device_id for device_id, status in expected.items() if current.get(device_id) != status]
+        
+        reader_events = []
+        alerts = []
+        devices = {}  # device id -> (status, location, last reader, last seen, updated at, id)
+        reads = {}  # device id -> (location, last reader, last seen, id), for changed devices
+        for event in events:
+            device_id = event['device_id']
+            if device_id not in current:
+                continue
+            if event['kind'] == 'movement':
+                reader_events.append((
+                    event['event_id'], device_id, event['rfid_tag'], event['reader_code'],
+                    event['antenna_number'], event['hospital_id'], event['location_id'], event['timestamp']
+                ))
+                if current[device_id] != expected[device_id]:
+                    reads[device_id] = (event['location_id'], event['reader_id'], event['timestamp'], device_id)
+            if current[device_id] != expected[device_id]:
+                continue
+            alerts.append((
+                event['alert_id'], device_id, event['reader_id'], event['hospital_id'],
+                event['location_id'], event['status'], event['previous_status'], event['timestamp']
+            ))
+            if event['kind'] == 'movement':
+                last_read = (event['reader_id'], event['timestamp'])
+            else:
+                # A missing event keeps the last read from earlier in the batch, if any
+                last_read = devices[device_id][2:4] if device_id in devices else (None, None)
+            devices[device_id] = (event['status'], event['location_id']) + last_read + (event['timestamp'], device_id)
+        
+        # A resent batch hits the primary keys and changes nothing; any other
+        # error (a missing reader, a truncated value) still fails the batch
+        if reader_events:
+            cursor.executemany("""
+                INSERT INTO reader_events (
+                    id, device_id, rfid_tag, reader_code, antenna_number,
+                    hospital_id, location_id, timestamp
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE id = id
+            """, reader_events)
+        
+        if alerts:
+            cursor.executemany("""
+                INSERT INTO rfid_alerts (
+                    id, device_id, reader_id, hospital_id, location_id,
+                    status, previous_status, timestamp
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE id = id
+            """, alerts)
+        
+        if devices:
+            cursor.executemany("""
+                UPDATE device_state
+                SET status = %s, location_id = COALESCE(%s, location_id),
+                    last_reader_id = COALESCE(%s, last_reader_id), last_seen_at = COALESCE(%s, last_seen_at),
+                    updated_at = %s
+                WHERE device_id = %s
+            """, list(devices.values()))
+        
+        if reads:
+            cursor.executemany("""
+                UPDATE device_state
+                SET location_id = %s, last_reader_id = %s, last_seen_at = GREATEST(COALESCE(last_seen_at, %s), %s)
+                WHERE device_id = %s
+            """, [(location_id, reader_id, seen, seen, device_id) for location_id, reader_id, seen, device_id in reads.values()])
+        
+        return conflicts
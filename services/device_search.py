@@ -0,0 +1,90 @@
+"""
+Device search helpers.
+
+Device search is backed by a MySQL FULLTEXT index built with the ngram parser
+over the columns staff actually search by (serial number, barcode, EPC code,
+model and assignee). The ngram parser indexes every substring of
+NGRAM_TOKEN_SIZE characters, so a quoted phrase query behaves like a substring
+match but is answered from the index instead of scanning the devices table.
+"""
+import re
+
+# Name of the FULLTEXT index created by DBService.initialize_db()
+SEARCH_INDEX_NAME = 'ft_devices_search'
+
+# Columns covered by the search index (order must match the index definition)
+SEARCH_COLUMNS = ('serial_number', 'barcode', 'rfid_tag', 'model', 'assigned_to')
+
+# Must match the server's ngram_token_size setting (MySQL default is 2)
+NGRAM_TOKEN_SIZE = 2
+
+# Characters with special meaning in BOOLEAN MODE queries
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+# Relevance boosts applied on top of the FULLTEXT score
+EXACT_MATCH_BOOST = 100
+PREFIX_MATCH_BOOST = 10
+
+
+def _escape_like(value):
+    """Escape LIKE wildcards so serials containing '_' or '%' match literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def get_search_terms(search_query):
+    """Split a raw search string into terms safe for BOOLEAN MODE"""
+    cleaned = _BOOLEAN_OPERATORS.sub(' ', search_query or '')
+    return [term for term in cleaned.split() if term]
+
+
+def build_search_filter(search_query, alias='d', use_index=True):
+    """
+    Build the SQL needed to filter and rank devices for a search string.
+
+    Returns a tuple of (where_sql, where_params, score_sql, score_params), or
+    None if the search string has no usable terms. Terms shorter than the ngram
+    token size cannot be answered by the FULLTEXT index; they are applied as
+    prefix LIKE filters on the rows the index matched for the other terms.
+    Only searches made of short terms alone (and all searches when the index
+    is missing) fall back to scanning with LIKE.
+    """
+    terms = get_search_terms(search_query)
+    if not terms:
+        return None
+
+    columns = [f"{alias}.{column}" for column in SEARCH_COLUMNS]
+    raw_query = ' '.join(terms)
+
+    # Exact identifier matches (a scanned barcode or EPC) rank first,
+    # then identifiers starting with the query, then FULLTEXT relevance
+    score_sql = (
+        f"(({alias}.serial_number = %s OR {alias}.barcode = %s OR {alias}.rfid_tag = %s) * {EXACT_MATCH_BOOST}"
+        f" + ({alias}.serial_number LIKE %s OR {alias}.barcode LIKE %s) * {PREFIX_MATCH_BOOST}"
+    )
+    prefix_pattern = f'{_escape_like(raw_query)}%'
+    score_params = [raw_query, raw_query, raw_query, prefix_pattern, prefix_pattern]
+
+    long_terms = [term for term in terms if len(term) >= NGRAM_TOKEN_SIZE]
+    where_clauses = []
+    where_params = []
+    if use_index and long_terms:
+        # Every long term must appear as a contiguous substring in one of the columns
+        match_sql = f"MATCH({', '.join(columns)}) AGAINST (%s IN BOOLEAN MODE)"
+        boolean_query = ' '.join(f'+"{term}"' for term in long_terms)
+        where_clauses.append(match_sql)
+        where_params.append(boolean_query)
+
+        score_sql += f" + {match_sql}"
+        score_params.append(boolean_query)
+        terms = [term for term in terms if len(term) < NGRAM_TOKEN_SIZE]
+
+    # Short typeahead terms use a prefix match, longer ones a substring
+    # match (only when the FULLTEXT index is unavailable)
+    for term in terms:
+        escaped = _escape_like(term)
+        pattern = f'{escaped}%' if len(term) < NGRAM_TOKEN_SIZE else f'%{escaped}%'
+        where_clauses.append('(' + ' OR '.join(f"{column} LIKE %s" for column in columns) + ')')
+        where_params.extend([pattern] * len(columns))
+
+    score_sql += ")"
+    return ' AND '.join(where_clauses), where_params, score_sql, score_params
@@ -0,0 +1,444 @@
+"""
+In-memory device state for the MQTT ingest client.
+
+The ingest process keeps the reader registry and the tracking state of
+every device in its shard (status, location, last reader, last seen) in
+memory, loaded from MySQL at startup. A tag read is decided with two
+dictionary lookups and no database reads; the resulting movement event
+(reader event, alert and new device state) is written afterwards.
+
+There are two ways the events reach MySQL:
+
+- Write-behind (spool disabled): events are queued in memory and a
+  background thread writes them in batches, at least every flush_interval
+  seconds. Device updates are coalesced to one UPDATE per device per batch.
+  Events still queued when the process dies are lost, as are reads that
+  were not yet written before; enable the spool when that matters.
+- Spool batches (apply_reads): the spool replayer hands over a batch of
+  durable reads, which is decided in memory and written in one transaction
+  before the memory is updated, so a failed batch can simply be retried.
+
+Devices are split between ingest processes by a CRC32 of their RFID tag
+(shard_count / shard_index); each process only loads and handles its own
+tags. The registry is reloaded every refresh_interval seconds to pick up
+new devices and readers and status changes made in the web app.
+
+A status changed in the web app between reloads is not overwritten: the
+status is compare-and-set when events are written, and a device whose
+stored status no longer matches the one its events were decided from only
+gets its reads recorded. Such devices are reloaded from MySQL right away,
+replacing their in-memory state.
+
+Each event is also checked against the alert rules (services/alert_rules.py)
+once it is decided; the rules are reloaded with the registry and the alerts
+they trigger are written by the same thread.
+"""
+import time
+import uuid
+import zlib
+import logging
+import threading
+from datetime import datetime
+
+from .db_service import DBService
+
+try:
+    from pycube_mdm.config.app_config import (
+        MISSING_THRESHOLD, DEVICE_STATE_FLUSH_INTERVAL, DEVICE_STATE_FLUSH_BATCH,
+        DEVICE_STATE_REFRESH_INTERVAL, INGEST_SHARD_COUNT, INGEST_SHARD_INDEX, get_current_est_time
+    )
+except ImportError:
+    try:
+        from ..config.app_config import (
+            MISSING_THRESHOLD, DEVICE_STATE_FLUSH_INTERVAL, DEVICE_STATE_FLUSH_BATCH,
+            DEVICE_STATE_REFRESH_INTERVAL, INGEST_SHARD_COUNT, INGEST_SHARD_INDEX, get_current_est_time
+        )
+    except ImportError:
+        from config.app_config import (
+            MISSING_THRESHOLD, DEVICE_STATE_FLUSH_INTERVAL, DEVICE_STATE_FLUSH_BATCH,
+            DEVICE_STATE_REFRESH_INTERVAL, INGEST_SHARD_COUNT, INGEST_SHARD_INDEX, get_current_est_time
+        )
+
+logger = logging.getLogger(__name__)
+
+# Longest wait in seconds between write attempts while MySQL is unreachable
+RETRY_MAX_DELAY = 30
+
+SPOOL_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _now():
+    """Device times are naive Eastern times, like the rest of the app"""
+    return get_current_est_time().replace(tzinfo=None)
+
+
+def _format_time(value):
+    return value.strftime(SPOOL_TIME_FORMAT) if value else None
+
+
+def shard_of(rfid_tag, shard_count):
+    """The shard a tag belongs to; the same as MOD(CRC32(rfid_tag), shard_count) in MySQL"""
+    return zlib.crc32(rfid_tag.encode()) % shard_count
+
+
+def next_status(status):
+    """The status a device moves to when it is read"""
+    if status == 'In-Facility':
+        return 'Temporarily Out'
+    if status in ('Temporarily Out', 'Missing'):
+        return 'In-Facility'
+    return status
+
+
+class DeviceStateTable:
+    """Authoritative device tracking state for one shard of tags"""
+
+    def __init__(self, write_behind=True, flush_interval=DEVICE_STATE_FLUSH_INTERVAL,
+                 batch_size=DEVICE_STATE_FLUSH_BATCH, refresh_interval=DEVICE_STATE_REFRESH_INTERVAL,
+                 shard_count=INGEST_SHARD_COUNT, shard_index=INGEST_SHARD_INDEX, rules=None):
+        self.db_service = DBService()
+        self.rules = rules  # AlertRuleEngine, or None
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        self.shard_count = max(shard_count, 1)
+        self.shard_index = shard_index
+
+        self._readers = {}  # (reader code, antenna number) -> reader
+        self._devices = {}  # rfid tag -> device state
+        self._pending = []  # events not yet written, oldest first
+        self._unflushed = {}  # device id -> number of pending events
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_refresh = 0
+        # After a restart the spool may replay reads whose batch was already
+        # committed; they are looked up until a batch has none
+        self._check_replayed = True
+        self._resync = False  # reload before the next batch, after a failed one
+
+        self.reads = 0
+        self.written = 0
+        self.conflicts = 0
+        self.flushes = 0
+        self.last_flush_at = None
+        self.last_error = None
+
+        self.refresh()
+
+    def start(self):
+        """Start the thread that writes queued events and reloads the registry"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='device-state', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the thread after writing what is queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def owns(self, rfid_tag):
+        """True if this process handles reads of the tag"""
+        return self.shard_count == 1 or shard_of(rfid_tag, self.shard_count) == self.shard_index
+
+    def record_read(self, reader_code, antenna_number, rfid_tag):
+        """
+        Apply a live tag read and queue its event for writing.
+
+        Returns the event, or None if the reader or tag isn't known.
+        """
+        try:
+            antenna_number = int(antenna_number)
+        except (TypeError, ValueError):
+            return None
+
+        with self._lock:
+            self.reads += 1
+            reader = self._readers.get((reader_code, antenna_number))
+            device = self._devices.get(rfid_tag)
+            if not reader or not device:
+                return None
+
+            timestamp = _now()
+            event = self._movement(reader, device, str(uuid.uuid4()), str(uuid.uuid4()), _format_time(timestamp))
+            self._devices[rfid_tag] = self._moved(device, event, timestamp)
+            self._queue(event)
+            if self.rules:
+                self.rules.evaluate(event, timestamp)
+            return event
+
+    def apply_reads(self, reads):
+        """
+        Apply a batch of spooled reads and write their events in one transaction.
+
+        Reads are dicts with id, reader_code, antenna_number, rfid_tag and
+        received_at, as handed over by SpoolReplayer. Event ids are derived
+        from the read id, so a batch that is retried is only written once.
+        The in-memory state only changes once the batch is committed; on an
+        error it is unchanged and the batch can be applied again. Returns the
+        number of events written.
+        """
+        if self._resync:
+            # The failed batch may have been committed after all; start again
+            # from what MySQL has, and skip its reads if it was
+            self.refresh(force=True)
+            self._check_replayed = True
+            self._resync = False
+
+        with self._lock:
+            alert_ids = {read['id']: str(uuid.uuid5(uuid.NAMESPACE_URL, f"{read['id']}/alert")) for read in reads}
+            if self._check_replayed and reads:
+                recorded = self.db_service.get_recorded_alert_ids(list(alert_ids.values()))
+                reads = [read for read in reads if alert_ids[read['id']] not in recorded]
+                if not recorded:
+                    self._check_replayed = False
+
+            events = []
+            timestamps = []
+            devices = {}  # rfid tag -> state after this batch
+            for read in reads:
+                self.reads += 1
+                try:
+                    reader = self._readers.get((read['reader_code'], int(read['antenna_number'])))
+                except (TypeError, ValueError):
+                    continue
+                rfid_tag = read['rfid_tag']
+                device = devices.get(rfid_tag) or self._devices.get(rfid_tag)
+                if not reader or not device:
+                    continue
+
+                event = self._movement(reader, device, str(uuid.uuid5(uuid.NAMESPACE_URL, f"{read['id']}/event")),
+                                       alert_ids[read['id']], read['received_at'])
+                timestamp = datetime.strptime(read['received_at'], SPOOL_TIME_FORMAT)
+                devices[rfid_tag] = self._moved(device, event, timestamp)
+                events.append(event)
+                timestamps.append(timestamp)
+
+            conflicts = []
+            if events:
+                try:
+                    conflicts = self.db_service.apply_device_events(events)
+                except Exception:
+                    self._resync = True
+                    raise
+                self.written += len(events)
+            stale = set(conflicts)
+            self._devices.update((rfid_tag, device) for rfid_tag, device in devices.items()
+                                 if device['id'] not in stale)
+            # Only committed events count towards the rules, so a retried batch isn't counted twice
+            if self.rules:
+                for event, timestamp in zip(events, timestamps):
+                    if event['device_id'] not in stale:
+                        self.rules.evaluate(event, timestamp)
+        if conflicts:
+            self._reload_devices(conflicts)
+        return len(events)
+
+    def sweep_missing(self):
+        """Mark devices Temporarily Out for longer than MISSING_THRESHOLD as Missing"""
+        now = _now()
+        events = []
+        devices = {}
+        with self._lock:
+            for rfid_tag, device in self._devices.items():
+                if device['status'] != 'Temporarily Out' or not device['updated_at']:
+                    continue
+                if now - device['updated_at'] < MISSING_THRESHOLD:
+                    continue
+
+                events.append({
+                    'kind': 'missing',
+                    'alert_id': str(uuid.uuid4()),
+                    'device_id': device['id'],
+                    'reader_id': device['last_reader_id'],
+                    'hospital_id': device['hospital_id'],
+                    'location_id': device['location_id'],
+                    'status': 'Missing',
+                    'previous_status': device['status'],
+                    'timestamp': _format_time(now)
+                })
+                devices[rfid_tag] = dict(device, status='Missing', updated_at=now)
+
+            if not events:
+                return []
+            conflicts = []
+            if self.write_behind:
+                for event in events:
+                    self._queue(event)
+            else:
+                conflicts = self.db_service.apply_device_events(events)
+                self.written += len(events)
+            stale = set(conflicts)
+            events = [event for event in events if event['device_id'] not in stale]
+            self._devices.update((rfid_tag, device) for rfid_tag, device in devices.items()
+                                 if device['id'] not in stale)
+            if self.rules:
+                for event in events:
+                    self.rules.evaluate(event, now)
+        if conflicts:
+            self._reload_devices(conflicts)
+        return [event['device_id'] for event in events]
+
+    def flush(self):
+        """Write one batch of queued events; returns how many were written"""
+        with self._lock:
+            batch = self._pending[:self.batch_size]
+        if not batch:
+            return 0
+
+        conflicts = self.db_service.apply_device_events(batch)
+
+        with self._lock:
+            del self._pending[:len(batch)]
+            for event in batch:
+                remaining = self._unflushed[event['device_id']] - 1
+                if remaining:
+                    self._unflushed[event['device_id']] = remaining
+                else:
+                    del self._unflushed[event['device_id']]
+        self.written += len(batch)
+        self.flushes += 1
+        self.last_flush_at = _now()
+        self.last_error = None
+        if conflicts:
+            self._reload_devices(conflicts)
+        return len(batch)
+
+    def refresh(self, force=False):
+        """
+        Reload readers and device states from MySQL.
+
+        A device keeps its in-memory state while it has unwritten events or,
+        unless force is given, while its stored state is not newer, i.e.
+        until it is changed elsewhere (for example in the web app). Devices
+        whose events conflicted with such a change are reloaded as soon as
+        the conflict is seen (_reload_devices).
+        """
+        readers = self.db_service.get_reader_registry()
+        stored = {row['rfid_tag']: dict(row) for row in
+                  self.db_service.iter_device_states(self.shard_count, self.shard_index)}
+
+        with self._lock:
+            unflushed = {device['rfid_tag']: device for device in self._devices.values()
+                         if device['id'] in self._unflushed}
+            for rfid_tag, device in stored.items():
+                current = self._devices.get(rfid_tag)
+                if rfid_tag in unflushed or (not force and current and current['id'] == device['id'] and
+                                             (device['updated_at'] or datetime.min) <= (current['updated_at'] or datetime.min)):
+                    stored[rfid_tag] = current
+            for rfid_tag, device in unflushed.items():
+                stored.setdefault(rfid_tag, device)
+
+            self._readers = {(r['reader_code'], int(r['antenna_number'])): r for r in readers}
+            self._devices = stored
+        if self.rules:
+            self.rules.refresh()
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        logger.info(f"Device state loaded: {len(readers)} readers, {len(stored)} devices "
+                    f"(shard {self.shard_index} of {self.shard_count})")
+
+    def _reload_devices(self, device_ids):
+        """
+        Replace the in-memory state of devices whose status was changed
+        elsewhere with what MySQL has, even if they have unwritten events.
+
+        If the reload fails the devices keep their stale state; their next
+        events conflict again and the reload is retried then.
+        """
+        try:
+            rows = self.db_service.get_device_states(device_ids)
+        except Exception as e:
+            logger.warning(f"Could not reload {len(device_ids)} devices changed elsewhere: {e}")
+            return
+        reloaded = set(device_ids)
+        with self._lock:
+            self.conflicts += len(reloaded)
+            for rfid_tag in [tag for tag, device in self._devices.items() if device['id'] in reloaded]:
+                del self._devices[rfid_tag]
+            for row in rows:
+                if self.owns(row['rfid_tag']):
+                    self._devices[row['rfid_tag']] = dict(row)
+        logger.info(f"Reloaded {len(reloaded)} devices whose status was changed elsewhere")
+
+    def get_stats(self):
+        """Get ingest and write statistics"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'readers': len(self._readers),
+            'devices': len(self._devices),
+            'reads': self.reads,
+            'pending': pending,
+            'written': self.written,
+            'conflicts': self.conflicts,
+            'flushes': self.flushes,
+            'last_flush_at': _format_time(self.last_flush_at),
+            'last_error': self.last_error,
+            'rules': self.rules.get_stats() if self.rules else None
+        }
+
+    def _movement(self, reader, device, event_id, alert_id, timestamp):
+        return {
+            'kind': 'movement',
+            'event_id': event_id,
+            'alert_id': alert_id,
+            'device_id': device['id'],
+            'rfid_tag': device['rfid_tag'],
+            'reader_id': reader['id'],
+            'reader_code': reader['reader_code'],
+            'antenna_number': reader['antenna_number'],
+            'hospital_id': reader['hospital_id'],
+            'location_id': reader['location_id'],
+            'status': next_status(device['status']),
+            'previous_status': device['status'],
+            'timestamp': timestamp
+        }
+
+    def _moved(self, device, event, timestamp):
+        return dict(device, status=event['status'], location_id=event['location_id'],
+                    last_reader_id=event['reader_id'], last_seen_at=timestamp, updated_at=timestamp)
+
+    def _queue(self, event):
+        self._pending.append(event)
+        self._unflushed[event['device_id']] = self._unflushed.get(event['device_id'], 0) + 1
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        """Write queued events and reload the registry, backing off while MySQL is unreachable"""
+        delay = 0
+        while True:
+            stopping = self._stop.is_set()
+            try:
+                while self.flush() >= self.batch_size:
+                    pass
+                if self.rules:
+                    while self.rules.flush() >= self.rules.batch_size:
+                        pass
+                delay = 0
+            except Exception as e:
+                self.last_error = str(e)
+                delay = min(max(delay * 2, 1), RETRY_MAX_DELAY)
+                logger.warning(f"Writing device state failed, retrying in {delay}s "
+                               f"({len(self._pending)} events queued): {e}")
+                if stopping:
+                    return
+                self._stop.wait(delay)
+                continue
+            if stopping:
+                return
+
+            if time.monotonic() >= self._next_refresh:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning(f"Could not reload device state: {e}")
+                    self._next_refresh = time.monotonic() + RETRY_MAX_DELAY
+
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
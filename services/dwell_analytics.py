@@ -0,0 +1,413 @@
+"""
+Dwell-time and location-occupancy analytics.
+
+A hospital's reader events for a date range are fetched as integer columns
+(seconds since the start of the range, device number, location number) and
+turned into NumPy arrays. Everything after that is vectorized; there is no
+Python loop over events.
+
+A visit is a run of consecutive reads of one device at one location. It
+lasts from the first read until the device is next read anywhere else, or
+until the end of the range for its last visit. A visit already in progress
+when the range starts is counted from the device's first read in the range.
+
+Out-of-facility time comes from the status changes in rfid_alerts. A device
+is out from an alert that leaves it Temporarily Out or Missing until the
+next alert that brings it back In-Facility.
+
+A range that ends in the future is cut off at the current time. Reports
+over long ranges take longer than a web request should, so the web app
+gets them from dwell_reports, which builds each report in a background
+thread and reuses it for REPORT_CACHE_TTL seconds.
+"""
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .db_service import DBService
+
+try:
+    from pycube_mdm.config.app_config import get_current_est_time
+except ImportError:
+    try:
+        from ..config.app_config import get_current_est_time
+    except ImportError:
+        from config.app_config import get_current_est_time
+
+# How far before the range to look for each device's status at the start
+STATUS_LOOKBACK = timedelta(days=30)
+
+# Seconds a built report is reused (the dwell pages' conditional GET bucket)
+REPORT_CACHE_TTL = 300
+
+# Built reports kept per worker
+REPORT_CACHE_SIZE = 32
+
+# Seconds a request waits for a report before telling the client to come back
+REPORT_WAIT = 20
+
+
+def dwell_report(hospital_id, start, end, db_service=None, device_limit=None):
+    """
+    Build the dwell report for a hospital over [start, end).
+
+    Returns a dict with totals, per-location rows and per-device rows (the
+    device_limit devices with the most time out of the facility, or all).
+    Durations are in minutes.
+    """
+    db_service = db_service or DBService()
+    timings = {}
+    # Open visits and trips out are counted up to now, not to the end of today
+    end = max(start, min(end, get_current_est_time().replace(tzinfo=None)))
+    horizon = int((end - start).total_seconds())
+
+    began = time.perf_counter()
+    loaded = {'devices': [], 'locations': [], 'events': [], 'status_changes': []}
+    for kind, rows in db_service.iter_dwell_data(hospital_id, start, end, STATUS_LOOKBACK):
+        if kind in ('devices', 'locations'):
+            loaded[kind] = rows
+        else:
+            loaded[kind].append(np.asarray(rows, dtype=np.int64).reshape(-1, 3))
+    devices, locations = loaded['devices'], loaded['locations']
+    t, dev, loc = _load(loaded['events'], 3)
+    status_t, status_dev, status_out = _load(loaded['status_changes'], 3)
+    timings['load_seconds'] = round(time.perf_counter() - began, 3)
+
+    began = time.perf_counter()
+    n_devices, n_locations = len(devices), len(locations)
+    visits = compute_visits(t, dev, loc, horizon)
+    location_rows = summarize_locations(visits, n_locations, n_devices)
+    device_rows = summarize_devices(visits, n_devices, n_locations)
+    outs = compute_out_intervals(status_t, status_dev, status_out.astype(bool), horizon)
+    out_rows = summarize_out_intervals(outs, n_devices)
+    timings['compute_seconds'] = round(time.perf_counter() - began, 3)
+
+    report_locations = []
+    for row in location_rows:
+        location = locations[row['n']]
+        report_locations.append(dict(row, location_id=location['id'], name=location['name'], type=location['type']))
+    report_locations.sort(key=lambda row: row['total_minutes'], reverse=True)
+
+    report_devices = []
+    for n in np.union1d(device_rows['n'], out_rows['n']).tolist():
+        device = devices[n]
+        row = {'device_id': device['id'], 'serial_number': device['serial_number'], 'model': device['model']}
+        row.update(device_rows['rows'].get(n, EMPTY_DEVICE))
+        row.update(out_rows['rows'].get(n, EMPTY_OUT))
+        top = row.pop('top_location_n')
+        row['top_location'] = locations[top]['name'] if top is not None else None
+        report_devices.append(row)
+    report_devices.sort(key=lambda row: (row['out_minutes'], row['visits']), reverse=True)
+
+    return {
+        'hospital_id': hospital_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': {
+            'events': int(len(t)),
+            'status_changes': int((status_t >= 0).sum()),
+            'visits': int(len(visits['start'])),
+            'devices_seen': int(len(device_rows['n'])),
+            'locations_visited': len(location_rows),
+            'exits': int((~outs['carried']).sum()),
+            'out_minutes': _minutes(outs['duration'].sum())
+        },
+        'locations': report_locations,
+        'devices': report_devices[:device_limit] if device_limit else report_devices,
+        'timings': timings
+    }
+
+
+class ReportBuilder:
+    """
+    Builds dwell reports in background threads and keeps the recent ones.
+
+    Each worker has its own; a report already being built is not started
+    again, the request just waits for it.
+    """
+
+    def __init__(self, ttl=REPORT_CACHE_TTL, max_entries=REPORT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._reports = OrderedDict()  # (hospital id, start, end) -> (built at, report)
+        self._building = {}  # (hospital id, start, end) -> threading.Event
+        self._lock = threading.Lock()
+
+    def get(self, hospital_id, start, end, device_limit=None, wait=REPORT_WAIT):
+        """
+        Get the report for a hospital and range, building it if needed.
+
+        Returns None if it isn't ready after wait seconds; it keeps being
+        built, so asking again later returns it. Errors from building the
+        report are raised.
+        """
+        key = (hospital_id, start, end)
+        with self._lock:
+            cached = self._reports.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self._reports.move_to_end(key)
+                return self._limit(cached[1], device_limit)
+            done = self._building.get(key)
+            if done is None:
+                done = self._building[key] = threading.Event()
+                threading.Thread(target=self._build, args=(key, done), name='dwell-report', daemon=True).start()
+
+        if not done.wait(wait):
+            return None
+        with self._lock:
+            cached = self._reports.get(key)
+        if cached is None or isinstance(cached[1], Exception):
+            raise cached[1] if cached else RuntimeError("Dwell report was not built")
+        return self._limit(cached[1], device_limit)
+
+    def _build(self, key, done):
+        try:
+            result = dwell_report(*key)
+        except Exception as e:
+            print(f"Error building dwell report: {e}")
+            result = e
+        with self._lock:
+            if isinstance(result, Exception):
+                # Kept only for the requests waiting on this build
+                self._reports[key] = (time.monotonic() - self.ttl, result)
+            else:
+                self._reports[key] = (time.monotonic(), result)
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.max_entries:
+                self._reports.popitem(last=False)
+            del self._building[key]
+        done.set()
+
+    @staticmethod
+    def _limit(report, device_limit):
+        if not device_limit:
+            return report
+        return dict(report, devices=report['devices'][:device_limit])
+
+
+# Shared by every request handled by this process
+dwell_reports = ReportBuilder()
+
+
+def compute_visits(t, dev, loc, horizon):
+    """
+    Group events into visits.
+
+    Returns arrays of device, location, start and duration (seconds), one
+    entry per visit, ordered by device and start.
+    """
+    if not len(t):
+        empty = np.empty(0, dtype=np.int64)
+        return {'device': empty, 'location': empty, 'start': empty, 'duration': empty}
+
+    order = _device_time_order(dev, t, horizon)
+    t, dev, loc = t[order], dev[order], loc[order]
+
+    new_device = np.empty(len(t), dtype=bool)
+    new_device[0] = True
+    new_device[1:] = dev[1:] != dev[:-1]
+    new_visit = new_device.copy()
+    new_visit[1:] |= loc[1:] != loc[:-1]
+
+    starts = np.flatnonzero(new_visit)
+    visit_start = t[starts]
+
+    # A visit ends where the device's next visit starts, or at the horizon
+    visit_end = np.full(len(starts), horizon, dtype=np.int64)
+    same_device_next = ~new_device[starts[1:]]
+    visit_end[:-1][same_device_next] = visit_start[1:][same_device_next]
+
+    return {
+        'device': dev[starts],
+        'location': loc[starts],
+        'start': visit_start,
+        'duration': np.maximum(visit_end - visit_start, 0)
+    }
+
+
+def summarize_locations(visits, n_locations, n_devices):
+    """Visit count, distinct devices and dwell statistics per location"""
+    location = visits['location']
+    duration = visits['duration']
+
+    counts = np.bincount(location, minlength=n_locations)
+    totals = np.bincount(location, weights=duration, minlength=n_locations)
+    median, p90 = _group_quantiles(location, duration, (0.5, 0.9), n_locations)
+
+    # Distinct devices per location: unique (location, device) pairs
+    pairs = _unique_sorted(np.sort(location * n_devices + visits['device']))
+    device_counts = np.bincount(pairs // n_devices, minlength=n_locations)
+
+    rows = []
+    for n in np.flatnonzero(counts):
+        rows.append({
+            'n': int(n),
+            'visits': int(counts[n]),
+            'devices': int(device_counts[n]),
+            'total_minutes': _minutes(totals[n]),
+            'avg_minutes': _minutes(totals[n] / counts[n]),
+            'median_minutes': _minutes(median[n]),
+            'p90_minutes': _minutes(p90[n])
+        })
+    return rows
+
+
+def summarize_devices(visits, n_devices, n_locations):
+    """Visit count, distinct locations and the location with the most dwell per device"""
+    device = visits['device']
+    if not len(device):
+        return {'n': np.empty(0, dtype=np.int64), 'rows': {}}
+
+    counts = np.bincount(device, minlength=n_devices)
+
+    # Dwell per (device, location), then the largest per device
+    keys = device * n_locations + visits['location']
+    order = np.argsort(keys)
+    keys = keys[order]
+    pair_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    dwell = np.add.reduceat(visits['duration'][order], pair_starts)
+    pair_device = keys[pair_starts] // n_locations
+    pair_location = keys[pair_starts] % n_locations
+    location_counts = np.bincount(pair_device, minlength=n_devices)
+
+    # Pairs are ordered by device; order each device's pairs by dwell, largest first
+    stride = int(dwell.max()) + 1
+    order = np.argsort(pair_device * stride + (stride - 1 - dwell))
+    first = np.r_[True, pair_device[order][1:] != pair_device[order][:-1]]
+    top = order[first]
+
+    seen = np.flatnonzero(counts)
+    rows = {}
+    for n, location_n in zip(pair_device[top], pair_location[top]):
+        rows[int(n)] = {
+            'visits': int(counts[n]),
+            'locations': int(location_counts[n]),
+            'top_location_n': int(location_n)
+        }
+    return {'n': seen, 'rows': rows}
+
+
+def compute_out_intervals(t, dev, out, horizon):
+    """
+    Find the periods each device spent out of the facility.
+
+    Rows with t == -1 carry a device's status from before the range. Returns
+    arrays of device, start and duration (seconds), one entry per period,
+    and whether the period began before the range (so is not an exit).
+    """
+    if not len(t):
+        empty = np.empty(0, dtype=np.int64)
+        return {'device': empty, 'start': empty, 'duration': empty, 'carried': np.empty(0, dtype=bool)}
+
+    order = _device_time_order(dev, t, horizon)
+    t, dev, out = t[order], dev[order], out[order]
+
+    new_device = np.empty(len(t), dtype=bool)
+    new_device[0] = True
+    new_device[1:] = dev[1:] != dev[:-1]
+    changed = new_device.copy()
+    changed[1:] |= out[1:] != out[:-1]
+
+    starts = np.flatnonzero(changed)
+    period_start = np.maximum(t[starts], 0)
+    period_end = np.full(len(starts), horizon, dtype=np.int64)
+    same_device_next = ~new_device[starts[1:]]
+    period_end[:-1][same_device_next] = t[starts[1:]][same_device_next]
+
+    is_out = out[starts]
+    return {
+        'device': dev[starts][is_out],
+        'start': period_start[is_out],
+        'duration': np.maximum(period_end[is_out] - period_start[is_out], 0),
+        'carried': t[starts][is_out] < 0
+    }
+
+
+def summarize_out_intervals(outs, n_devices):
+    """Exits, total and longest time out of the facility per device"""
+    device = outs['device']
+    if not len(device):
+        return {'n': np.empty(0, dtype=np.int64), 'rows': {}}
+
+    counts = np.bincount(device, minlength=n_devices)
+    exits = np.bincount(device, weights=~outs['carried'], minlength=n_devices)
+    totals = np.bincount(device, weights=outs['duration'], minlength=n_devices)
+    longest = np.zeros(n_devices, dtype=np.int64)
+    np.maximum.at(longest, device, outs['duration'])
+
+    seen = np.flatnonzero(counts)
+    rows = {}
+    for n in seen:
+        rows[int(n)] = {
+            'exits': int(exits[n]),
+            'out_minutes': _minutes(totals[n]),
+            'longest_out_minutes': _minutes(longest[n])
+        }
+    return {'n': seen, 'rows': rows}
+
+
+EMPTY_DEVICE = {'visits': 0, 'locations': 0, 'top_location_n': None}
+EMPTY_OUT = {'exits': 0, 'out_minutes': 0.0, 'longest_out_minutes': 0.0}
+
+
+def _load(arrays, columns):
+    """Concatenate batches of integer rows into one array per column"""
+    data = np.concatenate(arrays) if arrays else np.empty((0, columns), dtype=np.int64)
+    return [data[:, i] for i in range(columns)]
+
+
+def _group_quantiles(groups, values, quantiles, n_groups):
+    """
+    The (lower) quantiles of non-negative integer values within each group;
+    0 for empty groups. Returns one array per quantile.
+    """
+    results = [np.zeros(n_groups, dtype=np.float64) for _ in quantiles]
+    if not len(values):
+        return results
+
+    # One sort of a combined key orders by group, then value
+    stride = int(values.max()) + 1
+    ordered = np.sort(groups * stride + values) % stride
+
+    counts = np.bincount(groups, minlength=n_groups)
+    offsets = np.cumsum(counts) - counts
+    present = counts > 0
+    for result, q in zip(results, quantiles):
+        result[present] = ordered[offsets[present] + ((counts[present] - 1) * q).astype(np.int64)]
+    return results
+
+
+def _unique_sorted(values):
+    """Drop repeats from a sorted array"""
+    if not len(values):
+        return values
+    return values[np.r_[True, values[1:] != values[:-1]]]
+
+
+def _device_time_order(dev, t, horizon):
+    """Indices that sort events by device, then time (t is in [-1, horizon])"""
+    # One sort of a combined key is much faster than np.lexsort on two keys
+    return np.argsort(dev * (horizon + 2) + (t + 1))
+
+
+def _minutes(seconds):
+    return round(float(seconds) / 60, 1)
+
+
+def parse_range(start_date=None, end_date=None, default_days=30):
+    """
+    Turn YYYY-MM-DD strings into a [start, end) datetime range.
+
+    The end date is inclusive. Defaults to the last default_days days.
+    """
+    today = get_current_est_time().date()
+    end_day = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+    start_day = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else end_day - timedelta(days=default_days - 1)
+    if start_day > end_day:
+        raise ValueError("Start date is after end date")
+    start = datetime.combine(start_day, datetime.min.time())
+    end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    return start, end
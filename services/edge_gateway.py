@@ -0,0 +1,488 @@
+"""
+Edge gateway mode for the MQTT ingest client.
+
+Processing a tag read centrally takes several round trips to MySQL. At the
+edge, the reader registry, the device tag map and each device's status are
+kept in a local SQLite database (mirrored in memory), so a read is handled
+with dictionary lookups and one local transaction.
+
+Every status change is written to a local outbox in the same transaction as
+the new device state. A background thread forwards the outbox to MySQL in
+order, a batch per transaction (DBService.apply_device_events), and deletes
+events only after MySQL has committed them. Event ids are assigned here, so
+a batch resent after a crash or lost acknowledgement is ignored centrally.
+While MySQL is unreachable the outbox simply grows on disk and is replayed
+in order, with exponential backoff between attempts, once the link returns.
+
+Forwarded status changes are compare-and-set centrally. A device whose
+status was changed in MySQL since the edge decided its events (for example
+assigned in the web app) has those events dropped, and its local state is
+reloaded from MySQL.
+
+Reads of a tag or antenna the edge doesn't know yet, e.g. a device registered
+centrally since the last registry refresh, are held in memory and the
+registry is refreshed early (at most every UNKNOWN_REFRESH_INTERVAL
+seconds). They are then recorded with their original time, or dropped if
+MySQL doesn't know them either.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+from datetime import datetime
+
+from .db_service import DBService
+
+try:
+    from pycube_mdm.config.app_config import (
+        MISSING_THRESHOLD, EDGE_DB_PATH, EDGE_FORWARD_BATCH_SIZE, EDGE_FORWARD_INTERVAL,
+        EDGE_REGISTRY_REFRESH_INTERVAL, EDGE_RETRY_MAX_DELAY, get_current_est_time
+    )
+except ImportError:
+    try:
+        from ..config.app_config import (
+            MISSING_THRESHOLD, EDGE_DB_PATH, EDGE_FORWARD_BATCH_SIZE, EDGE_FORWARD_INTERVAL,
+            EDGE_REGISTRY_REFRESH_INTERVAL, EDGE_RETRY_MAX_DELAY, get_current_est_time
+        )
+    except ImportError:
+        from config.app_config import (
+            MISSING_THRESHOLD, EDGE_DB_PATH, EDGE_FORWARD_BATCH_SIZE, EDGE_FORWARD_INTERVAL,
+            EDGE_REGISTRY_REFRESH_INTERVAL, EDGE_RETRY_MAX_DELAY, get_current_est_time
+        )
+
+logger = logging.getLogger(__name__)
+
+# Seconds before retrying a registry refresh that failed
+REFRESH_RETRY_DELAY = 30
+
+# Minimum seconds between registry refreshes triggered by unknown reads
+UNKNOWN_REFRESH_INTERVAL = 30
+
+# Reads of unknown tags held until the next refresh; the oldest are dropped beyond this
+UNKNOWN_QUEUE_SIZE = 10000
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def _now():
+    """Edge timestamps are naive Eastern times, like the rest of the app"""
+    return get_current_est_time().replace(tzinfo=None)
+
+
+def _format_time(value):
+    return value.strftime(TIMESTAMP_FORMAT) if value else None
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class EdgeStore:
+    """SQLite persistence for the registry, device state and the outbox"""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._initialize()
+
+    def _initialize(self):
+        with self._lock:
+            cursor = self._connection.cursor()
+            # WAL lets the forwarder read the outbox while reads are recorded;
+            # FULL sync makes every recorded read survive a power loss
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = FULL")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS readers (
+                    reader_code TEXT NOT NULL,
+                    antenna_number INTEGER NOT NULL,
+                    id TEXT NOT NULL,
+                    hospital_id TEXT,
+                    location_id TEXT,
+                    PRIMARY KEY (reader_code, antenna_number)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS devices (
+                    rfid_tag TEXT PRIMARY KEY,
+                    id TEXT NOT NULL,
+                    status TEXT,
+                    hospital_id TEXT,
+                    location_id TEXT,
+                    last_reader_id TEXT,
+                    updated_at TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device_id TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            """)
+            cursor.close()
+
+    def load_registry(self):
+        """Get the stored readers and devices as lists of dicts"""
+        with self._lock:
+            self._connection.row_factory = sqlite3.Row
+            try:
+                readers = [dict(row) for row in self._connection.execute("SELECT * FROM readers")]
+                devices = [dict(row) for row in self._connection.execute("SELECT * FROM devices")]
+            finally:
+                self._connection.row_factory = None
+        for device in devices:
+            device['updated_at'] = _parse_time(device['updated_at'])
+        return readers, devices
+
+    def replace_registry(self, readers, devices):
+        """Replace the stored readers and devices in one transaction"""
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("DELETE FROM readers")
+                cursor.executemany("""
+                    INSERT INTO readers (reader_code, antenna_number, id, hospital_id, location_id)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [(r['reader_code'], r['antenna_number'], r['id'], r['hospital_id'], r['location_id'])
+                      for r in readers])
+                cursor.execute("DELETE FROM devices")
+                cursor.executemany("""
+                    INSERT INTO devices (rfid_tag, id, status, hospital_id, location_id, last_reader_id, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [(d['rfid_tag'], d['id'], d['status'], d['hospital_id'], d['location_id'],
+                       d.get('last_reader_id'), _format_time(d['updated_at'])) for d in devices])
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def record(self, device, event):
+        """Save a device's new state and queue its event in one transaction"""
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("""
+                    UPDATE devices
+                    SET status = ?, location_id = ?, last_reader_id = ?, updated_at = ?
+                    WHERE rfid_tag = ?
+                """, (device['status'], device['location_id'], device['last_reader_id'],
+                      _format_time(device['updated_at']), device['rfid_tag']))
+                cursor.execute("INSERT INTO outbox (device_id, payload) VALUES (?, ?)",
+                               (device['id'], json.dumps(event)))
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def replace_devices(self, device_ids, devices):
+        """Replace the stored state of some devices; ids without a new state are deleted"""
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.executemany("DELETE FROM devices WHERE id = ?", [(device_id,) for device_id in device_ids])
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO devices (rfid_tag, id, status, hospital_id, location_id, last_reader_id, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [(d['rfid_tag'], d['id'], d['status'], d['hospital_id'], d['location_id'],
+                       d.get('last_reader_id'), _format_time(d['updated_at'])) for d in devices])
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def peek_outbox(self, limit):
+        """Get the oldest queued events as (seq, event) pairs"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT seq, payload FROM outbox ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def ack_outbox(self, up_to_seq):
+        """Delete events that MySQL has committed"""
+        with self._lock:
+            self._connection.execute("DELETE FROM outbox WHERE seq <= ?", (up_to_seq,))
+
+    def pending_devices(self):
+        """Get the ids of devices with events not yet forwarded"""
+        with self._lock:
+            return {row[0] for row in self._connection.execute("SELECT DISTINCT device_id FROM outbox")}
+
+    def outbox_size(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class EdgeGateway:
+    """Processes tag reads locally and forwards the resulting events to MySQL"""
+
+    def __init__(self, path=EDGE_DB_PATH, batch_size=EDGE_FORWARD_BATCH_SIZE,
+                 forward_interval=EDGE_FORWARD_INTERVAL, refresh_interval=EDGE_REGISTRY_REFRESH_INTERVAL):
+        self.store = EdgeStore(path)
+        self.batch_size = batch_size
+        self.forward_interval = forward_interval
+        self.refresh_interval = refresh_interval
+
+        self._readers = {}  # (reader code, antenna number) -> reader
+        self._devices = {}  # rfid tag -> device state
+        self._unknown = deque(maxlen=UNKNOWN_QUEUE_SIZE)  # (reader code, antenna, tag, time) of unknown reads
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_refresh = 0
+        self._last_refresh = 0
+
+        self.forwarded = 0
+        self.conflicts = 0
+        self.unknown_dropped = 0
+        self.last_forward_at = None
+        self.last_error = None
+
+        readers, devices = self.store.load_registry()
+        self._set_registry(readers, devices)
+        if not self._readers:
+            # First start: the registry has to come from MySQL once
+            self.refresh_registry()
+
+    def start(self):
+        """Start the forwarding thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='edge-forwarder', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop forwarding after the current batch"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def record_tag_read(self, reader_code, antenna_number, rfid_tag, timestamp=None):
+        """
+        Apply a tag read to the local device state.
+
+        Uses the same transitions as the central ingest path: an In-Facility
+        device becomes Temporarily Out, a Temporarily Out or Missing device
+        becomes In-Facility. Returns the queued event, or None if the reader
+        or tag isn't known yet; such reads are held until the registry has
+        been refreshed.
+        """
+        try:
+            antenna_number = int(antenna_number)
+        except (TypeError, ValueError):
+            return None
+
+        with self._lock:
+            reader = self._readers.get((reader_code, antenna_number))
+            device = self._devices.get(rfid_tag)
+            if not reader or not device:
+                if len(self._unknown) == self._unknown.maxlen:
+                    self.unknown_dropped += 1
+                self._unknown.append((reader_code, antenna_number, rfid_tag, timestamp or _now()))
+                return None
+
+            previous_status = device['status']
+            if previous_status == 'In-Facility':
+                status = 'Temporarily Out'
+            elif previous_status in ('Temporarily Out', 'Missing'):
+                status = 'In-Facility'
+            else:
+                status = previous_status
+
+            timestamp = timestamp or _now()
+            event = {
+                'kind': 'movement',
+                'event_id': str(uuid.uuid4()),
+                'alert_id': str(uuid.uuid4()),
+                'device_id': device['id'],
+                'rfid_tag': rfid_tag,
+                'reader_id': reader['id'],
+                'reader_code': reader_code,
+                'antenna_number': antenna_number,
+                'hospital_id': reader['hospital_id'],
+                'location_id': reader['location_id'],
+                'status': status,
+                'previous_status': previous_status,
+                'timestamp': _format_time(timestamp)
+            }
+            updated = dict(device, status=status, location_id=reader['location_id'],
+                           last_reader_id=reader['id'], updated_at=timestamp)
+            self.store.record(updated, event)
+            self._devices[rfid_tag] = updated
+            return event
+
+    def sweep_missing(self):
+        """Mark devices Temporarily Out for longer than MISSING_THRESHOLD as Missing"""
+        now = _now()
+        marked = []
+        with self._lock:
+            for rfid_tag, device in list(self._devices.items()):
+                if device['status'] != 'Temporarily Out' or not device['updated_at']:
+                    continue
+                if now - device['updated_at'] < MISSING_THRESHOLD:
+                    continue
+
+                event = {
+                    'kind': 'missing',
+                    'alert_id': str(uuid.uuid4()),
+                    'device_id': device['id'],
+                    'reader_id': device.get('last_reader_id'),
+                    'hospital_id': device['hospital_id'],
+                    'location_id': device['location_id'],
+                    'status': 'Missing',
+                    'previous_status': device['status'],
+                    'timestamp': _format_time(now)
+                }
+                updated = dict(device, status='Missing', updated_at=now)
+                self.store.record(updated, event)
+                self._devices[rfid_tag] = updated
+                marked.append(device['id'])
+        return marked
+
+    def refresh_registry(self):
+        """
+        Reload readers and devices from MySQL.
+
+        Devices with events still in the outbox keep their local state, which
+        is newer than what MySQL has.
+        """
+        try:
+            readers, central_devices = DBService().get_edge_registry()
+        except Exception as e:
+            logger.warning(f"Could not refresh edge registry: {e}")
+            self._last_refresh = time.monotonic()
+            self._next_refresh = self._last_refresh + REFRESH_RETRY_DELAY
+            return False
+
+        with self._lock:
+            pending = self.store.pending_devices()
+            local = {device['id']: device for device in self._devices.values()}
+            devices = []
+            for device in central_devices:
+                if device['id'] in pending and device['id'] in local:
+                    devices.append(local[device['id']])
+                else:
+                    devices.append(dict(device, last_reader_id=local.get(device['id'], {}).get('last_reader_id')))
+            self.store.replace_registry(readers, devices)
+            self._set_registry(readers, devices)
+            unknown = list(self._unknown)
+            self._unknown.clear()
+        self._last_refresh = time.monotonic()
+        self._next_refresh = self._last_refresh + self.refresh_interval
+        logger.info(f"Edge registry refreshed: {len(readers)} readers, {len(devices)} devices")
+
+        # Reads that arrived before their tag was known; what is still
+        # unknown isn't registered centrally either
+        recorded = 0
+        for reader_code, antenna_number, rfid_tag, timestamp in unknown:
+            with self._lock:
+                known = (reader_code, antenna_number) in self._readers and rfid_tag in self._devices
+            if known and self.record_tag_read(reader_code, antenna_number, rfid_tag, timestamp):
+                recorded += 1
+            else:
+                self.unknown_dropped += 1
+        if unknown:
+            logger.info(f"Recorded {recorded} of {len(unknown)} reads held for unknown tags")
+        return True
+
+    def reload_devices(self, device_ids):
+        """Replace the local state of devices with what MySQL has, even if they have queued events"""
+        rows = [dict(row) for row in DBService().get_device_states(device_ids)]
+        with self._lock:
+            local = {device['id']: device for device in self._devices.values()}
+            devices = [dict(row, last_reader_id=row['last_reader_id'] or local.get(row['id'], {}).get('last_reader_id'))
+                       for row in rows]
+            self.store.replace_devices(device_ids, devices)
+            for device_id in device_ids:
+                if device_id in local:
+                    self._devices.pop(local[device_id]['rfid_tag'], None)
+            self._devices.update((device['rfid_tag'], device) for device in devices)
+
+    def forward_once(self):
+        """Forward one batch of queued events; returns how many were sent"""
+        batch = self.store.peek_outbox(self.batch_size)
+        if not batch:
+            return 0
+
+        conflicts = DBService().apply_device_events([event for _, event in batch])
+        # Only acknowledge after MySQL has committed; a crash in between
+        # resends the batch, which MySQL ignores
+        self.store.ack_outbox(batch[-1][0])
+
+        if conflicts:
+            # Changed centrally since the events were decided; the events
+            # still queued for these devices will be dropped the same way
+            self.conflicts += len(conflicts)
+            logger.info(f"{len(conflicts)} devices were changed centrally, reloading them")
+            try:
+                self.reload_devices(conflicts)
+            except Exception as e:
+                # The next registry refresh picks them up once their events are forwarded
+                logger.warning(f"Could not reload devices changed centrally: {e}")
+
+        self.forwarded += len(batch)
+        self.last_forward_at = _now()
+        self.last_error = None
+        return len(batch)
+
+    def get_stats(self):
+        """Get forwarding statistics"""
+        return {
+            'readers': len(self._readers),
+            'devices': len(self._devices),
+            'pending': self.store.outbox_size(),
+            'forwarded': self.forwarded,
+            'conflicts': self.conflicts,
+            'unknown_queued': len(self._unknown),
+            'unknown_dropped': self.unknown_dropped,
+            'last_forward_at': _format_time(self.last_forward_at),
+            'last_error': self.last_error
+        }
+
+    def _set_registry(self, readers, devices):
+        self._readers = {(r['reader_code'], int(r['antenna_number'])): r for r in readers}
+        self._devices = {d['rfid_tag']: d for d in devices}
+
+    def _run(self):
+        """Forward the outbox in order, backing off while MySQL is unreachable"""
+        delay = 0
+        while not self._stop.is_set():
+            try:
+                sent = self.forward_once()
+                delay = 0
+            except Exception as e:
+                self.last_error = str(e)
+                delay = min(max(delay * 2, 1), EDGE_RETRY_MAX_DELAY)
+                logger.warning(f"Edge forwarding failed, retrying in {delay}s: {e}")
+                self._stop.wait(delay)
+                continue
+
+            now = time.monotonic()
+            if now >= self._next_refresh or (self._unknown and now - self._last_refresh >= UNKNOWN_REFRESH_INTERVAL):
+                self.refresh_registry()
+
+            # Keep draining a backlog; otherwise wait for new events
+            if sent < self.batch_size:
+                self._stop.wait(self.forward_interval)
@@ -0,0 +1,258 @@
+"""
+Buffered reader heartbeat ingestion.
+
+Readers report a heartbeat per antenna every few seconds. Instead of writing
+each one to the database, heartbeats are coalesced in memory (only the newest
+per reader is kept) and flushed with one multi-row UPDATE of last_heartbeat
+every HEARTBEAT_FLUSH_INTERVAL seconds.
+
+Every flush also extends each reader's current uptime run (see
+DBService._extend_uptime_intervals), which is what reader uptime
+percentages are computed from.
+
+The same background thread also refreshes this process's view of every
+reader's last heartbeat from the database, so online/offline state can be
+answered from memory even for heartbeats received by another process (for
+example the MQTT ingest client).
+"""
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from .db_service import DBService
+
+try:
+    from pycube_mdm.config.app_config import (
+        HEARTBEAT_FLUSH_INTERVAL, READER_OFFLINE_THRESHOLD, READER_UPTIME_RETENTION
+    )
+except ImportError:
+    try:
+        from ..config.app_config import (
+            HEARTBEAT_FLUSH_INTERVAL, READER_OFFLINE_THRESHOLD, READER_UPTIME_RETENTION
+        )
+    except ImportError:
+        from config.app_config import (
+            HEARTBEAT_FLUSH_INTERVAL, READER_OFFLINE_THRESHOLD, READER_UPTIME_RETENTION
+        )
+
+# Minimum seconds between reader list reloads triggered by unknown readers
+UNKNOWN_READER_RELOAD_INTERVAL = 30.0
+
+# Seconds between purges of expired reader uptime history
+UPTIME_PURGE_INTERVAL = 3600.0
+
+
+def _now():
+    """Heartbeats are stored as naive UTC times, as readers.last_heartbeat always has been"""
+    return datetime.utcnow()
+
+
+class HeartbeatBuffer:
+    """Coalesces reader heartbeats in memory and writes them in batches"""
+
+    def __init__(self, flush_interval=5.0, offline_threshold=READER_OFFLINE_THRESHOLD):
+        self.flush_interval = flush_interval
+        self.offline_threshold = offline_threshold
+
+        self._pending = {}  # reader id -> newest heartbeat not yet written
+        self._last_seen = {}  # reader id -> newest heartbeat known to this process
+        self._readers = {}  # reader id -> reader status
+        self._reader_ids = {}  # reader code -> {antenna number: reader id}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.received = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, reader_id, timestamp=None):
+        """Record a heartbeat for a reader; returns False if the reader is unknown"""
+        self._ensure_started()
+        if not self._is_known(reader_id):
+            return False
+
+        timestamp = timestamp or _now()
+        with self._lock:
+            self.received += 1
+            pending = self._pending.get(reader_id)
+            if pending is not None:
+                self.coalesced += 1
+            if pending is None or timestamp > pending:
+                self._pending[reader_id] = timestamp
+            last_seen = self._last_seen.get(reader_id)
+            if last_seen is None or timestamp > last_seen:
+                self._last_seen[reader_id] = timestamp
+        return True
+
+    def record_by_code(self, reader_code, antenna_number=None, timestamp=None):
+        """
+        Record a heartbeat from an MQTT payload.
+
+        Heartbeats without an antenna number apply to every antenna of the
+        reader. Returns the ids of the readers that were updated.
+        """
+        self._ensure_started()
+        with self._lock:
+            antennas = dict(self._reader_ids.get(reader_code, {}))
+        if not antennas and self._reload_for_unknown():
+            with self._lock:
+                antennas = dict(self._reader_ids.get(reader_code, {}))
+
+        if antenna_number is not None:
+            reader_ids = [antennas[antenna_number]] if antenna_number in antennas else []
+        else:
+            reader_ids = list(antennas.values())
+
+        for reader_id in reader_ids:
+            self.record(reader_id, timestamp)
+        return reader_ids
+
+    def get_last_heartbeat(self, reader_id):
+        """Get the newest heartbeat known for a reader, or None"""
+        self._ensure_started()
+        with self._lock:
+            return self._last_seen.get(reader_id)
+
+    def is_online(self, reader_id, status=None):
+        """Check whether an active reader has sent a heartbeat recently"""
+        self._ensure_started()
+        with self._lock:
+            last_heartbeat = self._last_seen.get(reader_id)
+            status = status or self._readers.get(reader_id)
+
+        if status != 'Active' or last_heartbeat is None:
+            return False
+        return _now() - last_heartbeat <= self.offline_threshold
+
+    def apply_state(self, readers):
+        """Overlay the newest known heartbeat and online state on reader rows"""
+        for reader in readers:
+            last_heartbeat = self.get_last_heartbeat(reader['id'])
+            if last_heartbeat and (not reader['last_heartbeat'] or last_heartbeat > reader['last_heartbeat']):
+                reader['last_heartbeat'] = last_heartbeat
+            reader['online'] = self.is_online(reader['id'], reader['status'])
+        return readers
+
+    def flush(self):
+        """Write pending heartbeats with one multi-row UPDATE"""
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+
+        if not batch:
+            return 0
+
+        try:
+            DBService().flush_reader_heartbeats(batch)
+        except Exception as e:
+            # Put the batch back so the next flush retries it
+            with self._lock:
+                for reader_id, timestamp in batch.items():
+                    pending = self._pending.get(reader_id)
+                    if pending is None or timestamp > pending:
+                        self._pending[reader_id] = timestamp
+            print(f"Error flushing reader heartbeats: {e}")
+            return 0
+
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(batch)
+        return len(batch)
+
+    def refresh(self):
+        """Reload every reader's status and last heartbeat from the database"""
+        rows = DBService().get_reader_heartbeats()
+
+        with self._lock:
+            self._readers = {}
+            self._reader_ids = {}
+            for row in rows:
+                self._readers[row['id']] = row['status']
+                self._reader_ids.setdefault(row['reader_code'], {})[row['antenna_number']] = row['id']
+
+                last_heartbeat = row['last_heartbeat']
+                known = self._last_seen.get(row['id'])
+                if last_heartbeat is not None and (known is None or last_heartbeat > known):
+                    self._last_seen[row['id']] = last_heartbeat
+
+            # Forget readers that were deleted
+            for reader_id in list(self._last_seen):
+                if reader_id not in self._readers:
+                    del self._last_seen[reader_id]
+            self._loaded_at = time.monotonic()
+
+    def get_stats(self):
+        """Get ingestion statistics for this process"""
+        with self._lock:
+            return {
+                'received': self.received,
+                'coalesced': self.coalesced,
+                'pending': len(self._pending),
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'readers': len(self._readers)
+            }
+
+    def _is_known(self, reader_id):
+        """Check a reader id against the cached reader list"""
+        with self._lock:
+            if reader_id in self._readers:
+                return True
+        if self._reload_for_unknown():
+            with self._lock:
+                return reader_id in self._readers
+        return False
+
+    def _reload_for_unknown(self):
+        """Reload the reader list for an unknown reader, at most every so often"""
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < UNKNOWN_READER_RELOAD_INTERVAL:
+                return False
+        try:
+            self.refresh()
+            return True
+        except Exception as e:
+            print(f"Error loading readers for heartbeats: {e}")
+            return False
+
+    def _ensure_started(self):
+        """Load the reader list and start the flush thread on first use"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='heartbeat-flush', daemon=True)
+            self._thread.start()
+
+        if self._loaded_at is None:
+            self._reload_for_unknown()
+
+    def _run(self):
+        """Flush pending heartbeats and refresh reader state periodically"""
+        last_purge = None
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing reader heartbeats: {e}")
+
+            if last_purge is None or time.monotonic() - last_purge >= UPTIME_PURGE_INTERVAL:
+                last_purge = time.monotonic()
+                try:
+                    DBService().purge_reader_uptime_intervals(_now() - READER_UPTIME_RETENTION)
+                except Exception as e:
+                    print(f"Error purging reader uptime history: {e}")
+
+
+# Shared by every request handled by this process
+heartbeats = HeartbeatBuffer(flush_interval=HEARTBEAT_FLUSH_INTERVAL)
+
+# Write out heartbeats still buffered when the process exits
+atexit.register(heartbeats.flush)
@@ -0,0 +1,416 @@
+"""
+Durable write-ahead spool for MQTT ingest.
+
+Decoded tag reads are appended to segment files before the MQTT message is
+acknowledged, so a read is never lost once the broker has handed it over,
+even while MySQL is failing over or the pool is exhausted.
+
+Records are framed as a 4 byte length, a 4 byte CRC32 and a JSON payload.
+Appends are buffered and fsynced together every fsync_interval seconds
+(group commit); the on_durable callback of each record (the MQTT PUBACK)
+runs only after the fsync that covers it. A replayer thread reads durable
+records from the checkpoint onwards and writes them to the database in
+batches. After each successful batch the checkpoint is advanced and
+segments that have been fully replayed are deleted.
+
+A record with a bad CRC or a truncated tail (a torn write before a crash)
+ends the readable part of its segment; replay continues with the next one.
+A record that is intact but isn't a valid tag read (see decode_read) is
+moved to the quarantine file instead of being retried forever, so it
+can't hold up the reads behind it.
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import struct
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+try:
+    from pycube_mdm.config.app_config import (
+        INGEST_SPOOL_DIR, INGEST_SPOOL_SEGMENT_SIZE, INGEST_SPOOL_FSYNC_INTERVAL, INGEST_SPOOL_BATCH_SIZE
+    )
+except ImportError:
+    try:
+        from ..config.app_config import (
+            INGEST_SPOOL_DIR, INGEST_SPOOL_SEGMENT_SIZE, INGEST_SPOOL_FSYNC_INTERVAL, INGEST_SPOOL_BATCH_SIZE
+        )
+    except ImportError:
+        from config.app_config import (
+            INGEST_SPOOL_DIR, INGEST_SPOOL_SEGMENT_SIZE, INGEST_SPOOL_FSYNC_INTERVAL, INGEST_SPOOL_BATCH_SIZE
+        )
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>II')  # payload length, CRC32 of the payload
+SEGMENT_PREFIX = 'spool-'
+SEGMENT_SUFFIX = '.log'
+CHECKPOINT_FILE = 'checkpoint.json'
+SPOOL_ID_FILE = 'spool.id'
+QUARANTINE_FILE = 'quarantine.jsonl'
+
+READ_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Longest wait in seconds between replay attempts while the database is down
+REPLAY_MAX_DELAY = 30
+
+# Seconds of history used for the replay rate
+RATE_WINDOW = 60
+
+
+def decode_read(record):
+    """
+    Check a spooled tag read and return it with an int antenna number.
+
+    Raises ValueError if a field is missing or can't be used.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not a JSON object")
+    for field in ('reader_code', 'rfid_tag', 'received_at'):
+        if not isinstance(record.get(field), str) or not record[field]:
+            raise ValueError(f"missing or invalid {field}")
+    try:
+        antenna_number = int(record.get('antenna_number'))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid antenna_number {record.get('antenna_number')!r}")
+    datetime.strptime(record['received_at'], READ_TIME_FORMAT)
+    return dict(record, antenna_number=antenna_number)
+
+
+class IngestSpool:
+    """Append-only segment files with CRC-checked records and batched fsync"""
+
+    def __init__(self, directory=INGEST_SPOOL_DIR, segment_size=INGEST_SPOOL_SEGMENT_SIZE,
+                 fsync_interval=INGEST_SPOOL_FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self.spool_id = self._load_spool_id()
+        self._lock = threading.Lock()
+        self._durable = threading.Condition(self._lock)
+        self._callbacks = []  # on_durable callbacks waiting for the next fsync
+        self._dirty = False
+
+        self.checkpoint = self._load_checkpoint()
+        segments = self._segments()
+        # Always start a fresh segment, so appends never follow a torn tail
+        self._segment = max(segments[-1] + 1 if segments else 1, self.checkpoint[0])
+        self._file = open(self._segment_path(self._segment), 'ab')
+        self._offset = self._file.tell()
+        self.durable_position = (self._segment, self._offset)
+        self._fsync_directory()
+
+        self.appended = 0
+        self.replayed = 0
+        self._corrupt = set()  # (segment, offset) of corrupt records seen
+        self._quarantined = set()  # ids of records moved to the quarantine file
+        self._backlog = self._count_backlog()
+
+        self._thread = threading.Thread(target=self._sync_loop, name='spool-fsync', daemon=True)
+        self._thread.start()
+
+    def append(self, record, on_durable=None):
+        """Append a record; on_durable is called once it has been fsynced"""
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        frame = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            if self._offset >= self.segment_size:
+                self._roll_segment()
+            self._file.write(frame)
+            self._offset += len(frame)
+            self._dirty = True
+            self.appended += 1
+            self._backlog += 1
+            if on_durable:
+                self._callbacks.append(on_durable)
+
+    def read(self, position, limit):
+        """
+        Read up to limit durable records starting at position.
+
+        Returns (records, next position), where records is a list of
+        (record id, record). Record ids are stable across restarts, so they
+        can be used for idempotent writes. The next position can move past
+        a corrupt tail even when no records were read.
+        """
+        records = []
+        segment, offset = position
+        durable_segment, durable_offset = self.durable_position
+
+        while len(records) < limit and segment <= durable_segment:
+            end = durable_offset if segment == durable_segment else None
+            path = self._segment_path(segment)
+            if not os.path.exists(path):
+                segment, offset = segment + 1, 0
+                continue
+
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                while len(records) < limit and (end is None or offset < end):
+                    header = f.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        break
+                    length, crc = HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        # Torn or corrupt write: nothing after it in this segment can be trusted
+                        if (segment, offset) not in self._corrupt:
+                            self._corrupt.add((segment, offset))
+                            logger.error(f"Corrupt spool record in segment {segment} at offset {offset}, skipping rest of segment")
+                        offset = os.path.getsize(path)
+                        break
+                    try:
+                        record = json.loads(payload)
+                    except ValueError:
+                        record = payload.decode('utf-8', 'replace')  # quarantined by the replayer
+                    records.append((f"{self.spool_id}/{segment}/{offset}", record))
+                    offset += HEADER.size + length
+
+            if len(records) >= limit or segment == durable_segment:
+                break
+            segment, offset = segment + 1, 0
+
+        return records, (segment, offset)
+
+    def commit(self, position, count):
+        """Record that everything before position has been replayed"""
+        self._write_checkpoint(position)
+        with self._lock:
+            self.checkpoint = position
+            self.replayed += count
+            self._backlog = max(self._backlog - count, 0)
+
+        # Fully replayed segments are no longer needed
+        for segment in self._segments():
+            if segment < position[0]:
+                try:
+                    os.remove(self._segment_path(segment))
+                except OSError as e:
+                    logger.warning(f"Could not remove spool segment {segment}: {e}")
+
+    def quarantine(self, record_id, record, reason):
+        """Append a record that can't be replayed to the quarantine file, once"""
+        with self._lock:
+            if record_id in self._quarantined:
+                return
+            self._quarantined.add(record_id)
+        logger.error(f"Quarantining spool record {record_id}: {reason}")
+        line = json.dumps({'id': record_id, 'reason': reason, 'record': record}, default=str)
+        with open(os.path.join(self.directory, QUARANTINE_FILE), 'a') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def wait_for_records(self, position, timeout):
+        """Wait until there are durable records after position"""
+        with self._durable:
+            if self.durable_position == position:
+                self._durable.wait(timeout)
+
+    def get_stats(self):
+        """Get spool size and counters"""
+        with self._lock:
+            segments = self._segments()
+            size = sum(os.path.getsize(self._segment_path(segment)) for segment in segments)
+            return {
+                'segments': len(segments),
+                'bytes': size,
+                'backlog': self._backlog,
+                'appended': self.appended,
+                'replayed': self.replayed,
+                'corrupt_records': len(self._corrupt),
+                'quarantined': len(self._quarantined)
+            }
+
+    def close(self):
+        """Flush, fsync and close the current segment"""
+        self._sync()
+        with self._lock:
+            self._file.close()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            try:
+                self._sync()
+            except Exception as e:
+                logger.error(f"Error syncing ingest spool: {e}", exc_info=True)
+
+    def _sync(self):
+        """fsync pending appends and run their callbacks"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            callbacks, self._callbacks = self._callbacks, []
+            self.durable_position = (self._segment, self._offset)
+            self._durable.notify_all()
+
+        # Outside the lock: acknowledging talks to the network
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in spool durability callback: {e}")
+
+    def _roll_segment(self):
+        """Close the full segment and start the next one (lock held)"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.durable_position = (self._segment, self._offset)
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), 'ab')
+        self._offset = 0
+        self._fsync_directory()
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(segments)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _load_spool_id(self):
+        """A random id per spool directory, so record ids never repeat if it is recreated"""
+        path = os.path.join(self.directory, SPOOL_ID_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read().strip()
+        spool_id = uuid.uuid4().hex
+        self._write_atomic(path, spool_id)
+        return spool_id
+
+    def _load_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            segments = self._segments()
+            return (segments[0] if segments else 1, 0)
+        with open(path) as f:
+            data = json.load(f)
+        return (data['segment'], data['offset'])
+
+    def _write_checkpoint(self, position):
+        self._write_atomic(
+            os.path.join(self.directory, CHECKPOINT_FILE),
+            json.dumps({'segment': position[0], 'offset': position[1]})
+        )
+
+    def _write_atomic(self, path, content):
+        """Write a small file so that it is either fully old or fully new after a crash"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self._fsync_directory()
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _count_backlog(self):
+        """Count records not yet replayed (on startup)"""
+        count = 0
+        position = self.checkpoint
+        while True:
+            records, next_position = self.read(position, 10000)
+            count += len(records)
+            if next_position == position:
+                return count
+            position = next_position
+
+
+class SpoolReplayer:
+    """Drains the spool into the database in batches, in order"""
+
+    def __init__(self, spool, apply_batch, batch_size=INGEST_SPOOL_BATCH_SIZE):
+        self.spool = spool
+        self.apply_batch = apply_batch  # called with a list of reads; raises on failure
+        self.batch_size = batch_size
+        self.healthy = True
+        self.failures = 0
+        self.last_error = None
+        self._history = deque()  # (time, records replayed) for the replay rate
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='spool-replayer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def replay_once(self):
+        """Replay one batch; returns the number of spooled records consumed"""
+        position = self.spool.checkpoint
+        records, next_position = self.spool.read(position, self.batch_size)
+        reads = []
+        for record_id, record in records:
+            try:
+                reads.append(dict(decode_read(record), id=record_id))
+            except ValueError as e:
+                self.spool.quarantine(record_id, record, str(e))
+        if reads:
+            self.apply_batch(reads)
+        if next_position != position:
+            self.spool.commit(next_position, len(records))
+
+        now = time.monotonic()
+        self._history.append((now, len(records)))
+        while self._history and now - self._history[0][0] > RATE_WINDOW:
+            self._history.popleft()
+        return len(records)
+
+    def get_stats(self):
+        """Spool statistics plus replay health and rate"""
+        now = time.monotonic()
+        recent = sum(count for at, count in self._history if now - at <= RATE_WINDOW)
+        return dict(
+            self.spool.get_stats(),
+            healthy=self.healthy,
+            failures=self.failures,
+            last_error=self.last_error,
+            replay_rate=round(recent / RATE_WINDOW, 1)
+        )
+
+    def _run(self):
+        delay = 0
+        while not self._stop.is_set():
+            try:
+                replayed = self.replay_once()
+            except Exception as e:
+                self.healthy = False
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(max(delay * 2, 1), REPLAY_MAX_DELAY)
+                logger.warning(f"Spool replay failed, retrying in {delay}s ({self.spool.get_stats()['backlog']} reads spooled): {e}")
+                self._stop.wait(delay)
+                continue
+
+            if not self.healthy:
+                logger.info("Spool replay recovered")
+            self.healthy = True
+            delay = 0
+            if replayed < self.batch_size:
+                self.spool.wait_for_records(self.spool.checkpoint, timeout=1.0)
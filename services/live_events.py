@@ -0,0 +1,259 @@
+"""
+Live alert broadcaster for Server-Sent Events.
+
+Every worker process runs at most one background thread that tails new
+rfid_alerts rows by their monotonic seq column and fans the resulting events
+out to all subscribed browsers. N open dashboards therefore cost one small
+indexed query per poll interval instead of N full statistics queries.
+
+Three kinds of events are published:
+- alert: a new rfid_alerts row
+- device_status: a device changed status (derived from the alert)
+- stats: dashboard counter deltas for a batch of alerts
+
+Only the stats event that ends a batch carries an SSE id, so a browser
+that disconnects part way through a batch reconnects with the id of the
+last complete one and is sent the whole batch again, stats included.
+
+An event stream holds its request open indefinitely, so streams are only
+served by gevent workers (live_events_available). A sync worker would be
+tied up by each open page and restarted by the gunicorn timeout.
+"""
+import queue
+import threading
+import time
+from datetime import datetime, date
+
+from .db_service import DBService
+from .db_pool import is_cooperative
+
+try:
+    from pycube_mdm.config.app_config import (
+        LIVE_EVENTS_POLL_INTERVAL, LIVE_EVENTS_KEEPALIVE, LIVE_EVENTS_QUEUE_SIZE,
+        LIVE_EVENTS_REPLAY_LIMIT
+    )
+except ImportError:
+    try:
+        from ..config.app_config import (
+            LIVE_EVENTS_POLL_INTERVAL, LIVE_EVENTS_KEEPALIVE, LIVE_EVENTS_QUEUE_SIZE,
+            LIVE_EVENTS_REPLAY_LIMIT
+        )
+    except ImportError:
+        from config.app_config import (
+            LIVE_EVENTS_POLL_INTERVAL, LIVE_EVENTS_KEEPALIVE, LIVE_EVENTS_QUEUE_SIZE,
+            LIVE_EVENTS_REPLAY_LIMIT
+        )
+
+# Rows read per poll
+POLL_BATCH_SIZE = 500
+
+# Seconds to wait for an uncommitted lower seq before assuming it was rolled back
+GAP_TIMEOUT = 5.0
+
+
+class Subscription:
+    """A single browser's queue of pending events"""
+
+    def __init__(self, max_size):
+        self.events = queue.Queue(maxsize=max_size)
+        self.closed = False
+
+    def get(self, timeout):
+        """Wait for the next event, returning None on timeout"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LiveEventBroadcaster:
+    """Tails new RFID alerts once per process and fans them out to subscribers"""
+
+    def __init__(self, poll_interval=1.0, keepalive=15, queue_size=1000):
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive  # Seconds between keepalives on idle streams
+        self.queue_size = queue_size
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # Every seq <= _cursor has been published. AUTO_INCREMENT values are
+        # handed out at insert time but become visible at commit time, so a
+        # lower seq can appear after a higher one; _seen holds published seqs
+        # above the cursor while we wait for the gap to fill.
+        self._cursor = None
+        self._seen = set()
+        self._gap_started = None
+
+    def subscribe(self):
+        """Register a new subscriber and start the poller if needed"""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='live-events', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscriber"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.closed = True
+
+    def subscriber_count(self):
+        """Get the number of connected subscribers in this process"""
+        with self._lock:
+            return len(self._subscribers)
+
+    def replay(self, last_seq, limit=LIVE_EVENTS_REPLAY_LIMIT):
+        """
+        Build the events a reconnecting browser missed since last_seq.
+
+        Returns (events, complete). If more than limit alerts were missed,
+        complete is False and the browser should reload instead.
+        """
+        rows = DBService().get_alerts_after(last_seq, limit=limit + 1)
+        complete = len(rows) <= limit
+        return build_events(rows[:limit]), complete
+
+    def _run(self):
+        """Poll for new alerts while anyone is subscribed"""
+        while True:
+            time.sleep(self.poll_interval)
+
+            if not self.subscriber_count():
+                # Start from the newest alert again when someone subscribes
+                self._cursor = None
+                self._seen.clear()
+                self._gap_started = None
+                continue
+
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"Error polling for live events: {e}")
+
+    def _poll(self):
+        """Read alerts above the cursor and publish the unseen ones"""
+        db_service = DBService()
+
+        if self._cursor is None:
+            self._cursor = db_service.get_latest_alert_seq()
+            return
+
+        rows = db_service.get_alerts_after(self._cursor, limit=POLL_BATCH_SIZE)
+        new_rows = [row for row in rows if row['seq'] not in self._seen]
+        for row in new_rows:
+            self._seen.add(row['seq'])
+
+        self._advance_cursor()
+
+        if new_rows:
+            self._publish(build_events(new_rows))
+
+    def _advance_cursor(self):
+        """Move the cursor past every contiguous published seq"""
+        while self._seen:
+            next_seq = self._cursor + 1
+            if next_seq in self._seen:
+                self._seen.discard(next_seq)
+                self._cursor = next_seq
+                self._gap_started = None
+                continue
+
+            now = time.monotonic()
+            if self._gap_started is None:
+                self._gap_started = now
+                break
+            if now - self._gap_started < GAP_TIMEOUT:
+                break
+
+            # The missing seqs were rolled back (or never committed)
+            self._cursor = min(self._seen) - 1
+            self._gap_started = None
+
+    def _publish(self, events):
+        """Queue events for every subscriber, dropping ones that fell behind"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            try:
+                for event in events:
+                    subscription.events.put_nowait(event)
+            except queue.Full:
+                # A stalled browser reconnects and replays from its last event id
+                self.unsubscribe(subscription)
+
+
+def live_events_available():
+    """True if this worker can serve event streams: a gevent worker with rfid_alerts.seq in place"""
+    if not is_cooperative():
+        return False
+    try:
+        return DBService().has_alert_seq()
+    except Exception as e:
+        print(f"Error checking for rfid_alerts.seq: {e}")
+        return False
+
+
+def build_events(rows):
+    """
+    Turn alert rows into (seq, event type, data, event id) tuples.
+
+    A stats event with counter deltas for the whole batch is appended last,
+    tagged with the batch's highest seq. It is the only event with an event
+    id; the alert and device_status events before it have None.
+    """
+    events = []
+    status_deltas = {}
+    movements = 0
+
+    for row in rows:
+        alert = {key: _serialize(value) for key, value in row.items()}
+        events.append((row['seq'], 'alert', alert, None))
+
+        status = row['alert_status']
+        previous_status = row['previous_status']
+        if status != previous_status:
+            events.append((row['seq'], 'device_status', {
+                'device_id': row['device_id'],
+                'status': status,
+                'previous_status': previous_status,
+                'timestamp': alert['timestamp']
+            }, None))
+            if previous_status:
+                status_deltas[previous_status] = status_deltas.get(previous_status, 0) - 1
+            if status:
+                status_deltas[status] = status_deltas.get(status, 0) + 1
+
+        # Reader-generated alerts are recorded together with a reader event
+        if row['reader_id']:
+            movements += 1
+
+    if rows:
+        last_seq = rows[-1]['seq']
+        events.append((last_seq, 'stats', {
+            'status_counts': {status: delta for status, delta in status_deltas.items() if delta},
+            'recent_alerts': len(rows),
+            'daily_movements': movements
+        }, last_seq))
+
+    return events
+
+
+def _serialize(value):
+    """Make a column value JSON friendly"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+# Shared by every request handled by this process
+broadcaster = LiveEventBroadcaster(
+    poll_interval=LIVE_EVENTS_POLL_INTERVAL,
+    keepalive=LIVE_EVENTS_KEEPALIVE,
+    queue_size=LIVE_EVENTS_QUEUE_SIZE
+)
@@ -0,0 +1,144 @@
+"""
+Shared query-result cache for DBService.
+
+Each worker process keeps its own in-memory LRU of query results. Every entry
+is tagged with the tables the query read and the version of those tables at
+the time it was loaded. Writes bump a per-table version in the table_versions
+table, so a write made by any gunicorn worker (or the MQTT ingest process)
+invalidates the matching entries in every other worker the next time they
+refresh their view of the versions. No external cache server is needed.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+class QueryCache:
+    """In-process LRU of query results invalidated by table versions"""
+
+    def __init__(self, max_entries=512, version_ttl=2.0, enabled=True):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl  # Seconds between table version refreshes
+        self.enabled = enabled
+
+        self._entries = OrderedDict()  # key -> (version tag, result)
+        self._versions = {}  # table name -> version number
+        self._versions_loaded_at = 0.0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.bypassed = 0
+
+    def get_or_load(self, key, tables, load_versions, load_result):
+        """Return a cached result for key, running load_result() on a miss"""
+        if not self.enabled:
+            return load_result()
+
+        try:
+            versions = self._current_versions(load_versions)
+        except Exception as e:
+            # Without versions we can't tell whether an entry is fresh
+            print(f"Error loading table versions, bypassing query cache: {e}")
+            with self._lock:
+                self.bypassed += 1
+            return load_result()
+
+        tag = tuple(versions.get(table, 0) for table in tables)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == tag:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return _copy_result(entry[1])
+                # Entry was loaded before a write to one of its tables
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+
+        # The tag is taken before running the query, so a write that lands
+        # while the query runs leaves this entry tagged with the old version
+        result = load_result()
+
+        with self._lock:
+            self._entries[key] = (tag, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return _copy_result(result)
+
+    def invalidate(self):
+        """Force a table version refresh on the next lookup"""
+        with self._lock:
+            self._versions_loaded_at = 0.0
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._versions_loaded_at = 0.0
+
+    def get_stats(self):
+        """Get hit/miss statistics for this worker's cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'bypassed': self.bypassed,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                'table_versions': dict(self._versions)
+            }
+
+    def _current_versions(self, load_versions):
+        """Get table versions, reloading them from the database when expired"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._versions_loaded_at < self.version_ttl:
+                return self._versions
+
+        versions = load_versions()
+
+        with self._lock:
+            self._versions = versions
+            self._versions_loaded_at = now
+        return versions
+
+
+def cached_query(*tables):
+    """Decorator to cache a DBService read method, tagged with the tables it reads"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return method(self, *args, **kwargs)
+
+            return self.query_cache.get_or_load(
+                key,
+                tables,
+                self.get_table_versions,
+                lambda: method(self, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
+def _copy_result(result):
+    """Copy rows so callers can modify results without corrupting the cache"""
+    if isinstance(result, list):
+        return [dict(row) if isinstance(row, dict) else row for row in result]
+    if isinstance(result, dict):
+        return dict(result)
+    return result
@@ -0,0 +1,113 @@
+"""
+Lightweight result rows for hot reads.
+
+A dictionary cursor builds a dict per row, repeating every column name.
+Here rows stay the tuples the connector returns, wrapped in a Record that
+looks columns up in a name -> position index shared by every row with the
+same columns. Index classes are built once per column list and cached, so
+a query pays for them only the first time it runs in a process.
+
+Records support the access the routes and templates use on dict rows:
+row['name'], row.get('name'), row.name (Jinja tries attributes first),
+'name' in row, keys()/items(), dict(row) and assignment of new or changed
+keys, which are kept in a small per-row dict only when needed.
+"""
+from collections.abc import Mapping
+
+# Column tuple -> Record subclass with that column index
+_record_types = {}
+
+
+class Record(Mapping):
+    """A result row backed by a tuple, readable like a dict"""
+
+    __slots__ = ('_values', '_extra')
+
+    # Set on the per-query subclasses built by record_type
+    _columns = ()
+    _index = {}
+
+    def __init__(self, values):
+        self._values = values
+        self._extra = None  # keys assigned after the row was read
+
+    def __getitem__(self, key):
+        extra = self._extra
+        if extra is not None and key in extra:
+            return extra[key]
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __getattr__(self, name):
+        # Only called when normal attribute lookup fails, i.e. for columns
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, key):
+        return key in self._index or (self._extra is not None and key in self._extra)
+
+    def __iter__(self):
+        yield from self._columns
+        if self._extra:
+            for key in self._extra:
+                if key not in self._index:
+                    yield key
+
+    def __len__(self):
+        return len(self._columns) + sum(1 for key in self._extra or () if key not in self._index)
+
+    def get(self, key, default=None):
+        extra = self._extra
+        if extra is not None and key in extra:
+            return extra[key]
+        position = self._index.get(key)
+        return default if position is None else self._values[position]
+
+    def to_dict(self):
+        """A plain dict copy, e.g. for JSON serialization"""
+        values = self._values
+        data = {column: values[position] for column, position in self._index.items()}
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __repr__(self):
+        return f"Record({self.to_dict()!r})"
+
+
+def record_type(columns):
+    """Get the Record class for a column list, building it on first use"""
+    columns = tuple(columns)
+    cls = _record_types.get(columns)
+    if cls is None:
+        index = {}
+        for position, column in enumerate(columns):
+            # Like a dict cursor, a repeated column name keeps the last value
+            index[column] = position
+        cls = type('Record', (Record,), {'__slots__': (), '_columns': tuple(index), '_index': index})
+        _record_types[columns] = cls
+    return cls
+
+
+def fetch_records(cursor):
+    """Fetch all rows of a plain (tuple) cursor as Records"""
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+    cls = record_type(cursor.column_names)
+    return [cls(row) for row in rows]
+
+
+def fetch_record(cursor):
+    """Fetch one row of a plain (tuple) cursor as a Record, or None"""
+    row = cursor.fetchone()
+    return record_type(cursor.column_names)(row) if row is not None else None
@@ -0,0 +1,283 @@
+"""
+Device utilization over device_assignments.
+
+Assignment intervals for a hospital are loaded in one query and cut into
+calendar days. For each day:
+
+- each device's intervals are merged, so overlapping assignments of one
+  device are not counted twice
+- a sweep line over the merged intervals gives the peak number of devices
+  in use at once, per model and for the hospital
+- department figures (from the assigned nurse) use the same merge and sweep
+  within each department
+
+Completed days are cached in device_utilization_daily, so a report only
+computes the days it has not seen before, plus today. A report over a
+range adds up the daily rows; peaks are the largest daily peak.
+Availability (how long a device could have been assigned) comes from the
+devices table when the report is built.
+
+Assignments are written with the current time, so completed days do not
+change afterwards. Imported or backfilled assignments need a refresh.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from .db_service import DBService
+
+try:
+    from pycube_mdm.config.app_config import get_current_est_time
+except ImportError:
+    try:
+        from ..config.app_config import get_current_est_time
+    except ImportError:
+        from config.app_config import get_current_est_time
+
+# scope_key used for assignments without a model or department
+UNKNOWN = ''
+
+
+def utilization_report(hospital_id, start, end, db_service=None, refresh=False):
+    """
+    Build the utilization report for a hospital over [start, end).
+
+    start and end are midnight datetimes. Days not cached yet are computed
+    and cached; today is computed but not cached. refresh drops the cached
+    days of the range first.
+    """
+    db_service = db_service or DBService()
+    now = get_current_est_time().replace(tzinfo=None)
+    end = min(end, now)
+    days = _days(start, end)
+
+    if refresh and days:
+        db_service.delete_utilization_days(hospital_id, days[0], days[-1] + timedelta(days=1))
+
+    rows = []
+    computed_days = 0
+    if days:
+        rows = db_service.get_utilization_days(hospital_id, days[0], days[-1] + timedelta(days=1))
+        cached_days = {row['day'] for row in rows if row['scope'] == 'hospital'}
+        missing = [day for day in days if day not in cached_days]
+        if missing:
+            load_start = _midnight(missing[0])
+            load_end = min(_midnight(missing[-1] + timedelta(days=1)), now)
+            intervals = db_service.get_assignment_intervals(hospital_id, load_start, load_end)
+            new_rows = compute_daily_rows(intervals, missing, now)
+            db_service.save_utilization_days(
+                hospital_id, [row for row in new_rows if _midnight(row['day'] + timedelta(days=1)) <= now]
+            )
+            rows = [row for row in rows if row['day'] not in set(missing)] + new_rows
+            computed_days = len(missing)
+
+    devices = db_service.get_utilization_devices(hospital_id)
+    report = aggregate(rows, devices, start, end)
+    report.update({
+        'hospital_id': hospital_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': len(days),
+        'computed_days': computed_days
+    })
+    return report
+
+
+def compute_daily_rows(intervals, days, now):
+    """
+    Cut assignment intervals into the given days and total each day.
+
+    intervals are (device_id, model, department, assigned_at, ended_at)
+    with ended_at None for active assignments. Returns one row per day and
+    scope key, and a hospital row for every day (even an empty one) that
+    marks the day as computed.
+    """
+    wanted = set(days)
+    pieces = defaultdict(list)  # day -> [(device, model, department, start, end, started that day)]
+    for device_id, model, department, assigned_at, ended_at in intervals:
+        ended_at = min(ended_at or now, now)
+        day = max(assigned_at.date(), days[0])
+        while day <= ended_at.date() and day <= days[-1]:
+            if day in wanted:
+                day_start, day_end = _midnight(day), _midnight(day + timedelta(days=1))
+                piece_start, piece_end = max(assigned_at, day_start), min(ended_at, day_end)
+                if piece_end > piece_start:
+                    pieces[day].append((device_id, model or UNKNOWN, department or UNKNOWN,
+                                        piece_start, piece_end, assigned_at >= day_start))
+            day += timedelta(days=1)
+
+    rows = []
+    for day in days:
+        rows.extend(_day_rows(day, pieces.get(day, [])))
+    return rows
+
+
+def _day_rows(day, pieces):
+    """Totals for one day's assignment pieces"""
+    by_device = defaultdict(list)
+    by_department = defaultdict(lambda: defaultdict(list))
+    models = {}
+    device_starts = defaultdict(int)
+    department_starts = defaultdict(int)
+    for device_id, model, department, start, end, started in pieces:
+        by_device[device_id].append((start, end))
+        by_department[department][device_id].append((start, end))
+        models[device_id] = model
+        if started:
+            device_starts[device_id] += 1
+            department_starts[department] += 1
+
+    rows = []
+    merged = {device_id: merge_intervals(spans) for device_id, spans in by_device.items()}
+    by_model = defaultdict(list)
+    for device_id, spans in merged.items():
+        by_model[models[device_id]].extend(spans)
+        rows.append(_row(day, 'device', device_id, _seconds(spans), device_starts[device_id], 1))
+
+    for model, spans in by_model.items():
+        model_starts = sum(count for device_id, count in device_starts.items() if models[device_id] == model)
+        rows.append(_row(day, 'model', model, _seconds(spans), model_starts, peak_concurrency(spans)))
+
+    for department, devices in by_department.items():
+        spans = [span for device_spans in devices.values() for span in merge_intervals(device_spans)]
+        rows.append(_row(day, 'department', department, _seconds(spans), department_starts[department],
+                         peak_concurrency(spans)))
+
+    all_spans = [span for spans in merged.values() for span in spans]
+    rows.append(_row(day, 'hospital', '', _seconds(all_spans), sum(device_starts.values()),
+                     peak_concurrency(all_spans)))
+    return rows
+
+
+def merge_intervals(spans):
+    """Union of (start, end) intervals, as sorted non-overlapping intervals"""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def peak_concurrency(spans):
+    """Largest number of intervals open at the same moment (sweep line)"""
+    events = [(start, 1) for start, _ in spans] + [(end, -1) for _, end in spans]
+    # At equal times ends sort first, so back-to-back intervals do not overlap
+    events.sort()
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def aggregate(rows, devices, start, end):
+    """Add up daily rows over the range and compare with the time devices were available"""
+    assigned = defaultdict(int)
+    assignments = defaultdict(int)
+    peaks = defaultdict(int)
+    for row in rows:
+        key = (row['scope'], row['scope_key'])
+        assigned[key] += row['assigned_seconds']
+        assignments[key] += row['assignments']
+        peaks[key] = max(peaks[key], row['peak_concurrent'])
+
+    device_rows = []
+    model_available = defaultdict(int)
+    model_devices = defaultdict(int)
+    for device in devices:
+        available_from = max(device['created_at'] or start, start)
+        available = max(int((end - available_from).total_seconds()), 0)
+        model = device['model'] or UNKNOWN
+        model_available[model] += available
+        model_devices[model] += 1
+
+        key = ('device', device['id'])
+        device_rows.append(dict(
+            _figures(assigned[key], available),
+            device_id=device['id'],
+            serial_number=device['serial_number'],
+            model=device['model'],
+            assignments=assignments[key]
+        ))
+    # Least used first: these are the devices sitting in drawers
+    device_rows.sort(key=lambda row: (row['utilization'] if row['utilization'] is not None else 0, row['serial_number'] or ''))
+
+    model_rows = []
+    for model in set(model_devices) | {key for scope, key in assigned if scope == 'model'}:
+        key = ('model', model)
+        model_rows.append(dict(
+            _figures(assigned[key], model_available[model]),
+            model=model or None,
+            devices=model_devices[model],
+            assignments=assignments[key],
+            peak_concurrent=peaks[key]
+        ))
+    model_rows.sort(key=lambda row: row['assigned_hours'], reverse=True)
+
+    department_rows = []
+    for scope, department in assigned:
+        if scope != 'department':
+            continue
+        key = ('department', department)
+        department_rows.append({
+            'department': department or None,
+            'assigned_hours': _hours(assigned[key]),
+            'assignments': assignments[key],
+            'peak_concurrent': peaks[key]
+        })
+    department_rows.sort(key=lambda row: row['assigned_hours'], reverse=True)
+
+    key = ('hospital', '')
+    hospital = dict(
+        _figures(assigned[key], sum(model_available.values())),
+        devices=len(devices),
+        never_assigned=sum(1 for row in device_rows if row['assignments'] == 0 and row['assigned_hours'] == 0),
+        assignments=assignments[key],
+        peak_concurrent=peaks[key]
+    )
+
+    return {'hospital': hospital, 'models': model_rows, 'departments': department_rows, 'devices': device_rows}
+
+
+def _figures(assigned_seconds, available_seconds):
+    return {
+        'assigned_hours': _hours(assigned_seconds),
+        'available_hours': _hours(available_seconds),
+        'idle_hours': _hours(max(available_seconds - assigned_seconds, 0)),
+        'utilization': round(min(assigned_seconds / available_seconds, 1) * 100, 1) if available_seconds else None
+    }
+
+
+def _row(day, scope, scope_key, assigned_seconds, assignments, peak_concurrent):
+    return {
+        'day': day,
+        'scope': scope,
+        'scope_key': scope_key,
+        'assigned_seconds': assigned_seconds,
+        'assignments': assignments,
+        'peak_concurrent': peak_concurrent
+    }
+
+
+def _seconds(spans):
+    return int(sum((end - start).total_seconds() for start, end in spans))
+
+
+def _hours(seconds):
+    return round(seconds / 3600, 1)
+
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def _days(start, end):
+    """Calendar days that overlap [start, end)"""
+    days = []
+    day = start.date()
+    while _midnight(day) < end:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
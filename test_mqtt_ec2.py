@@ -9,6 +9,13 @@ from datetime import datetime, timedelta
 import mysql.connector
 import pytz
 from services.db_service import DBService
+from services.heartbeat_buffer import heartbeats
+from services.edge_gateway import EdgeGateway
+from services.ingest_spool import IngestSpool, SpoolReplayer
+from services.device_state import DeviceStateTable
+from services.alert_rules import AlertRuleEngine
+from services.records import fetch_record
+from services.db_pool import is_cooperative
 from models.rfid_alert import RFIDAlert
 import uuid
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -20,6 +27,7 @@ try:
         TIMEZONE, 
         MQTT_ENDPOINT, 
         MQTT_TOPIC, 
+        MQTT_HEARTBEAT_TOPIC,
         MQTT_PORT, 
         MQTT_KEEP_ALIVE,
         CERTS_DIR,
@@ -28,6 +36,10 @@ try:
         ROOT_CA,
         SCHEDULER_CHECK_MISSING_INTERVAL,
         SCHEDULER_LOG_STATUS_INTERVAL,
+        EDGE_MODE,
+        INGEST_SPOOL_ENABLED,
+        DEVICE_STATE_ENABLED,
+        ALERT_RULES_ENABLED,
         get_current_est_time
     )
 except ImportError:
@@ -38,6 +50,7 @@ except ImportError:
             TIMEZONE, 
             MQTT_ENDPOINT, 
             MQTT_TOPIC, 
+            MQTT_HEARTBEAT_TOPIC,
             MQTT_PORT, 
             MQTT_KEEP_ALIVE,
             CERTS_DIR,
@@ -46,6 +59,10 @@ except ImportError:
             ROOT_CA,
             SCHEDULER_CHECK_MISSING_INTERVAL,
             SCHEDULER_LOG_STATUS_INTERVAL,
+            EDGE_MODE,
+            INGEST_SPOOL_ENABLED,
+            DEVICE_STATE_ENABLED,
+            ALERT_RULES_ENABLED,
             get_current_est_time
         )
     except ImportError:
@@ -62,6 +79,7 @@ except ImportError:
         # MQTT configuration
         MQTT_ENDPOINT = "a2zl2pb12jbe1o-ats.iot.us-east-1.amazonaws.com"
         MQTT_TOPIC = "6B6035_tagdata"
+        MQTT_HEARTBEAT_TOPIC = "6B6035_mevents"
         MQTT_PORT = 8883
         MQTT_KEEP_ALIVE = 60
         
@@ -75,6 +93,18 @@ except ImportError:
         SCHEDULER_CHECK_MISSING_INTERVAL = 2  # minutes
         SCHEDULER_LOG_STATUS_INTERVAL = 30  # seconds
         
+        # Edge gateway mode
+        EDGE_MODE = False
+        
+        # Ingest spool
+        INGEST_SPOOL_ENABLED = False
+        
+        # In-memory device state
+        DEVICE_STATE_ENABLED = False
+        
+        # Alert rules
+        ALERT_RULES_ENABLED = False
+        
         def get_current_est_time():
             """Get current time in Eastern Time"""
             # Create a timezone-aware UTC time 
@@ -126,6 +156,34 @@ class MQTTClient(mqtt.Client):
         self.db_service = DBService()
         self.scheduler = None
         
+        # In edge mode reads are processed against local SQLite state and
+        # forwarded to MySQL in batches
+        self.edge = None
+        if EDGE_MODE:
+            logger.info("Starting in edge gateway mode")
+            self.edge = EdgeGateway()
+            self.edge.start()
+        
+        # Device status is decided in memory and written in batches: by the
+        # spool replayer, or write-behind when there is no spool. Each
+        # decided event is checked against the alert rules
+        self.device_states = None
+        if DEVICE_STATE_ENABLED and not EDGE_MODE:
+            self.device_states = DeviceStateTable(write_behind=not INGEST_SPOOL_ENABLED,
+                                                  rules=AlertRuleEngine() if ALERT_RULES_ENABLED else None)
+            self.device_states.start()
+        
+        # Tag reads are written to a local spool and acknowledged once they
+        # are on disk; the replayer writes them to MySQL in batches
+        self.manual_ack = kwargs.get('manual_ack', False)
+        self.spool = None
+        self.spool_replayer = None
+        if INGEST_SPOOL_ENABLED and not EDGE_MODE:
+            self.spool = IngestSpool()
+            apply_batch = self.device_states.apply_reads if self.device_states else self.db_service.ingest_reads
+            self.spool_replayer = SpoolReplayer(self.spool, apply_batch)
+            self.spool_replayer.start()
+        
         # Set clean session to False to maintain subscription state
         self.clean_session = False
         
@@ -176,6 +234,12 @@ class MQTTClient(mqtt.Client):
                 logger.info(f"SCHEDULER STATUS: Running with {len(jobs)} jobs")
                 for job in jobs:
                     logger.info(f"  JOB: {job.id}, next run at: {job.next_run_time}")
+                if self.edge:
+                    logger.info(f"EDGE STATUS: {self.edge.get_stats()}")
+                if self.spool_replayer:
+                    logger.info(f"SPOOL STATUS: {self.spool_replayer.get_stats()}")
+                if self.device_states and self.device_states.rules:
+                    logger.info(f"ALERT RULES STATUS: {self.device_states.rules.get_stats()}")
             else:
                 logger.warning("SCHEDULER STATUS: Not running - attempting to restart")
                 self._init_scheduler()
@@ -186,10 +250,12 @@ class MQTTClient(mqtt.Client):
         """Initialize database connection and tables"""
         try:
             logger.info("Initializing database connection...")
-            # Use DBService's initialize_db method if it exists
-            if hasattr(self.db_service, 'initialize_db'):
-                self.db_service.initialize_db()
-                logger.info("Database initialized successfully")
+            # Create or upgrade the tables only if schema_version is behind
+            if hasattr(self.db_service, 'ensure_schema'):
+                if self.db_service.ensure_schema():
+                    logger.info("Database initialized successfully")
+                else:
+                    logger.info("Database schema is up to date")
             else:
                 # Just test the connection
                 with self.db_service.get_connection() as conn:
@@ -221,13 +287,19 @@ class MQTTClient(mqtt.Client):
                     logger.info(f"System EST time: {system_est}")
                     
                     # Check if database has any Temporarily Out devices
-                    cursor.execute("SELECT COUNT(*) FROM devices WHERE status = 'Temporarily Out'")
+                    cursor.execute("SELECT COUNT(*) FROM device_state WHERE status = 'Temporarily Out'")
                     temp_out_count = cursor.fetchone()[0]
                     logger.info(f"Found {temp_out_count} devices with 'Temporarily Out' status in database")
                     
                     if temp_out_count > 0:
                         # Check one device as example
-                        cursor.execute("SELECT id, serial_number, status, updated_at FROM devices WHERE status = 'Temporarily Out' LIMIT 1")
+                        cursor.execute("""
+                            SELECT d.id, d.serial_number, ds.status, ds.updated_at
+                            FROM device_state ds
+                            JOIN devices d ON d.id = ds.device_id
+                            WHERE ds.status = 'Temporarily Out'
+                            LIMIT 1
+                        """)
                         device = cursor.fetchone()
                         if device:
                             device_id, serial, status, updated_at = device
@@ -245,110 +317,90 @@ class MQTTClient(mqtt.Client):
 
     def check_for_missing_devices(self):
         """Check for devices that have been temporarily out for too long and mark them as missing"""
+        if self.edge:
+            marked = self.edge.sweep_missing()
+            logger.info(f"Marked {len(marked)} devices as Missing (edge)")
+            return
+        if self.device_states:
+            marked = self.device_states.sweep_missing()
+            logger.info(f"Marked {len(marked)} devices as Missing")
+            return
+        
         try:
             logger.info("===== SCHEDULED TASK: CHECKING FOR MISSING DEVICES =====")
-            with self.db_service.get_connection() as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    # Query expanded to include the most recent reader_event for this device
-                    # Use a CTE to get the latest reader event for each temporarily out device
-                    query = """
-                        WITH latest_events AS (
-                            SELECT re.device_id, re.reader_code, re.antenna_number,
-                                   ROW_NUMBER() OVER(PARTITION BY re.device_id ORDER BY re.timestamp DESC) as rn
-                            FROM reader_events re
-                        )
-                        SELECT d.id, d.updated_at, d.serial_number, d.rfid_tag, d.location_id, d.status,
-                               le.reader_code, le.antenna_number
-                        FROM devices d
-                        LEFT JOIN latest_events le ON d.id = le.device_id AND le.rn = 1
-                        WHERE d.status = 'Temporarily Out'
-                    """
-                    cursor.execute(query)
-                    temp_out_devices = cursor.fetchall()
-                    
-                    logger.info(f"Found {len(temp_out_devices)} devices with 'Temporarily Out' status")
-                    
-                    if len(temp_out_devices) == 0:
-                        logger.info("No devices to check for missing status")
-                        logger.info("===== FINISHED CHECKING FOR MISSING DEVICES =====")
-                        return
-                    
-                    # Get current time in EST for reliable comparison
-                    current_time_est = get_current_est_time()
-                    logger.info(f"Current time (EST): {current_time_est}")
+            # Get current time in EST for reliable comparison
+            current_time_est = get_current_est_time()
+            logger.info(f"Current time (EST): {current_time_est}")
+            
+            marked_missing_count = 0
+            checked_count = 0
+            
+            # Devices are streamed, so the sweep uses the same memory for any fleet size
+            for device in self.db_service.iter_temporarily_out_devices():
+                checked_count += 1
+                # Make sure the timestamp has timezone info, assuming it's stored in EST
+                last_update = device['updated_at']
+                
+                logger.info(f"Raw last_update: {last_update} (TZ info: {last_update.tzinfo if hasattr(last_update, 'tzinfo') else 'None'})")
+                
+                # Add EST timezone info if it's missing
+                if not last_update.tzinfo:
+                    last_update_est = TIMEZONE.localize(last_update)
+                    logger.info(f"Adding EST timezone info: {last_update_est}")
+                else:
+                    last_update_est = last_update
+                
+                # Calculate time difference in seconds and minutes
+                time_diff_seconds = (current_time_est - last_update_est).total_seconds()
+                time_diff_minutes = time_diff_seconds / 60
+                
+                logger.info(f"Device {device['id']} ({device.get('serial_number', 'Unknown')})")
+                logger.info(f"  Last update: {last_update_est}")
+                logger.info(f"  Time difference: {time_diff_minutes:.1f} minutes (threshold: {MISSING_THRESHOLD.total_seconds()/60:.1f} minutes)")
+                
+                # Check if time difference is positive and exceeds the threshold
+                if time_diff_seconds > 0 and time_diff_seconds >= MISSING_THRESHOLD.total_seconds():
+                    # Store previous status for alert
+                    previous_status = device['status']
                     
-                    marked_missing_count = 0
+                    # Mark as missing
+                    result = self.db_service.update_device_status(device['id'], 'Missing')
+                    logger.info(f"  ACTION: Marking as Missing - success: {result}")
                     
-                    for device in temp_out_devices:
-                        # Make sure the timestamp has timezone info, assuming it's stored in EST
-                        last_update = device['updated_at']
-                        
-                        logger.info(f"Raw last_update: {last_update} (TZ info: {last_update.tzinfo if hasattr(last_update, 'tzinfo') else 'None'})")
-                        
-                        # Add EST timezone info if it's missing
-                        if not last_update.tzinfo:
-                            last_update_est = TIMEZONE.localize(last_update)
-                            logger.info(f"Adding EST timezone info: {last_update_est}")
-                        else:
-                            last_update_est = last_update
-                        
-                        # Calculate time difference in seconds and minutes
-                        time_diff_seconds = (current_time_est - last_update_est).total_seconds()
-                        time_diff_minutes = time_diff_seconds / 60
-                        
-                        logger.info(f"Device {device['id']} ({device.get('serial_number', 'Unknown')})")
-                        logger.info(f"  Last update: {last_update_est}")
-                        logger.info(f"  Time difference: {time_diff_minutes:.1f} minutes (threshold: {MISSING_THRESHOLD.total_seconds()/60:.1f} minutes)")
-                        
-                        # Check if time difference is positive and exceeds the threshold
-                        if time_diff_seconds > 0 and time_diff_seconds >= MISSING_THRESHOLD.total_seconds():
-                            # Store previous status for alert
-                            previous_status = device['status']
+                    if result:
+                        # Create an RFID alert for the missing device
+                        try:
+                            # Fetch device location information
+                            location_id = device['location_id']
                             
-                            # Mark as missing
-                            result = self.db_service.update_device_status(device['id'], 'Missing')
-                            logger.info(f"  ACTION: Marking as Missing - success: {result}")
+                            # Get reader code and antenna number from the latest reader event
+                            reader_code = device.get('reader_code')
+                            antenna_number = device.get('antenna_number')
                             
-                            if result:
-                                # Create an RFID alert for the missing device
-                                try:
-                                    # Fetch device location information
-                                    location_id = device['location_id']
-                                    
-                                    # Get reader code and antenna number from the latest reader event
-                                    reader_code = device.get('reader_code')
-                                    antenna_number = device.get('antenna_number')
-                                    
-                                    logger.info(f"  Last reader info - code: {reader_code}, antenna: {antenna_number}")
-                                    
-                                    # Create an alert object with reader information
-                                    alert = RFIDAlert(
-                                        device_id=device['id'],
-                                        rfid_tag=device['rfid_tag'],
-                                        location_id=location_id,
-                                        reader_code=reader_code,
-                                        antenna_number=antenna_number,
-                                        timestamp=current_time_est,
-                                        status='Missing',
-                                        previous_status=previous_status
-                                    )
-                                    
-                                    # Record the alert
-                                    self.db_service.create_alert_for_missing_device(alert)
-                                    logger.info(f"  Created missing device alert for device {device['id']} with reader code {reader_code}, antenna {antenna_number}")
-                                except Exception as e:
-                                    logger.error(f"  Error creating alert for missing device: {e}")
-                                
-                            marked_missing_count += 1
-                        elif time_diff_seconds <= 0:
-                            # Time difference is negative or zero (future or current timestamp)
-                            logger.warning(f"  WARNING: Device has a future timestamp - time diff: {time_diff_minutes:.1f} minutes")
-                            logger.warning(f"  No status change applied due to suspicious timestamp")
-                        else:
-                            # Time difference is positive but below threshold
-                            logger.info(f"  Not yet eligible for Missing status - time diff {time_diff_minutes:.1f} min < threshold {MISSING_THRESHOLD.total_seconds()/60:.1f} min")
-                    
-                    logger.info(f"Marked {marked_missing_count} of {len(temp_out_devices)} devices as Missing based on time threshold")
+                            logger.info(f"  Last reader info - code: {reader_code}, antenna: {antenna_number}")
+                            
+                            # Create an alert object with reader information (RFIDAlert.FIELDS order)
+                            alert = RFIDAlert.from_row((
+                                None, device['id'], None, None, location_id, current_time_est, None, None,
+                                reader_code, antenna_number, device['rfid_tag'], 'Missing', previous_status
+                            ))
+                            
+                            # Record the alert
+                            self.db_service.create_alert_for_missing_device(alert)
+                            logger.info(f"  Created missing device alert for device {device['id']} with reader code {reader_code}, antenna {antenna_number}")
+                        except Exception as e:
+                            logger.error(f"  Error creating alert for missing device: {e}")
+                        
+                    marked_missing_count += 1
+                elif time_diff_seconds <= 0:
+                    # Time difference is negative or zero (future or current timestamp)
+                    logger.warning(f"  WARNING: Device has a future timestamp - time diff: {time_diff_minutes:.1f} minutes")
+                    logger.warning(f"  No status change applied due to suspicious timestamp")
+                else:
+                    # Time difference is positive but below threshold
+                    logger.info(f"  Not yet eligible for Missing status - time diff {time_diff_minutes:.1f} min < threshold {MISSING_THRESHOLD.total_seconds()/60:.1f} min")
+            
+            logger.info(f"Marked {marked_missing_count} of {checked_count} 'Temporarily Out' devices as Missing based on time threshold")
             
             logger.info("===== FINISHED CHECKING FOR MISSING DEVICES =====")
         except Exception as e:
@@ -362,8 +414,8 @@ class MQTTClient(mqtt.Client):
                     # Get the current status for this device
                     query = """
                         SELECT status 
-                        FROM devices 
-                        WHERE id = %s
+                        FROM device_state 
+                        WHERE device_id = %s
                     """
                     cursor.execute(query, (device_id,))
                     result = cursor.fetchone()
@@ -395,13 +447,14 @@ class MQTTClient(mqtt.Client):
             with self.db_service.get_connection() as connection:
                 with connection.cursor() as cursor:
                     update_query = """
-                        UPDATE devices 
+                        UPDATE device_state 
                         SET status = %s,
                             updated_at = %s
-                        WHERE id = %s
+                        WHERE device_id = %s
                     """
                     cursor.execute(update_query, (new_status, get_current_est_time(), device_id))
                     connection.commit()
+                    self.db_service.defer_table_versions('devices')
                     logger.info(f"Updated device {device_id} status to {new_status}")
                     return True
         except Exception as e:
@@ -417,8 +470,8 @@ class MQTTClient(mqtt.Client):
             logger.debug(f"Properties: {properties}")
             
             # Subscribe with QoS 1
-            result, mid = self.subscribe([(MQTT_TOPIC, 1)])
-            logger.info(f"Subscribed to topic: {MQTT_TOPIC} with QoS 1, Result: {result}, Message ID: {mid}")
+            result, mid = self.subscribe([(MQTT_TOPIC, 1), (MQTT_HEARTBEAT_TOPIC, 0)])
+            logger.info(f"Subscribed to topics: {MQTT_TOPIC} (QoS 1), {MQTT_HEARTBEAT_TOPIC} (QoS 0), Result: {result}, Message ID: {mid}")
             self.connected = True
             
             # Publish a test message to verify publishing works
@@ -438,8 +491,43 @@ class MQTTClient(mqtt.Client):
             logger.error(f"Failed to connect, reason code: {reason_code}")
             self.connected = False
 
+    def on_heartbeat(self, payload):
+        """Buffer a reader heartbeat; it is written to the database in batches"""
+        try:
+            data = json.loads(payload.decode())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            logger.warning("Failed to parse heartbeat as JSON")
+            return
+        
+        msg_data = data.get('data') if isinstance(data.get('data'), dict) else {}
+        reader_code = msg_data.get('hostName') or data.get('hostName')
+        antenna_number = msg_data.get('antenna', data.get('antenna'))
+        
+        if not reader_code:
+            logger.warning("Heartbeat without a reader hostName")
+            return
+        
+        reader_ids = heartbeats.record_by_code(reader_code, antenna_number)
+        if not reader_ids:
+            logger.debug(f"Ignoring heartbeat - Reader {reader_code} not found in our database")
+
     def on_message(self, client, userdata, msg):
         """Callback when message is received"""
+        spooled = False
+        try:
+            spooled = self._handle_message(msg)
+        finally:
+            # Spooled reads are acknowledged once the spool has been fsynced
+            if self.manual_ack and not spooled:
+                self.ack(msg.mid, msg.qos)
+
+    def _handle_message(self, msg):
+        """Process a message; returns True if it was handed to the spool"""
+        # Heartbeats are frequent, so skip the per-message logging below
+        if msg.topic == MQTT_HEARTBEAT_TOPIC:
+            self.on_heartbeat(msg.payload)
+            return
+        
         try:
             self.message_count += 1
             self.last_message_time = get_current_est_time()
@@ -460,6 +548,47 @@ class MQTTClient(mqtt.Client):
                         logger.warning("Missing required fields in message")
                         return
                     
+                    # Checked before the read is spooled, so a bad value can't stall the replay
+                    try:
+                        antenna_number = int(antenna_number)
+                    except (TypeError, ValueError):
+                        logger.warning(f"Ignoring message - invalid antenna number {antenna_number!r}")
+                        return
+                    
+                    if self.edge:
+                        event = self.edge.record_tag_read(reader_code, antenna_number, rfid_tag)
+                        if event:
+                            logger.info(f"Device {event['device_id']} {event['previous_status']} -> {event['status']} (queued for forwarding)")
+                        else:
+                            logger.info(f"Ignoring message - Reader {reader_code} antenna {antenna_number} or tag {rfid_tag} not known at the edge")
+                        return
+                    
+                    # Other ingest processes handle the rest of the tags
+                    if self.device_states and not self.device_states.owns(rfid_tag):
+                        return
+                    
+                    if self.spool:
+                        try:
+                            self.spool.append({
+                                'reader_code': reader_code,
+                                'antenna_number': antenna_number,
+                                'rfid_tag': rfid_tag,
+                                'received_at': get_current_est_time().replace(tzinfo=None).strftime('%Y-%m-%d %H:%M:%S')
+                            }, on_durable=lambda: self.manual_ack and self.ack(msg.mid, msg.qos))
+                            logger.info(f"Spooled read of tag {rfid_tag} at reader {reader_code} (antenna {antenna_number})")
+                            return True
+                        except OSError as e:
+                            # Fall back to writing the read directly
+                            logger.error(f"Error writing to ingest spool: {e}")
+                    
+                    if self.device_states:
+                        event = self.device_states.record_read(reader_code, antenna_number, rfid_tag)
+                        if event:
+                            logger.info(f"Device {event['device_id']} {event['previous_status']} -> {event['status']} (queued for writing)")
+                        else:
+                            logger.info(f"Ignoring message - Reader {reader_code} antenna {antenna_number} or tag {rfid_tag} not known")
+                        return
+                    
                     # First verify this is our reader
                     try:
                         reader_query = """
@@ -470,9 +599,9 @@ class MQTTClient(mqtt.Client):
                             WHERE r.reader_code = %s AND r.antenna_number = %s
                         """
                         with self.db_service.get_connection() as connection:
-                            with connection.cursor(dictionary=True) as cursor:
+                            with connection.cursor() as cursor:
                                 cursor.execute(reader_query, (reader_code, antenna_number))
-                                reader = cursor.fetchone()
+                                reader = fetch_record(cursor)
                                 
                         if not reader:
                             logger.info(f"Ignoring message - Reader {reader_code} with antenna {antenna_number} not found in our database")
@@ -512,17 +641,11 @@ class MQTTClient(mqtt.Client):
                         
                         # Create RFID alert regardless of status change
                         try:
-                            alert = RFIDAlert(
-                                device_id=device['id'],
-                                reader_code=reader_code,
-                                antenna_number=antenna_number,
-                                rfid_tag=rfid_tag,
-                                timestamp=get_current_est_time()
-                            )
-                            
-                            # Add status information to the alert
-                            alert.status = current_status
-                            alert.previous_status = previous_status
+                            # Built from the device row and the read, in RFIDAlert.FIELDS order
+                            alert = RFIDAlert.from_row((
+                                None, device['id'], None, None, None, get_current_est_time(), None, None,
+                                reader_code, antenna_number, rfid_tag, current_status, previous_status
+                            ))
                             
                             # Record the movement (this will create both reader_event and rfid_alert)
                             logger.info(f"Creating alert with status: {alert.status}, previous status: {alert.previous_status}")
@@ -609,6 +732,11 @@ class MQTTClient(mqtt.Client):
                 logger.error(f"Error shutting down scheduler: {e}")
 
 def main():
+    # The ingest client and its scheduler use real threads and the blocking
+    # connection pool; it runs as its own process, never in a gevent worker
+    if is_cooperative():
+        raise SystemExit("test_mqtt_ec2.py must not run in a gevent monkey-patched process")
+
     # Verify certificates exist
     verify_certificates()
     
@@ -616,7 +744,8 @@ def main():
     client = MQTTClient(
         protocol=mqtt.MQTTv5,
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
-        client_id="ec2-rfid-client"  # Add a specific client ID
+        client_id="ec2-rfid-client",  # Add a specific client ID
+        manual_ack=INGEST_SPOOL_ENABLED and not EDGE_MODE  # PUBACK only after the read is spooled
     )
     
     # Configure TLS
@@ -640,6 +769,13 @@ def main():
         
     except KeyboardInterrupt:
         logger.info("Shutting down...")
+        if client.spool:
+            # fsync pending reads so their acks go out before disconnecting
+            client.spool_replayer.stop()
+            client.spool.close()
+        if client.device_states:
+            # Write the queued state changes before exiting
+            client.device_states.stop()
         client.disconnect()
     except Exception as e:
         logger.error(f"Error: {e}", exc_info=True)